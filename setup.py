@@ -16,6 +16,10 @@ setup(
     author="Nick Coutsos",
     author_email="nick@coutsos.com",
     install_requires=read_requirements("requirements.txt"),
+    extras_require={
+        "numpy": ["numpy"],
+        "uvloop": ["uvloop"],
+    },
     entry_points={
         "console_scripts": [
             "thuum = thuum.__main__:main"
@@ -0,0 +1,5 @@
+from thuum.api import (
+    Result,
+    run,
+    run_async,
+)
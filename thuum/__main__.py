@@ -1,11 +1,13 @@
 import argparse
+import base64
+import cProfile
 import functools
+import math
+import re
+import socket
 import sys
 
-from tornado import (
-    httpclient,
-    ioloop,
-)
+from tornado import ioloop
 
 def add_package_to_path():
     if not (__name__ == "__main__" and __package__ == ""):
@@ -19,11 +21,29 @@ def add_package_to_path():
 add_package_to_path()
 
 from thuum import (
+    api,
+    checks,
+    distributed,
+    engines,
+    histogram,
+    loops,
+    metrics,
+    monitor,
     reporters,
+    results,
     runners,
+    sources,
     stats,
+    validation,
+    workers,
 )
 
+REPORTERS = {
+    "csv": reporters.CSVReporter,
+    "json": reporters.JSONReporter,
+    "term": reporters.TerminalReporter,
+}
+
 class UsageError(Exception):
     def __init__(self, message, parser):
         super(UsageError, self).__init__(message)
@@ -31,17 +51,43 @@ class UsageError(Exception):
 
 class AddBody(argparse.Action):
     def __call__(self, parser, namespace, body, option_string=None):
-        if namespace.body is not None:
+        if namespace.body is not None or namespace.generate is not None:
             raise UsageError("Cannot specify -b/--body more than once.", parser)
+
+        # An agent running a controller's plan neither loads code nor reads
+        # files it names; the controller sends the contents of a body file.
+        remote = getattr(namespace, "remote", False)
+        if remote and body.startswith("py:"):
+            raise UsageError("Agents cannot load -b/--body callables.", parser)
+
+        # A callable may generate the URL and method as well as the body.
+        if body.startswith("py:"):
+            try:
+                namespace.generate = sources.load_callable(body[3:])
+            except ImportError as exception:
+                raise UsageError(
+                    "Cannot load -b/--body callable: %s" % exception,
+                    parser)
+            return
+
         if namespace.method not in ("PATCH", "POST", "PUT"):
             raise UsageError(
                 "Cannot specify -b/--body with %r." % namespace.method,
                 parser)
 
-        if body.startswith("py:"):
-            pass
+        if body.startswith("@") and remote:
+            if namespace.plan_body is None:
+                raise UsageError(
+                    "Agents cannot read -b/--body files; the controller sends "
+                    "their contents.", parser)
+            body = namespace.plan_body
         elif body.startswith("@"):
-            pass
+            try:
+                body = sources.read_body(body[1:])
+            except IOError as exception:
+                raise UsageError(
+                    "Cannot read -b/--body file: %s" % exception,
+                    parser)
         namespace.body = body
 
 class AddHeader(argparse.Action):
@@ -51,11 +97,152 @@ class AddHeader(argparse.Action):
         if len(header) != 2:
             raise UsageError("Headers must be of the form 'name:value'", parser)
 
+class AddExpectedHeader(argparse.Action):
+    def __call__(self, parser, namespace, values, option_string=None):
+        name, separator, value = values.partition(":")
+        if not separator or not name:
+            raise UsageError(
+                "Expected headers must be of the form 'name:value'", parser)
+        namespace.expected_headers.append((name, value.strip()))
+
+def statuses_list(value):
+    try:
+        return validation.parse_statuses(value)
+    except ValueError as exception:
+        raise argparse.ArgumentTypeError(str(exception))
+
+def percentiles_list(value):
+    try:
+        percentiles = tuple(float(p) for p in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "Percentiles must be a comma-separated list of numbers.")
+
+    if not all(0 < p <= 100 for p in percentiles):
+        raise argparse.ArgumentTypeError(
+            "Percentiles must be greater than 0 and at most 100.")
+    return percentiles
+
+def thresholds_list(value):
+    try:
+        return checks.parse_thresholds(value)
+    except ValueError as exception:
+        raise argparse.ArgumentTypeError(str(exception))
+
+def tolerance_fraction(value):
+    try:
+        value = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Tolerance must be a number.")
+    if value < 0:
+        raise argparse.ArgumentTypeError("Tolerance cannot be negative.")
+    return value
+
+def metrics_address(value):
+    host, _, port = value.rpartition(":")
+    try:
+        return host or "127.0.0.1", int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "The metrics address must be [host:]port.")
+
+def statsd_address(value):
+    try:
+        return distributed.parse_address(value, metrics.DEFAULT_STATSD_PORT)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "The StatsD address must be host[:port].")
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+def agents_list(value):
+    try:
+        return [
+            distributed.parse_address(agent)
+            for agent in value.split(",")
+        ]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "Agents must be a comma-separated list of host[:port].")
+
+def stages_list(value):
+    stages = []
+    try:
+        for stage in value.split(","):
+            duration, target = stage.split(":")
+            unit = DURATION_UNITS.get(duration[-1:])
+            if unit is not None:
+                duration = duration[:-1]
+            stages.append(runners.Stage(
+                float(duration) * (unit or 1),
+                float(target)))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "Stages must be a comma-separated list of duration:target, "
+            "e.g. 30s:10,1m:100,30s:0")
+
+    if not all(s.duration > 0 and s.target >= 0 for s in stages):
+        raise argparse.ArgumentTypeError(
+            "Stage durations must be positive and targets at least 0.")
+    return stages
+
 class StoreMappedChoice(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
         choice = self.choices[values]
         setattr(namespace, self.dest, choice)
 
+def add_report_arguments(parser):
+    parser.add_argument(
+        "--precision",
+        help="Significant figures of the recorded latency distribution.",
+        choices=range(1, 6),
+        default=histogram.DEFAULT_SIGNIFICANT_FIGURES,
+        type=int)
+
+    parser.add_argument(
+        "--percentiles",
+        help="Comma-separated latency percentiles to report. e.g. 50,99,99.9",
+        default=stats.DEFAULT_PERCENTILES,
+        type=percentiles_list)
+
+    parser.add_argument(
+        "--reporter", dest="reporter_class",
+        help="Stats report format.",
+        action=StoreMappedChoice,
+        default=reporters.TerminalReporter,
+        choices=REPORTERS)
+
+def add_check_arguments(parser):
+    parser.add_argument(
+        "--assert", dest="thresholds",
+        help=(
+            "Comma-separated thresholds the results must meet, or thuum exits "
+            "with status 1, e.g. p99<200ms,errors<0.1%%,rps>500. Errors are "
+            "requests that failed or got a status of 400 or more."
+        ),
+        metavar="THRESHOLDS",
+        default=[],
+        type=thresholds_list)
+
+    parser.add_argument(
+        "--baseline",
+        help=(
+            "JSON report (--reporter json) of an earlier test to compare "
+            "with. thuum exits with status 1 if the latencies are "
+            "significantly slower than the baseline's (by a Mann-Whitney U "
+            "test) and the median is more than --tolerance slower."
+        ),
+        metavar="PATH")
+
+    parser.add_argument(
+        "--tolerance",
+        help=(
+            "Fraction by which the median latency may grow over the "
+            "--baseline before it is a regression."
+        ),
+        default=checks.DEFAULT_TOLERANCE,
+        type=tolerance_fraction)
+
 def get_argument_parser(parser=None):
     parser = parser or argparse.ArgumentParser(
         description="Simple HTTP Load runner.")
@@ -77,26 +264,245 @@ def get_argument_parser(parser=None):
 
     parser.add_argument(
         "-c", "--concurrency",
-        help="Number of requests to make concurrently.",
+        help=(
+            "Number of requests to make concurrently (by default 1, or the "
+            "highest target of --stages)."
+        ),
         dest="concurrency",
+        default=None,
+        type=int)
+
+    parser.add_argument(
+        "-w", "--workers",
+        help=(
+            "Number of processes to distribute the load test across. The "
+            "concurrency and number of requests are split between them."
+        ),
         default=1,
         type=int)
 
+    parser.add_argument(
+        "-r", "--rate",
+        help=(
+            "Start requests at this many per second regardless of how quickly "
+            "they complete. Concurrency becomes the cap on requests in flight."
+        ),
+        type=float)
+
+    parser.add_argument(
+        "--poisson",
+        help="Use exponentially distributed arrivals with -r/--rate.",
+        action="store_true",
+        default=False)
+
+    urls = parser.add_mutually_exclusive_group()
+    urls.add_argument(
+        "--urls-file",
+        help=(
+            "Request URLs chosen at random from a file of lines of "
+            "'url [weight [label]]', relative to the URL argument."
+        ),
+        metavar="PATH")
+
+    urls.add_argument(
+        "--replay",
+        help=(
+            "Replay the requests of an access log, in order, against the "
+            "host of the URL argument."
+        ),
+        metavar="PATH")
+
+    parser.add_argument(
+        "--pool",
+        help=(
+            "Build this many requests before the test and reuse them rather "
+            "than building every request as it is made."
+        ),
+        metavar="N",
+        default=0,
+        type=int)
+
+    parser.add_argument(
+        "--engine",
+        help=(
+            "HTTP client making the requests: Tornado's simple client, its "
+            "libcurl based client (requires pycurl), or a minimal keep-alive "
+            "HTTP/1.1 client for plain HTTP."
+        ),
+        choices=engines.ENGINES,
+        default="simple")
+    parser.add_argument(
+        "--loop",
+        help=(
+            "Event loop to run the test on: Tornado's own, asyncio's "
+            "(requires Python 3) or uvloop's (requires uvloop). Agents use "
+            "the loop given to 'thuum agent'."
+        ),
+        choices=loops.LOOPS,
+        default="tornado")
+
+    keepalive_group = parser.add_mutually_exclusive_group()
+    keepalive_group.add_argument(
+        "--keepalive",
+        help=(
+            "Reuse connections for later requests (the default of the curl "
+            "and raw engines; the simple engine cannot)."
+        ),
+        dest="keepalive",
+        action="store_true",
+        default=None)
+    keepalive_group.add_argument(
+        "--no-keepalive",
+        help="Open a new connection for every request.",
+        dest="keepalive",
+        action="store_false")
+
+    parser.add_argument(
+        "--max-connections",
+        help=(
+            "Maximum number of connections open at once, which also limits "
+            "the requests in flight."
+        ),
+        metavar="N",
+        default=None,
+        type=int)
+
+    parser.add_argument(
+        "--connect-timeout",
+        help=(
+            "Seconds a request may take to connect before it fails as a "
+            "timeout (Tornado's clients default to 20; the raw engine has "
+            "no limit)."
+        ),
+        metavar="SECONDS",
+        type=float)
+
+    parser.add_argument(
+        "--request-timeout",
+        help=(
+            "Seconds a request may take in all before it fails as a timeout "
+            "(Tornado's clients default to 20; the raw engine has no limit)."
+        ),
+        metavar="SECONDS",
+        type=float)
+
     parser.add_argument(
         "-H", "--header", dest="headers",
         help="Custom header. name:value",
         default=[], action=AddHeader)
 
     parser.add_argument(
-        "--reporter", dest="reporter_class",
-        help="Stats report format.",
-        action=StoreMappedChoice,
-        default=reporters.TerminalReporter,
-        choices={
-            "csv": reporters.CSVReporter,
-            "json": reporters.JSONReporter,
-            "term": reporters.TerminalReporter,
-        })
+        "--expect-status",
+        help=(
+            "Comma-separated status codes (or classes, e.g. 2xx) a response "
+            "must have to be valid."
+        ),
+        metavar="STATUSES",
+        type=statuses_list)
+
+    parser.add_argument(
+        "--expect-header", dest="expected_headers",
+        help="Header a response must have, containing the value. name:value",
+        metavar="NAME:VALUE",
+        default=[],
+        action=AddExpectedHeader)
+
+    parser.add_argument(
+        "--expect-body",
+        help="Text the body of a response must contain.",
+        metavar="TEXT")
+
+    parser.add_argument(
+        "--expect-body-regex",
+        help=(
+            "Regular expression the body of a response must match (within "
+            "%d bytes)." % validation.REGEX_WINDOW
+        ),
+        metavar="PATTERN")
+
+    parser.add_argument(
+        "--expect-body-sha256",
+        help="SHA-256 hex digest the body of a response must have.",
+        metavar="DIGEST")
+
+    parser.add_argument(
+        "--sample-bodies",
+        help=(
+            "Fraction of responses whose bodies are checked against the "
+            "--expect-body options (all of them by default)."
+        ),
+        metavar="FRACTION",
+        default=1.0,
+        type=float)
+
+    warmup = parser.add_mutually_exclusive_group()
+    warmup.add_argument(
+        "--warmup",
+        help=(
+            "Exclude requests started in the first SECONDS of the test from "
+            "the statistics, reporting them separately."
+        ),
+        metavar="SECONDS",
+        default=0,
+        type=float)
+
+    warmup.add_argument(
+        "--warmup-requests",
+        help=(
+            "Exclude the first N requests to complete from the statistics, "
+            "reporting them separately."
+        ),
+        metavar="N",
+        default=0,
+        type=int)
+
+    add_report_arguments(parser)
+    add_check_arguments(parser)
+
+    parser.add_argument(
+        "--interval",
+        help="Length in seconds of the windows of live statistics.",
+        default=1.0,
+        type=float)
+
+    parser.add_argument(
+        "--profile",
+        help=(
+            "Profile thuum itself during the test, writing the statistics to "
+            "PATH (for `pstats`). Worker processes are not profiled."
+        ),
+        metavar="PATH")
+
+    parser.add_argument(
+        "--results",
+        help=(
+            "Append the records of the test to a binary results file, for "
+            "`thuum report`."
+        ),
+        metavar="PATH")
+
+    parser.add_argument(
+        "--metrics",
+        help=(
+            "Serve live metrics for Prometheus at /metrics on this port (of "
+            "localhost, unless a host is given) while the test runs."
+        ),
+        metavar="[HOST:]PORT",
+        type=metrics_address)
+
+    parser.add_argument(
+        "--statsd",
+        help=(
+            "Send the statistics of every --interval to this StatsD server "
+            "(by default on port %d)." % metrics.DEFAULT_STATSD_PORT
+        ),
+        metavar="HOST[:PORT]",
+        type=statsd_address)
+
+    parser.add_argument(
+        "--statsd-prefix",
+        help="Prefix of the names of the metrics sent to StatsD.",
+        default=metrics.DEFAULT_PREFIX)
 
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument(
@@ -109,52 +515,569 @@ def get_argument_parser(parser=None):
         help="Run load test for specified length of time.",
         type=float)
 
-    parser.add_argument("url", help="URL to hit")
+    group.add_argument(
+        "--stages",
+        help=(
+            "Vary the load over stages of duration:target, ramping to each "
+            "target from the last, e.g. 30s:10,1m:100,30s:0. Targets are the "
+            "concurrency, or the rate with --stages-rate."
+        ),
+        type=stages_list)
+
+    parser.add_argument(
+        "--stages-rate",
+        help=(
+            "Make the targets of --stages arrival rates in requests per "
+            "second. -c/--concurrency is then the cap on requests in flight."
+        ),
+        action="store_true",
+        default=False)
+
+    parser.add_argument(
+        "url",
+        help="URL to hit, or the base of those given by --urls-file or --replay")
+    parser.set_defaults(generate=None)
     return parser
 
 
+def get_request_factory(args):
+    """
+    Create the function making each request of the test for the given
+    arguments.
+
+    """
+    generate = args.generate
+    if args.urls_file:
+        generate = sources.UrlList(args.urls_file, args.url)
+    elif args.replay:
+        generate = sources.Replay(args.replay, args.url)
+
+    make_request = sources.request_factory(
+        args.url,
+        args.method,
+        args.headers,
+        args.body,
+        generate,
+        connect_timeout=args.connect_timeout,
+        request_timeout=args.request_timeout)
+
+    if args.pool:
+        return sources.RequestPool(make_request, args.pool)
+    return make_request
+
+
+def get_runner(args, make_request):
+    """
+    Create a runner (and its HTTP engine) on the current `IOLoop` for the
+    given arguments.
+
+    """
+    engine = engines.get_engine(
+        args.engine,
+        args.concurrency,
+        keepalive=args.keepalive,
+        max_connections=args.max_connections)
+
+    if args.stages:
+        return runners.StagedRunner(
+            engine,
+            make_request,
+            args.stages,
+            rate=args.stages_rate,
+            poisson=args.poisson)
+    if args.rate:
+        return runners.RateRunner(
+            engine,
+            make_request,
+            args.rate,
+            num_requests=args.requests,
+            duration=args.duration,
+            poisson=args.poisson)
+    if args.duration:
+        return runners.DurationRunner(engine, make_request, args.duration)
+    return runners.QuantityRunner(engine, make_request, args.requests)
+
+
+def get_share_args(args, concurrency, num_requests, parts):
+    """
+    The arguments of one of `parts` workers or agents sharing a test, which
+    runs `concurrency` of its concurrent requests and `num_requests` of its
+    requests.
+
+    """
+    share_args = argparse.Namespace(**vars(args))
+    share_args.concurrency = concurrency
+    share_args.requests = num_requests
+    if args.max_connections:
+        share_args.max_connections = max(
+            1, args.max_connections * concurrency // args.concurrency)
+    if args.rate:
+        share_args.rate = args.rate / parts
+    if args.stages:
+        share = (
+            1.0 / parts if args.stages_rate
+            else concurrency / float(args.concurrency))
+        share_args.stages = [
+            runners.Stage(stage.duration, stage.target * share)
+            for stage in args.stages]
+    return share_args
+
+
+def get_duration(args):
+    if args.stages:
+        return sum(stage.duration for stage in args.stages)
+    return args.duration
+
+
+def get_worker_pool(args, make_request):
+    """
+    Create a pool of worker processes, each running its share of the test.
+
+    """
+    def make_runner(concurrency, num_requests):
+        worker_args = get_share_args(
+            args, concurrency, num_requests, pool.workers)
+        return get_runner(worker_args, make_request)
+
+    pool = workers.WorkerPool(
+        make_runner,
+        args.workers,
+        args.concurrency,
+        num_requests=args.requests,
+        duration=get_duration(args),
+        stages=args.stages,
+        loop=args.loop,
+        validator=get_validator(args))
+    return pool
+
+
+def get_controller(args, argv):
+    """
+    Create a controller running the test given by `argv` on `args.agents`,
+    sending them the request body (which may have been read from a file).
+
+    """
+    plan = {"argv": argv}
+    if args.body is not None:
+        body = args.body
+        if not isinstance(body, bytes):
+            body = body.encode("utf-8")
+        plan["body"] = base64.b64encode(body).decode("ascii")
+    return distributed.Controller(
+        args.agents,
+        plan,
+        num_requests=args.requests,
+        duration=get_duration(args),
+        stages=args.stages)
+
+
+def get_validator(args):
+    """
+    Create the validator of responses for the given arguments, or `None` if
+    they expect nothing of responses.
+
+    """
+    if not (args.expect_status or args.expected_headers or args.expect_body
+            or args.expect_body_regex or args.expect_body_sha256):
+        return None
+    return validation.Validator(
+        statuses=args.expect_status,
+        headers=args.expected_headers,
+        contains=args.expect_body,
+        pattern=args.expect_body_regex,
+        sha256=args.expect_body_sha256,
+        sample=args.sample_bodies)
+
+
+def get_tracker(args, runner, window_lag=0.0):
+    return stats.Tracker(
+        runner,
+        keep_records=False,
+        significant_figures=args.precision,
+        window_interval=args.interval,
+        window_lag=window_lag,
+        warmup=args.warmup,
+        warmup_requests=args.warmup_requests,
+        validator=get_validator(args))
+
+
+def get_exporters(args, tracker):
+    """
+    Create the exporters of live metrics of the test tracked by `tracker`
+    asked for by the given arguments, on the current `IOLoop`.
+
+    """
+    exporters = []
+    if args.metrics:
+        host, port = args.metrics
+        exporters.append(metrics.PrometheusExporter(tracker, port, host))
+    if args.statsd:
+        host, port = args.statsd
+        exporters.append(metrics.StatsdExporter(
+            tracker, host, port, args.statsd_prefix))
+    return exporters
+
+
+def get_window_lag(args):
+    """
+    Records from worker processes, and digests from agents, arrive in
+    batches, so windows are held open for a little longer than a batch may be
+    delayed.
+
+    """
+    lag = 0.0
+    if args.workers > 1:
+        lag += 2 * workers.FLUSH_INTERVAL / 1000.0
+    if getattr(args, "agents", None):
+        lag += 2 * distributed.FLUSH_INTERVAL / 1000.0
+    return lag
+
+
+def get_controller_parser(parser=None):
+    parser = get_argument_parser(parser or argparse.ArgumentParser(
+        prog="thuum controller",
+        description="Run an HTTP load test on several thuum agents."))
+    parser.add_argument(
+        "--agents",
+        help=(
+            "Comma-separated host[:port] of the agents to run the test on, "
+            "which share its concurrency, requests and rate."
+        ),
+        required=True,
+        type=agents_list)
+    return parser
+
+
+def load_baseline(args):
+    """
+    Read the `--baseline` summary of the given arguments, if any, exiting if
+    it cannot be read.
+
+    """
+    if not args.baseline:
+        return None
+    try:
+        return checks.load_baseline(args.baseline)
+    except (IOError, ValueError) as exception:
+        sys.exit("Cannot read baseline: %s" % exception)
+
+
+def run_checks(args, tracker, baseline, stream):
+    """
+    Check the results of the test tracked by `tracker` against the
+    `--assert` thresholds and `--baseline` of the given arguments, if any,
+    writing the outcome of each to `stream`. Returns the exit status: 1 if
+    any check failed.
+
+    """
+    if not args.thresholds and baseline is None:
+        return None
+    results = checks.run_checks(
+        tracker.get_summary(), args.thresholds, baseline, args.tolerance)
+    checks.write_checks(stream, results)
+    return 0 if results["passed"] else 1
+
+
+def check_loop(loop, parser):
+    if loop not in loops.available_loops():
+        requirement = "Python 3" if loop == "asyncio" else "uvloop"
+        raise UsageError("--loop %s requires %s." % (loop, requirement), parser)
+
+
+def parse_args(parser, argv):
+    """
+    Parse and check the arguments of a test, raising `UsageError` if they
+    are invalid.
+
+    """
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        raise UsageError("-w/--workers must be at least 1.", parser)
+    if args.workers > 1 and not workers.can_fork():
+        raise UsageError(
+            "-w/--workers requires forking processes, which this platform "
+            "does not support.", parser)
+    if args.interval <= 0:
+        raise UsageError("--interval must be positive.", parser)
+    if args.generate and (args.urls_file or args.replay):
+        raise UsageError(
+            "Cannot combine a -b/--body callable with --urls-file or "
+            "--replay.", parser)
+    if args.engine == "curl" and engines.curl_httpclient is None:
+        raise UsageError("--engine curl requires pycurl.", parser)
+    check_loop(args.loop, parser)
+    if args.engine == "simple" and args.keepalive:
+        raise UsageError(
+            "The simple engine cannot keep connections alive.", parser)
+    if args.max_connections is not None and args.max_connections < 1:
+        raise UsageError("--max-connections must be at least 1.", parser)
+    if any(timeout is not None and timeout <= 0
+           for timeout in (args.connect_timeout, args.request_timeout)):
+        raise UsageError("Timeouts must be positive.", parser)
+    if args.pool < 0:
+        raise UsageError("--pool cannot be negative.", parser)
+    if not 0 < args.sample_bodies <= 1:
+        raise UsageError(
+            "--sample-bodies must be greater than 0 and at most 1.", parser)
+    if args.expect_body_regex is not None:
+        try:
+            re.compile(args.expect_body_regex)
+        except re.error as exception:
+            raise UsageError(
+                "Invalid --expect-body-regex: %s" % exception, parser)
+    if args.expect_body_sha256 is not None and not re.match(
+            r"^[0-9a-fA-F]{64}$", args.expect_body_sha256):
+        raise UsageError(
+            "--expect-body-sha256 must be 64 hexadecimal digits.", parser)
+    if args.warmup < 0 or args.warmup_requests < 0:
+        raise UsageError("Warm-up cannot be negative.", parser)
+    if args.rate is not None and args.rate <= 0:
+        raise UsageError("-r/--rate must be positive.", parser)
+    if args.stages_rate and not args.stages:
+        raise UsageError("Cannot specify --stages-rate without --stages.", parser)
+    if args.stages and args.rate is not None:
+        raise UsageError(
+            "Cannot specify -r/--rate with --stages, whose targets are the "
+            "rates with --stages-rate.", parser)
+    if args.poisson and not (args.rate or args.stages_rate):
+        raise UsageError(
+            "Cannot specify --poisson without -r/--rate or --stages-rate.",
+            parser)
+    if args.stages and not args.stages_rate:
+        if args.concurrency is not None:
+            raise UsageError(
+                "Cannot specify -c/--concurrency with --stages, whose targets "
+                "are the concurrency (without --stages-rate).", parser)
+        # Stage targets are the concurrency, which may go no higher.
+        args.concurrency = int(math.ceil(
+            max(stage.target for stage in args.stages))) or 1
+    elif args.concurrency is None:
+        args.concurrency = 1
+
+    agents = len(getattr(args, "agents", None) or ())
+    if agents and (args.generate or args.urls_file or args.replay):
+        raise UsageError(
+            "Cannot use a -b/--body callable, --urls-file or --replay with "
+            "agents, which do not load code or read files for a "
+            "controller.", parser)
+    if agents and args.results:
+        raise UsageError(
+            "Cannot write --results from a controller; agents only send "
+            "summaries of their requests.", parser)
+    if agents > args.concurrency:
+        raise UsageError(
+            "Cannot run on more agents than the concurrency.", parser)
+    if args.requests is not None and agents > args.requests:
+        raise UsageError(
+            "Cannot run on more agents than the number of requests.", parser)
+    return args
+
+
+def prepare_agent_test(plan):
+    """
+    Create the runner and tracker of an agent's share of the test planned by
+    a controller.
+
+    """
+    parser = get_controller_parser(api.PlanParser(prog="thuum controller"))
+    try:
+        body = plan.get("body")
+        parser.set_defaults(
+            remote=True,
+            plan_body=None if body is None else base64.b64decode(body))
+        args = parse_args(parser, plan["argv"])
+    except (UsageError, ValueError) as exception:
+        raise distributed.AgentError(str(exception))
+    except (KeyError, TypeError):
+        raise distributed.AgentError("Invalid plan; expected its argv and body.")
+
+    index, parts = plan["agent"], plan["agents"]
+    num_requests = None
+    if args.requests is not None:
+        num_requests = workers.split(args.requests, parts)[index]
+    args = get_share_args(
+        args,
+        workers.split(args.concurrency, parts)[index],
+        num_requests,
+        parts)
+    args.warmup_requests = workers.split(args.warmup_requests, parts)[index]
+
+    try:
+        make_request = get_request_factory(args)
+    except (IOError, ValueError) as exception:
+        raise distributed.AgentError("Cannot read requests: %s" % exception)
+
+    if args.workers > 1:
+        runner = get_worker_pool(args, make_request)
+    else:
+        runner = get_runner(args, make_request)
+    return runner, get_tracker(args, runner, get_window_lag(args))
+
+
+def agent_main(argv, stdout=sys.stdout):
+    parser = argparse.ArgumentParser(
+        prog="thuum agent",
+        description="Run the load tests sent by a thuum controller.")
+    parser.add_argument(
+        "--bind",
+        help=(
+            "Address to listen on (by default, only this host's). Agents run "
+            "any test sent to them, so must only be reachable from trusted "
+            "hosts."
+        ),
+        default=distributed.DEFAULT_ADDRESS)
+    parser.add_argument(
+        "-p", "--port",
+        help="Port to listen on.",
+        default=distributed.DEFAULT_PORT,
+        type=int)
+    parser.add_argument(
+        "--loop",
+        help="Event loop to run tests on (see 'thuum --help').",
+        choices=loops.LOOPS,
+        default="tornado")
+    args = parser.parse_args(argv)
+    try:
+        check_loop(args.loop, parser)
+    except UsageError as exception:
+        sys.exit("%s\n\n%s" % (exception, parser.format_usage()))
+
+    agent = distributed.Agent(
+        prepare_agent_test, args.bind, args.port, loop=args.loop)
+    stdout.write("Listening on %s:%d\n" % agent.address)
+    try:
+        agent.serve()
+    except KeyboardInterrupt:
+        sys.exit("Agent stopped.")
+    finally:
+        agent.close()
+
+
+def report_main(argv, stdout=sys.stdout):
+    parser = argparse.ArgumentParser(
+        prog="thuum report",
+        description=(
+            "Report on the results files of one or more tests, e.g. from "
+            "several runs or hosts, as if they were a single test."))
+    parser.add_argument(
+        "paths",
+        help="Results files written with --results.",
+        metavar="PATH",
+        nargs="+")
+    add_report_arguments(parser)
+    add_check_arguments(parser)
+    args = parser.parse_args(argv)
+    baseline = load_baseline(args)
+
+    tracker = stats.Tracker(keep_records=False, significant_figures=args.precision)
+    try:
+        results.load(args.paths, tracker)
+    except (IOError, ValueError) as exception:
+        sys.exit("Cannot read results: %s" % exception)
+
+    reporter = args.reporter_class(stdout, percentiles=args.percentiles)
+    reporter.summarize(tracker)
+    return run_checks(args, tracker, baseline, get_checks_stream(reporter))
+
+
+def get_checks_stream(reporter):
+    """
+    The outcome of checks is written after the terminal report, and to stderr
+    rather than into machine readable reports.
+
+    """
+    if isinstance(reporter, reporters.TerminalReporter):
+        return reporter.stream
+    return sys.stderr
+
+
 def main(argv=sys.argv[1:], stdout=sys.stdout):
-    parser = get_argument_parser()
+    if argv[:1] == ["agent"]:
+        return agent_main(argv[1:], stdout)
+    if argv[:1] == ["report"]:
+        return report_main(argv[1:], stdout)
+
+    controller = argv[:1] == ["controller"]
+    if controller:
+        argv = argv[1:]
+        parser = get_controller_parser()
+    else:
+        parser = get_argument_parser()
 
     try:
-        args = parser.parse_args(argv)
+        args = parse_args(parser, argv)
     except UsageError as exception:
         sys.exit("%s\n\n%s" % (
-            exception.message,
+            exception,
             exception.parser.format_usage()
         ))
 
-    httpclient.AsyncHTTPClient.configure(None, max_clients=args.concurrency)
-    client = httpclient.AsyncHTTPClient(io_loop=ioloop.IOLoop.current())
+    if not controller:
+        try:
+            make_request = get_request_factory(args)
+        except (IOError, ValueError) as exception:
+            sys.exit("Cannot read requests: %s" % exception)
 
-    try:
-        make_request = functools.partial(
-            httpclient.HTTPRequest,
-            args.url,
-            args.method,
-            args.headers,
-            args.body)
+    writer = None
+    if args.results:
+        try:
+            writer = results.ResultsWriter(args.results)
+        except (IOError, ValueError) as exception:
+            sys.exit("Cannot write results: %s" % exception)
+    baseline = load_baseline(args)
 
-        if args.duration:
-            runner = runners.DurationRunner(client, make_request, args.duration)
+    io_loop = loops.new_loop(args.loop)
+    io_loop.make_current()
+
+    try:
+        if controller:
+            runner = get_controller(args, argv)
+        elif args.workers > 1:
+            runner = get_worker_pool(args, make_request)
         else:
-            runner = runners.QuantityRunner(client, make_request, args.requests)
+            runner = get_runner(args, make_request)
 
-        reporter = args.reporter_class(stdout)
+        reporter = args.reporter_class(stdout, percentiles=args.percentiles)
         progress = functools.partial(reporter.progress, runner)
 
-        tracker = stats.Tracker(runner)
-        tracker.events.on("request_finished", reporter.record)
+        overhead = monitor.Monitor(runner, io_loop)
+        tracker = get_tracker(args, runner, get_window_lag(args))
+        overhead.attach(tracker)
+        if writer is not None:
+            writer.attach(tracker)
+        try:
+            exporters = get_exporters(args, tracker)
+        except socket.error as exception:
+            sys.exit("Cannot export metrics: %s" % exception)
+        tracker.events.on(
+            "request_finished",
+            overhead.timed("reporters", reporter.record))
+        tracker.events.on(
+            "window_finished",
+            overhead.timed("reporters", reporter.window))
         tracker.events.on("tests_finished", lambda t: progress())
         tracker.events.on("tests_finished", reporter.summarize)
 
-        client.io_loop.add_callback(progress)
-        ioloop.PeriodicCallback(progress, 500, client.io_loop).start()
+        io_loop.add_callback(progress)
+        ioloop.PeriodicCallback(progress, 500, io_loop).start()
+        ioloop.PeriodicCallback(tracker.update_windows, 100, io_loop).start()
 
-        runner.run()
+        if args.profile:
+            profiler = cProfile.Profile()
+            profiler.runcall(runner.run)
+            profiler.dump_stats(args.profile)
+        else:
+            runner.run()
+
+        for exporter in exporters:
+            exporter.close()
 
     except KeyboardInterrupt:
         sys.exit("Tests interrupted.")
+    except distributed.AgentError as exception:
+        sys.exit(str(exception))
+
+    return run_checks(args, tracker, baseline, get_checks_stream(reporter))
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,189 @@
+"""
+Running load tests from Python rather than from the command line.
+
+A test is planned exactly as on the command line, by its arguments, and
+`run()` returns its statistics as a `Result` rather than a report:
+
+    result = thuum.run(["http://localhost:8000/", "-n", "1000", "-c", "10"])
+    assert result.percentiles["p99"] < 0.1
+
+Each test runs on an `IOLoop` of its own, which is closed (along with the
+HTTP client's connections) once the test is over, so tests can be run one
+after another in the same process. `run_async()` runs a test on a thread of
+its own for a coroutine of an application using asyncio to await.
+
+"""
+
+import argparse
+
+from tornado import ioloop
+
+from thuum import (
+    checks,
+    loops,
+    monitor,
+    reporters,
+    results,
+)
+
+
+class PlanParser(argparse.ArgumentParser):
+    """
+    Parser of the arguments of a planned test, raising `ValueError` for
+    invalid arguments (or those such as `--help` that would end the program)
+    rather than exiting.
+
+    """
+    def error(self, message):
+        raise ValueError(message)
+
+    def exit(self, status=0, message=None):
+        raise ValueError(message or "Cannot run a test with these arguments.")
+
+
+class Result(object):
+    """
+    The statistics of a test: `summary` is a dict of all of them (as written
+    by the JSON reporter), the most used of which are also attributes.
+
+    `stats` (the timing statistics, including `percentiles`) is `None` if no
+    request completed. If the plan has `--assert` thresholds or a
+    `--baseline`, the results of checking them are in the summary's "checks"
+    (see `thuum.checks.run_checks()`), and `passed` is whether all passed.
+
+    """
+    def __init__(self, summary):
+        self.summary = summary
+
+    @property
+    def stats(self):
+        return self.summary["stats"]
+
+    @property
+    def count(self):
+        return self.stats["count"] if self.stats else 0
+
+    @property
+    def rps(self):
+        return self.stats["rps"] if self.stats else 0.0
+
+    @property
+    def percentiles(self):
+        return self.stats["percentiles"] if self.stats else {}
+
+    @property
+    def codes(self):
+        return self.summary["codes"]
+
+    @property
+    def failures(self):
+        return self.summary["failures"]
+
+    @property
+    def failed(self):
+        return sum(failure["count"] for failure in self.failures.values())
+
+    @property
+    def counters(self):
+        return self.summary["counters"]
+
+    @property
+    def passed(self):
+        results = self.summary.get("checks")
+        return results is None or results["passed"]
+
+    def to_dict(self):
+        return self.summary
+
+
+def parse_plan(plan):
+    """
+    Parse the command line arguments `plan` of a test, raising `ValueError`
+    if they are invalid.
+
+    """
+    # Imported only when needed, as `python -m thuum` runs the package's
+    # __main__ module after importing the package (and so this module).
+    from thuum import __main__ as cli
+
+    parser = cli.get_argument_parser(PlanParser(prog="thuum"))
+    try:
+        return cli.parse_args(parser, list(plan))
+    except cli.UsageError as exception:
+        raise ValueError(str(exception))
+
+
+def run(plan):
+    """
+    Run the test planned by the command line arguments `plan` and return
+    its `Result`. Arguments only affecting the report (such as the reporter
+    and `--profile`) are ignored.
+
+    Raises `ValueError` if the plan is invalid and `IOError` if a file it
+    refers to cannot be read (or `ValueError`, if the `--baseline` is not a
+    JSON report) or the `--metrics` port cannot be listened on.
+
+    """
+    from thuum import __main__ as cli
+
+    args = parse_plan(plan)
+    make_request = cli.get_request_factory(args)
+    writer = None
+    if args.results:
+        writer = results.ResultsWriter(args.results)
+    baseline = None
+    if args.baseline:
+        baseline = checks.load_baseline(args.baseline)
+
+    previous = ioloop.IOLoop.current(instance=False)
+    io_loop = loops.new_loop(args.loop)
+    io_loop.make_current()
+    try:
+        if args.workers > 1:
+            runner = cli.get_worker_pool(args, make_request)
+        else:
+            runner = cli.get_runner(args, make_request)
+
+        overhead = monitor.Monitor(runner, io_loop)
+        tracker = cli.get_tracker(args, runner, cli.get_window_lag(args))
+        overhead.attach(tracker)
+        if writer is not None:
+            writer.attach(tracker)
+        exporters = cli.get_exporters(args, tracker)
+        timeseries = []
+        tracker.events.on("window_finished", timeseries.append)
+        ioloop.PeriodicCallback(tracker.update_windows, 100, io_loop).start()
+
+        try:
+            runner.run()
+        finally:
+            engine = getattr(runner, "engine", None)
+            if engine is not None:
+                engine.close()
+            for exporter in exporters:
+                exporter.close()
+
+        reporter = reporters.BaseReporter(None, percentiles=args.percentiles)
+        summary = reporter.get_summary(tracker)
+        summary["timeseries"] = timeseries
+        if args.thresholds or baseline is not None:
+            summary["checks"] = checks.run_checks(
+                tracker.get_summary(), args.thresholds, baseline, args.tolerance)
+        return Result(summary)
+    finally:
+        if previous is not None:
+            previous.make_current()
+        else:
+            ioloop.IOLoop.clear_current()
+        io_loop.close(all_fds=True)
+
+
+def run_async(plan, executor=None):
+    """
+    Run the test planned by `plan` (see `run()`) on a thread of `executor`
+    (by default, that of the current asyncio event loop), returning an
+    asyncio `Future` of its `Result`. Requires asyncio.
+
+    """
+    assert loops.asyncio is not None, "run_async() requires asyncio"
+    return loops.asyncio.get_event_loop().run_in_executor(executor, run, plan)
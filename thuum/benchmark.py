@@ -0,0 +1,479 @@
+"""
+Benchmark suite measuring how much load thuum itself can generate.
+
+A stub HTTP server is started in a separate process on an unused local port:
+a Tornado web application, or for less server-side overhead a bare
+`TCPServer` writing a canned keep-alive response. Either can be told to delay
+each response (`--latency`) and how large a body to send (`--size`).
+
+Each available engine (or those given with `--engine`) then runs each runner
+(`--runner`, by default only "quantity") on each event loop (`--loop`, by
+default only Tornado's, see `thuum.loops`) at each concurrency level (`-c`,
+may be repeated) against it. Every case runs in a fresh process so that its
+memory use can be measured, and the requests per second achieved, the CPU
+time used per request and the growth in memory per million requests are
+reported for each:
+
+    python -m thuum.benchmark -n 20000 -c 10 -c 100 --server raw
+
+`--output` saves the results as JSON, and `--baseline` compares them with the
+results of a previous run, exiting with a non-zero status if any case got
+slower by more than `--tolerance`.
+
+With `--overhead` a `StubEngine`, which answers every request itself without
+any I/O, is used instead, measuring the time thuum's runner and tracker (and
+each event loop) spend on each request:
+
+    python -m thuum.benchmark --overhead -n 100000 -c 50 --loop tornado --loop uvloop
+
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from tornado import (
+    gen,
+    httpclient,
+    httpserver,
+    ioloop,
+    iostream,
+    netutil,
+    tcpserver,
+    web,
+)
+
+from thuum import (
+    engines,
+    loops,
+    monitor,
+    runners,
+    stats,
+)
+
+SERVERS = ("tornado", "raw")
+RUNNERS = ("quantity", "duration", "rate", "staged")
+
+HEADER = (
+    "Engine    Runner    Loop        Conc  Requests          RPS    CPU/req"
+    "  Mem/1M req        p50        p99\n")
+CASE_TEMPLATE = "{engine:<10}{runner:<10}{loop:<10}{concurrency:>6}"
+REPORT_TEMPLATE = CASE_TEMPLATE + (
+    "{count:>10}{rps:>13.2f}"
+    "{cpu_us:>9.1f}us{memory_mb:>10.1f}MB{p50:>10.4f}s{p99:>10.4f}s")
+EMPTY_TEMPLATE = CASE_TEMPLATE + "  no requests completed"
+BASELINE_HEADER = "\nCompared with baseline:\n"
+BASELINE_TEMPLATE = CASE_TEMPLATE + (
+    "  RPS {rps_change:+7.1%}  CPU/req {cpu_change:+7.1%}{regression}")
+OVERHEAD_TEMPLATE = (
+    "Overhead per request on {loop}: {overhead:.2f}us ({rps:.2f} requests/sec)")
+
+# ru_maxrss is in kilobytes, except on OS X.
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class StubHandler(web.RequestHandler):
+    def initialize(self, body, latency):
+        self.body = body
+        self.latency = latency
+
+    @gen.coroutine
+    def get(self):
+        if self.latency:
+            yield gen.sleep(self.latency)
+        self.write(self.body)
+
+
+class RawStubServer(tcpserver.TCPServer):
+    """
+    Answers every request on a connection with the same canned response,
+    without parsing more of it than the end of its headers (so only requests
+    without a body are supported).
+
+    """
+    def __init__(self, body, latency):
+        super(RawStubServer, self).__init__()
+        self.response = (
+            b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+        self.latency = latency
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        try:
+            while True:
+                headers = yield stream.read_until(b"\r\n\r\n")
+                if self.latency:
+                    yield gen.sleep(self.latency)
+                yield stream.write(self.response)
+                if b"connection: close" in headers.lower():
+                    stream.close()
+                    return
+        except iostream.StreamClosedError:
+            pass
+
+
+class StubEngine(engines.Engine):
+    """
+    Engine answering every request with an empty 200 response on the next
+    iteration of the `IOLoop`, without making it.
+
+    """
+    def fetch(self, request, callback):
+        self.active += 1
+        self.io_loop.add_callback(self._respond, request, callback)
+
+    def _respond(self, request, callback):
+        self.active -= 1
+        callback(httpclient.HTTPResponse(request, 200, request_time=0.0))
+
+
+def _serve(sockets, server, body, latency):
+    io_loop = ioloop.IOLoop()
+    io_loop.make_current()
+    if server == "raw":
+        server = RawStubServer(body, latency)
+    else:
+        server = httpserver.HTTPServer(web.Application([
+            (r"/.*", StubHandler, {"body": body, "latency": latency}),
+        ]))
+    server.add_sockets(sockets)
+    io_loop.start()
+
+
+def start_server(server="tornado", latency=0.0, size=2):
+    """
+    Start a stub server (one of `SERVERS`) in a child process, returning the
+    process and the URL it serves. Each response has a body of `size` bytes
+    and is delayed by `latency` seconds.
+
+    """
+    sockets = netutil.bind_sockets(0, "127.0.0.1")
+    port = sockets[0].getsockname()[1]
+    process = multiprocessing.Process(
+        target=_serve, args=(sockets, server, b"x" * size, latency))
+    process.daemon = True
+    process.start()
+    for sock in sockets:
+        sock.close()
+    return process, "http://127.0.0.1:%d/" % port
+
+
+def available_engines():
+    return [
+        name for name in engines.ENGINES
+        if name != "curl" or engines.curl_httpclient is not None
+    ]
+
+
+def make_runner(name, engine, make_request, concurrency, options):
+    """
+    Create the runner called `name` (one of `RUNNERS`) for a case of the
+    suite. `options` gives the number of requests of a "quantity" test, the
+    duration of the others and the arrival rate of a "rate" test, at most
+    `concurrency` requests of which are in flight at a time.
+
+    """
+    if name == "quantity":
+        return runners.QuantityRunner(engine, make_request, options.requests)
+    if name == "duration":
+        return runners.DurationRunner(engine, make_request, options.duration)
+    if name == "rate":
+        return runners.RateRunner(
+            engine, make_request, options.rate,
+            duration=options.duration, max_pending=concurrency)
+    # Ramp up over the first half of the test and hold for the second.
+    half = options.duration / 2.0
+    return runners.StagedRunner(engine, make_request, [
+        runners.Stage(half, concurrency),
+        runners.Stage(half, concurrency),
+    ])
+
+
+def _max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+def run(engine_name, runner_name, url, concurrency, options, loop="tornado"):
+    """
+    Run a case of the suite against `url` in this process, on an `IOLoop` of
+    the kind named by `loop`, returning its
+    results: the number of requests completed, the requests per second, the
+    CPU seconds used and the bytes of memory gained per request, and the
+    50th and 99th latency percentiles. Returns `None` if no request was
+    completed.
+
+    Memory is measured as the growth of the process's peak resident size, so
+    it only reflects the cost per request for cases long enough to outweigh
+    the allocations made as the test starts.
+
+    """
+    io_loop = loops.new_loop(loop)
+    io_loop.make_current()
+    try:
+        engine = engines.get_engine(engine_name, concurrency, io_loop)
+        make_request = lambda **kwargs: httpclient.HTTPRequest(url, **kwargs)
+        runner = make_runner(
+            runner_name, engine, make_request, concurrency, options)
+        tracker = stats.Tracker(runner, keep_records=False)
+
+        cpu = monitor.cpu_time()
+        memory = _max_rss()
+        runner.run()
+        cpu = monitor.cpu_time() - cpu
+        memory = _max_rss() - memory
+
+        engine.close()
+        time_stats = stats.get_time_stats(tracker.get_summary(), (50, 99))
+        if time_stats is None:
+            return None
+        count = time_stats["count"]
+        return {
+            "count": count,
+            "rps": time_stats["rps"],
+            "cpu": cpu / count,
+            "memory": memory / float(count),
+            "p50": time_stats["percentiles"]["p50"],
+            "p99": time_stats["percentiles"]["p99"],
+        }
+    finally:
+        ioloop.IOLoop.clear_current()
+        io_loop.close(all_fds=True)
+
+
+def _run_case(connection, *args):
+    try:
+        connection.send(run(*args))
+    finally:
+        connection.close()
+
+
+def run_isolated(*args):
+    """
+    Run a case of the suite (see `run()`) in a fresh child process, so that
+    its memory use is not hidden by that of the cases before it.
+
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_case, args=(sender,) + args)
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        raise RuntimeError("The benchmark process failed")
+    finally:
+        process.join()
+
+
+def _case_key(case):
+    # Results saved before the loop could be chosen ran on Tornado's.
+    return (
+        case["engine"],
+        case["runner"],
+        case.get("loop", "tornado"),
+        case["concurrency"])
+
+
+def compare(cases, baseline, tolerance):
+    """
+    Compare the results of each case with those of the same engine, runner,
+    loop and concurrency in `baseline`, yielding the change in requests per second
+    and in CPU time per request of each and whether either is worse by more
+    than the fraction `tolerance`.
+
+    """
+    previous = dict((_case_key(case), case) for case in baseline["cases"])
+    for case in cases:
+        base = previous.get(_case_key(case))
+        if not base or not case.get("count") or not base.get("count"):
+            continue
+        rps_change = case["rps"] / base["rps"] - 1
+        cpu_change = case["cpu"] / base["cpu"] - 1
+        yield dict(
+            case,
+            rps_change=rps_change,
+            cpu_change=cpu_change,
+            regression=rps_change < -tolerance or cpu_change > tolerance)
+
+
+def measure_overhead(num_requests, concurrency, loop="tornado"):
+    """
+    Make `num_requests` requests with a `StubEngine` on an `IOLoop` of the
+    kind named by `loop`, returning the mean time in seconds spent on each by
+    the runner, the tracker and the `IOLoop`.
+
+    """
+    io_loop = loops.new_loop(loop)
+    io_loop.make_current()
+    try:
+        engine = StubEngine(io_loop, concurrency)
+        make_request = lambda **kwargs: httpclient.HTTPRequest("/", **kwargs)
+        runner = runners.QuantityRunner(engine, make_request, num_requests)
+        stats.Tracker(runner, keep_records=False)
+        started = time.time()
+        runner.run()
+        return (time.time() - started) / num_requests
+    finally:
+        ioloop.IOLoop.clear_current()
+        io_loop.close(all_fds=True)
+
+
+def write_case(stdout, case):
+    if not case.get("count"):
+        stdout.write(EMPTY_TEMPLATE.format(**case))
+    else:
+        stdout.write(REPORT_TEMPLATE.format(
+            cpu_us=case["cpu"] * 1e6,
+            memory_mb=case["memory"] * 1e6 / 2 ** 20,
+            **case))
+    stdout.write("\n")
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Measure the load thuum can generate against a stub server.")
+    parser.add_argument(
+        "-n", "--requests",
+        help="Number of requests made by each quantity test.",
+        default=10000,
+        type=int)
+    parser.add_argument(
+        "-c", "--concurrency",
+        help="Number of requests to make concurrently (may be repeated). "
+             "Defaults to 20.",
+        type=int,
+        action="append")
+    parser.add_argument(
+        "-d", "--duration",
+        help="Duration in seconds of each duration, rate and staged test.",
+        default=5.0,
+        type=float)
+    parser.add_argument(
+        "--rate",
+        help="Arrival rate (requests per second) of each rate test.",
+        default=1000.0,
+        type=float)
+    parser.add_argument(
+        "--engine", dest="engines",
+        help="Engine to benchmark (may be repeated). Defaults to all.",
+        choices=engines.ENGINES,
+        action="append")
+    parser.add_argument(
+        "--runner", dest="runners",
+        help="Runner to benchmark (may be repeated). Defaults to quantity.",
+        choices=RUNNERS,
+        action="append")
+    parser.add_argument(
+        "--loop", dest="loops",
+        help="Event loop to benchmark (may be repeated). Defaults to tornado.",
+        choices=loops.LOOPS,
+        action="append")
+    parser.add_argument(
+        "--server",
+        help="Stub server to run against.",
+        choices=SERVERS,
+        default="tornado")
+    parser.add_argument(
+        "--latency",
+        help="Seconds the stub server waits before each response.",
+        default=0.0,
+        type=float)
+    parser.add_argument(
+        "--size",
+        help="Size in bytes of the stub server's response bodies.",
+        default=2,
+        type=int)
+    parser.add_argument(
+        "--output",
+        help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--baseline",
+        help="Compare the results with those of a previous --output.")
+    parser.add_argument(
+        "--tolerance",
+        help="Fraction by which a case's RPS may drop or CPU per request "
+             "grow over the baseline before it is a regression.",
+        default=0.1,
+        type=float)
+    parser.add_argument(
+        "--overhead",
+        help="Measure thuum's own overhead per request with a stub engine.",
+        action="store_true")
+    return parser
+
+
+def main(argv=sys.argv[1:], stdout=sys.stdout):
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    args.concurrency = args.concurrency or [20]
+    args.loops = args.loops or ["tornado"]
+    unavailable = set(args.loops) - set(loops.available_loops())
+    if unavailable:
+        parser.error("Cannot run on the %s loop here (asyncio requires "
+                     "Python 3 and uvloop requires uvloop)."
+                     % ", ".join(sorted(unavailable)))
+    if args.overhead:
+        for loop in args.loops:
+            overhead = measure_overhead(args.requests, args.concurrency[0], loop)
+            stdout.write(OVERHEAD_TEMPLATE.format(
+                loop=loop, overhead=overhead * 1e6, rps=1 / overhead))
+            stdout.write("\n")
+        return
+    if args.engines and not set(args.engines) <= set(available_engines()):
+        parser.error("The curl engine requires pycurl.")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    process, url = start_server(args.server, args.latency, args.size)
+    cases = []
+    try:
+        stdout.write(HEADER)
+        for engine in args.engines or available_engines():
+            for runner in args.runners or ["quantity"]:
+                for loop in args.loops:
+                    for concurrency in args.concurrency:
+                        case = collections.OrderedDict([
+                            ("engine", engine),
+                            ("runner", runner),
+                            ("loop", loop),
+                            ("concurrency", concurrency),
+                        ])
+                        case.update(run_isolated(
+                            engine, runner, url, concurrency, args, loop) or {})
+                        cases.append(case)
+                        write_case(stdout, case)
+    finally:
+        process.terminate()
+        process.join()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "server": {
+                    "kind": args.server,
+                    "latency": args.latency,
+                    "size": args.size,
+                },
+                "cases": cases,
+            }, f, indent=2)
+
+    if baseline is not None:
+        stdout.write(BASELINE_HEADER)
+        regressed = False
+        for change in compare(cases, baseline, args.tolerance):
+            regressed = regressed or change["regression"]
+            stdout.write(BASELINE_TEMPLATE.format(**dict(
+                change, regression="  REGRESSION" if change["regression"] else "")))
+            stdout.write("\n")
+        if regressed:
+            return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
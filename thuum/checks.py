@@ -0,0 +1,317 @@
+"""
+Checks of the results of a load test, for failing a build on a regression.
+
+Thresholds are conditions the final statistics (see
+`thuum.stats.get_time_stats()`) must meet, such as `p99<200ms`, `rps>500` or
+`errors<0.1%`. Latencies are in seconds unless given in `ms` or `us`, and
+errors (requests that failed, or got a status of 400 or more) are counted, or
+taken as a percentage of all requests when given with `%`.
+
+A baseline is the JSON report of an earlier test. Run-to-run noise easily
+moves a percentile by a few percent, so the latencies of the two tests are
+compared with a one-sided Mann-Whitney U test on their histograms, and the
+test is only a regression if it is significantly slower *and* its median
+latency grew by more than a tolerance.
+
+"""
+
+import collections
+import json
+import math
+import operator
+import re
+
+from thuum import (
+    histogram,
+    stats,
+)
+
+# The p-value below which a test is significantly slower than its baseline.
+SIGNIFICANCE = 0.01
+DEFAULT_TOLERANCE = 0.1
+
+OPERATORS = collections.OrderedDict([
+    ("<=", operator.le),
+    (">=", operator.ge),
+    ("<", operator.lt),
+    (">", operator.gt),
+])
+
+LATENCY_UNITS = {"": 1.0, "s": 1.0, "ms": 1e-3, "us": 1e-6}
+LATENCIES = ("avg", "min", "max")
+
+THRESHOLD_PATTERN = re.compile(
+    r"^\s*([a-z]+[\d.]*)\s*(%s)\s*(\d+(?:\.\d*)?|\.\d+)\s*(s|ms|us|%%)?\s*$"
+    % "|".join(OPERATORS))
+
+CHECK_TEMPLATE = "{threshold:<24}{value:>15}  {outcome}"
+BASELINE_TEMPLATE = (
+    "{label:<24}p50 {p50_change:+.1%}  p99 {p99_change:+.1%}  "
+    "RPS {rps_change:+.1%}  (p={p_value:.4f})  {outcome}")
+EMPTY_BASELINE_TEMPLATE = "{label:<24}no requests completed  {outcome}"
+
+
+class Threshold(collections.namedtuple(
+        "Threshold", ["expression", "metric", "operator", "limit"])):
+    """
+    A condition on a statistic of a test: `metric` (e.g. "p99", "rps" or
+    "error_rate") compared with `limit` (in seconds for latencies, and as a
+    fraction for the error rate) by `operator`, one of `OPERATORS`.
+
+    """
+    def format_value(self, value):
+        if value is None:
+            return "-"
+        if self.metric == "error_rate":
+            return "%.2f%%" % (value * 100)
+        if self.metric in ("errors", "requests"):
+            return "%d" % value
+        if self.metric == "rps":
+            return "%.2f" % value
+        return "%.4fs" % value
+
+
+def parse_threshold(expression):
+    """
+    Parse a threshold such as "p99<200ms", raising `ValueError` if it is
+    invalid.
+
+    """
+    match = THRESHOLD_PATTERN.match(expression)
+    if match is None:
+        raise ValueError(
+            "Invalid threshold %r; expected e.g. p99<200ms, rps>500 or "
+            "errors<0.1%%." % expression)
+
+    metric, comparison, limit, unit = match.groups()
+    limit, unit = float(limit), unit or ""
+    if re.match(r"^p[\d.]+$", metric):
+        try:
+            percentile = float(metric[1:])
+        except ValueError:
+            percentile = None
+        if percentile is None or not 0 < percentile <= 100:
+            raise ValueError("Invalid percentile in threshold %r." % expression)
+        metric = stats.percentile_label(percentile)
+    elif metric == "errors":
+        if unit == "%":
+            metric, limit, unit = "error_rate", limit / 100, ""
+    elif metric not in LATENCIES + ("rps", "requests"):
+        raise ValueError(
+            "Unknown statistic %r in threshold %r; expected a percentile "
+            "(e.g. p99), avg, min, max, rps, requests or errors."
+            % (metric, expression))
+
+    if metric.startswith("p") or metric in LATENCIES:
+        if unit not in LATENCY_UNITS:
+            raise ValueError("Invalid unit in threshold %r." % expression)
+        limit *= LATENCY_UNITS[unit]
+    elif unit:
+        raise ValueError("Invalid unit in threshold %r." % expression)
+    return Threshold(expression.strip(), metric, comparison, limit)
+
+
+def parse_thresholds(value):
+    """
+    Parse a comma-separated list of thresholds.
+
+    """
+    return [parse_threshold(expression) for expression in value.split(",")]
+
+
+def get_value(threshold, time_stats, codes):
+    """
+    The value of the statistic of `threshold` given a test's timing statistics
+    (or `None` if no requests completed) and counts of status codes, or `None`
+    if it has none.
+
+    """
+    errors = sum(count for code, count in codes.items() if code >= 400)
+    if threshold.metric == "errors":
+        return errors
+    if threshold.metric == "error_rate":
+        total = sum(codes.values())
+        return errors / float(total) if total else None
+    if time_stats is None:
+        return 0.0 if threshold.metric == "rps" else None
+    if threshold.metric == "requests":
+        return time_stats["count"]
+    if threshold.metric in time_stats:
+        return time_stats[threshold.metric]
+    return time_stats["percentiles"][threshold.metric]
+
+
+def check_thresholds(thresholds, summary):
+    """
+    Check each of `thresholds` against a `thuum.stats.Summary`, returning a
+    list of dicts of each threshold, the value of its statistic and whether it
+    passed. A threshold on a latency fails if no requests completed.
+
+    """
+    percentiles = sorted(set(
+        float(threshold.metric[1:]) for threshold in thresholds
+        if threshold.metric.startswith("p")))
+    time_stats = stats.get_time_stats(summary, percentiles)
+
+    results = []
+    for threshold in thresholds:
+        value = get_value(threshold, time_stats, summary.codes)
+        results.append({
+            "threshold": threshold.expression,
+            "value": value,
+            "formatted": threshold.format_value(value),
+            "passed": (
+                value is not None
+                and OPERATORS[threshold.operator](value, threshold.limit)),
+        })
+    return results
+
+
+def load_baseline(path):
+    """
+    Read the summary of the JSON report at `path` (its last line), or of a
+    file holding just the summary (e.g. `thuum.api.Result.summary`), raising
+    `ValueError` if it has no latency histogram to compare with.
+
+    """
+    last = None
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                last = line
+    try:
+        summary = json.loads(last or "")
+    except ValueError:
+        raise ValueError("%s is not a JSON report." % path)
+
+    summary = summary.get("summary", summary)
+    if not isinstance(summary, dict) or "histogram" not in summary:
+        raise ValueError(
+            "%s has no latency histogram (it may be from an older version)."
+            % path)
+    if not summary["histogram"]["count"]:
+        raise ValueError("%s has no completed requests." % path)
+    return summary
+
+
+def mann_whitney(baseline, latencies):
+    """
+    One-sided Mann-Whitney U test of whether the values of the histogram
+    `latencies` tend to be greater than those of `baseline`, returning its
+    p-value.
+
+    Equal values (those in equivalent buckets) are ranked as ties, and the p
+    value is that of the normal approximation with tie and continuity
+    corrections, which is close for the number of requests of a load test.
+
+    """
+    counts = collections.defaultdict(lambda: [0, 0])
+    for value, count in baseline.distribution():
+        counts[value][0] += count
+    for value, count in latencies.distribution():
+        counts[value][1] += count
+
+    ranked = 0
+    rank_sum = 0.0
+    ties = 0.0
+    for value in sorted(counts):
+        in_baseline, in_latencies = counts[value]
+        tied = in_baseline + in_latencies
+        rank_sum += in_latencies * (ranked + (tied + 1) / 2.0)
+        ties += float(tied) ** 3 - tied
+        ranked += tied
+
+    n1, n2 = float(baseline.count), float(latencies.count)
+    total = n1 + n2
+    u = rank_sum - n2 * (n2 + 1) / 2
+    variance = n1 * n2 / 12 * ((total + 1) - ties / (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _change(value, base):
+    return value / base - 1 if base else 0.0
+
+
+def compare(summary, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare the latencies of a `thuum.stats.Summary` with those of a baseline
+    (see `load_baseline()`), returning a dict of the change in p50, p99 and
+    RPS, the p-value of `mann_whitney()`, and whether the test regressed:
+    whether it is significantly slower and its median latency more than the
+    fraction `tolerance` higher.
+
+    """
+    latencies = summary.histogram
+    if not latencies.count:
+        return {"p_value": None, "regression": True}
+
+    base = histogram.Histogram.from_dict(baseline["histogram"])
+    if base.significant_figures != latencies.significant_figures:
+        # Bucketed differently, so equivalent latencies would not tie.
+        rebucketed = histogram.Histogram(latencies.significant_figures)
+        for value, count in base.distribution():
+            rebucketed.record(value, count)
+        base = rebucketed
+
+    p_value = mann_whitney(base, latencies)
+    time_stats = stats.get_time_stats(summary, (50, 99))
+    base_stats = baseline["stats"]
+    p50_change = _change(
+        time_stats["percentiles"]["p50"], base.percentile(50))
+    return {
+        "p50_change": p50_change,
+        "p99_change": _change(
+            time_stats["percentiles"]["p99"], base.percentile(99)),
+        "rps_change": _change(time_stats["rps"], base_stats["rps"]),
+        "p_value": p_value,
+        "regression": p_value < SIGNIFICANCE and p50_change > tolerance,
+    }
+
+
+def run_checks(summary, thresholds=(), baseline=None,
+               tolerance=DEFAULT_TOLERANCE):
+    """
+    Check a `thuum.stats.Summary` against `thresholds` and, if given, a
+    baseline, returning a JSON encodable dict of the results of each (see
+    `check_thresholds()` and `compare()`) and whether they all passed.
+
+    """
+    results = {
+        "thresholds": check_thresholds(thresholds, summary),
+        "baseline": None,
+    }
+    if baseline is not None:
+        results["baseline"] = compare(summary, baseline, tolerance)
+    results["passed"] = (
+        all(result["passed"] for result in results["thresholds"])
+        and not (baseline is not None and results["baseline"]["regression"]))
+    return results
+
+
+def write_checks(stream, results):
+    """
+    Write the results of `run_checks()` to `stream`, one check per line.
+
+    """
+    stream.write("\n")
+    for result in results["thresholds"]:
+        stream.write(CHECK_TEMPLATE.format(
+            threshold=result["threshold"],
+            value=result["formatted"],
+            outcome="ok" if result["passed"] else "FAILED"))
+        stream.write("\n")
+
+    comparison = results["baseline"]
+    if comparison is not None:
+        outcome = "REGRESSION" if comparison["regression"] else "ok"
+        if comparison["p_value"] is None:
+            line = EMPTY_BASELINE_TEMPLATE.format(
+                label="Baseline", outcome=outcome)
+        else:
+            line = BASELINE_TEMPLATE.format(
+                label="Baseline", outcome=outcome, **comparison)
+        stream.write(line)
+        stream.write("\n")
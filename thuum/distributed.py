@@ -0,0 +1,333 @@
+"""
+Distribution of a load test across several hosts.
+
+An `Agent` waits for a controller to connect and send it the plan of a test,
+runs its share of the test with a runner of its own and streams `Digest`s of
+the requests it completes back to the controller. A `Controller` sends the
+same plan to every agent, starts them all at the same moment, and re-emits
+what they send so that a single tracker can summarize the whole run.
+
+Messages are `[kind, payload]` pairs encoded as JSON, one per line.
+
+Agents run whatever test a controller sends them, without authenticating it,
+so they must only be reachable from trusted hosts. By default they only
+accept connections from their own host.
+
+"""
+
+import json
+import socket
+import time
+
+from pyee import EventEmitter
+from tornado import (
+    gen,
+    ioloop,
+    iostream,
+    tcpclient,
+)
+
+from thuum import (
+    loops,
+    runners,
+    stats,
+)
+
+DEFAULT_ADDRESS = "127.0.0.1"
+DEFAULT_PORT = 7711
+FLUSH_INTERVAL = 500
+
+# Seconds between sending a plan and the agents starting, giving every agent
+# time to receive it and prepare its runner.
+START_DELAY = 1.0
+
+
+class AgentError(Exception):
+    pass
+
+
+def encode(kind, payload):
+    return (json.dumps([kind, payload]) + "\n").encode("utf-8")
+
+
+def decode_plan(line):
+    """
+    Decode the message of a controller planning a test, raising `AgentError`
+    if it is not a valid plan.
+
+    """
+    try:
+        kind, plan = json.loads(line.decode("utf-8"))
+    except (ValueError, TypeError):
+        raise AgentError("Invalid message; expected a JSON [kind, payload] line.")
+    if kind != "plan" or not isinstance(plan, dict):
+        raise AgentError("Invalid message; expected a plan.")
+    try:
+        plan["start_in"] = float(plan["start_in"])
+        plan["agent"], plan["agents"] = int(plan["agent"]), int(plan["agents"])
+    except (KeyError, TypeError, ValueError):
+        raise AgentError("Invalid plan; expected start_in, agent and agents.")
+    if not 0 <= plan["agent"] < plan["agents"]:
+        raise AgentError("Invalid plan; agent is not one of the agents.")
+    return plan
+
+
+def parse_address(value, default_port=DEFAULT_PORT):
+    """
+    Split a "host[:port]" string into a `(host, port)` pair.
+
+    """
+    host, _, port = value.rpartition(":")
+    if not host:
+        return value, default_port
+    return host, int(port)
+
+
+class Agent(object):
+    """
+    Runs the tests planned by controllers, one at a time.
+
+    `prepare` is called with the plan of each test (a dict, to which the
+    index of this agent among the test's `agents` is added as `agent`) while
+    a new `IOLoop` (of the kind named by `loop`, see `thuum.loops`) is
+    current, and must return a `(runner, tracker)` pair bound to it, or raise
+    `AgentError` if the test cannot be run here. A controller sending an
+    invalid plan is sent an error, and the agent goes on serving others.
+
+    """
+    def __init__(self, prepare, address=DEFAULT_ADDRESS, port=DEFAULT_PORT,
+                 loop="tornado"):
+        self.prepare = prepare
+        self.loop = loop
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((address, port))
+        self.socket.listen(1)
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def serve(self, tests=None):
+        """
+        Run the tests of each controller that connects, stopping after
+        `tests` tests if given.
+
+        """
+        while tests is None or tests > 0:
+            connection, _ = self.socket.accept()
+            try:
+                self.handle(connection)
+            finally:
+                connection.close()
+            if tests is not None:
+                tests -= 1
+
+    def close(self):
+        self.socket.close()
+
+    def handle(self, connection):
+        received = time.time()
+        line = connection.makefile("rb").readline()
+        if not line:
+            return
+        try:
+            plan = decode_plan(line)
+        except AgentError as error:
+            try:
+                connection.sendall(encode("error", str(error)))
+            except socket.error:
+                pass
+            return
+
+        io_loop = loops.new_loop(self.loop)
+        io_loop.make_current()
+
+        def send(kind, payload):
+            try:
+                connection.sendall(encode(kind, payload))
+            except socket.error:
+                # The controller has gone away; abandon the test.
+                io_loop.stop()
+
+        try:
+            try:
+                runner, tracker = self.prepare(plan)
+            except AgentError as error:
+                send("error", str(error))
+                return
+
+            digest = stats.Digest(tracker)
+
+            def flush():
+                tracker.update_windows()
+                if digest.count:
+                    send("digest", digest.take())
+
+            runner.events.on(
+                "stage_started",
+                lambda index, stage: send("stage_started", (index, stage)))
+            ioloop.PeriodicCallback(flush, FLUSH_INTERVAL, io_loop).start()
+
+            time.sleep(max(0, plan["start_in"] - (time.time() - received)))
+            runner.run()
+            flush()
+            send("finished", dict(tracker.counters))
+        finally:
+            ioloop.IOLoop.clear_current()
+            io_loop.close(all_fds=True)
+
+
+class Controller(object):
+    """
+    Runs a load test on several agents, presenting the same `events` and
+    `progress()` interface as a runner.
+
+    `plan` (a JSON serializable dict) is sent to every agent in `agents` (a
+    list of `(host, port)` pairs) along with the delay after which all of them
+    start. Each agent's digests are emitted as "digest_received" and its
+    counters as "counters_received"; "stage_started" is emitted when the
+    first agent starts each stage of a staged test, with the corresponding
+    stage of `stages` if given. `run()` raises `AgentError` if an agent could
+    not be reached or could not run the test.
+
+    """
+    def __init__(self, agents, plan, num_requests=None, duration=None,
+                 stages=None, start_delay=START_DELAY):
+        assert agents
+        assert (num_requests is None) != (duration is None)
+
+        self.agents = agents
+        self.plan = plan
+        self.io_loop = ioloop.IOLoop.current()
+        self.events = EventEmitter()
+        self.error = None
+        self._tcp_client = tcpclient.TCPClient(io_loop=self.io_loop)
+        self._start_delay = start_delay
+        self._total = num_requests
+        self._duration = duration
+        self._stages = stages
+        self._stage = -1
+        self._completed = 0
+        self._started = None
+        self._streams = []
+
+    def _tests_started(self):
+        if self._started is None:
+            self._started = time.time()
+            self.events.emit("tests_started")
+
+    def _fail(self, error):
+        """
+        End the test with `error`, closing the connections to every agent so
+        that `_run()` finishes.
+
+        """
+        if self.error is None:
+            self.error = error
+        for stream in self._streams:
+            stream.close()
+
+    @gen.coroutine
+    def _run(self):
+        started = None
+        try:
+            for host, port in self.agents:
+                try:
+                    stream = yield self._tcp_client.connect(host, port)
+                except (iostream.StreamClosedError, socket.error) as error:
+                    self._fail("Cannot connect to agent %s:%d: %s" % (
+                        host, port, error))
+                    return
+                self._streams.append(stream)
+
+            connected = list(zip(self.agents, self._streams))
+            for index, (agent, stream) in enumerate(connected):
+                plan = dict(
+                    self.plan,
+                    agent=index,
+                    agents=len(self._streams),
+                    start_in=self._start_delay)
+                try:
+                    yield stream.write(encode("plan", plan))
+                except iostream.StreamClosedError:
+                    self._fail("Lost connection to agent %s:%d" % agent)
+                    return
+
+            started = self.io_loop.call_later(
+                self._start_delay, self._tests_started)
+            yield [self._receive(agent, stream) for agent, stream in connected]
+        finally:
+            if started is not None:
+                self.io_loop.remove_timeout(started)
+            # Stopped only here, once: stopping the loop again once it has
+            # stopped would end its next run as soon as it starts.
+            self.io_loop.stop()
+
+    @gen.coroutine
+    def _receive(self, agent, stream):
+        while True:
+            try:
+                line = yield stream.read_until(b"\n")
+            except iostream.StreamClosedError:
+                self._fail("Lost connection to agent %s:%d" % agent)
+                return
+
+            try:
+                kind, payload = json.loads(line)
+            except (ValueError, TypeError):
+                self._fail("Bad message from agent %s:%d" % agent)
+                return
+            if kind == "error":
+                self._fail("Agent %s:%d: %s" % (agent + (payload,)))
+                return
+
+            self._tests_started()
+            if kind == "finished":
+                self.events.emit("counters_received", payload)
+                stream.close()
+                return
+            elif kind == "stage_started":
+                index, stage = payload
+                if index > self._stage:
+                    self._stage = index
+                    if self._stages is not None:
+                        stage = self._stages[index]
+                    else:
+                        stage = runners.Stage(*stage)
+                    self.events.emit("stage_started", index, stage)
+            elif kind == "digest":
+                self._completed += payload["count"]
+                self.events.emit("digest_received", payload)
+
+    def run(self):
+        self.io_loop.add_callback(self._run)
+        self.io_loop.start()
+        if self.error is not None:
+            raise AgentError(self.error)
+        self.events.emit("tests_finished")
+
+    def progress(self):
+        if self._started is None:
+            return {
+                "unit": "seconds" if self._duration is not None else "requests",
+                "total": self._duration or self._total,
+                "current": 0,
+                "percentage": 0.0,
+            }
+
+        if self._duration is not None:
+            current = time.time() - self._started
+            return {
+                "unit": "seconds",
+                "total": self._duration,
+                "current": current,
+                "percentage": min(100.0, current / float(self._duration) * 100),
+            }
+
+        return {
+            "unit": "requests",
+            "total": self._total,
+            "current": self._completed,
+            "percentage": min(100.0, self._completed / float(self._total) * 100),
+        }
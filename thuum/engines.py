@@ -0,0 +1,528 @@
+"""
+HTTP engines making the requests of a load test.
+
+Runners only need to start requests, know how many are in flight and how many
+may be, and be told when each has finished; `Engine` is that interface.
+`TornadoEngine` adapts any of Tornado's `AsyncHTTPClient`s (the pure Python
+`SimpleAsyncHTTPClient` or the libcurl based `CurlAsyncHTTPClient`), and
+`RawEngine` is a minimal keep-alive HTTP/1.1 client with far less overhead
+per request, for load tests of plain HTTP requests.
+
+Requests that fail without a response are classified by `classify_error()`.
+
+"""
+
+import abc
+import collections
+import datetime
+import errno
+import socket
+import ssl
+import time
+
+from pyee import EventEmitter
+from tornado import (
+    gen,
+    httpclient,
+    httputil,
+    ioloop,
+    iostream,
+    tcpclient,
+)
+
+try:
+    from urllib import parse as urlparse
+except ImportError:
+    import urlparse
+
+try:
+    from tornado import curl_httpclient
+except ImportError:
+    curl_httpclient = None
+
+ENGINES = ("simple", "curl", "raw")
+
+# Events emitted by engines as each request gets a connection.
+CONNECTION_EVENTS = (
+    "connection_opened",
+    "connection_reused",
+    "connection_failed",
+)
+
+# Methods a request may safely be sent again with, should the idle connection
+# it was sent on turn out to have been closed (RFC 7230, section 6.3.1).
+IDEMPOTENT_METHODS = frozenset(
+    ("DELETE", "GET", "HEAD", "OPTIONS", "PUT", "TRACE"))
+
+# Classes of failure of a request that got no response.
+ERRORS = (
+    "timeout",
+    "refused",
+    "reset",
+    "tls",
+    "dns",
+    "other",
+)
+
+# Classes of failure in which a request's connection failed.
+CONNECTION_ERRORS = ("refused", "reset", "tls", "dns")
+
+SOCKET_ERRORS = {
+    errno.ECONNREFUSED: "refused",
+    errno.ECONNRESET: "reset",
+    errno.ECONNABORTED: "reset",
+    errno.EPIPE: "reset",
+    errno.ETIMEDOUT: "timeout",
+}
+
+# libcurl's error codes (see `curl_easy_strerror`).
+CURL_ERRORS = {
+    5: "dns",
+    6: "dns",
+    7: "refused",
+    28: "timeout",
+    35: "tls",
+    51: "tls",
+    52: "reset",
+    53: "tls",
+    54: "tls",
+    55: "reset",
+    56: "reset",
+    58: "tls",
+    59: "tls",
+    60: "tls",
+    64: "tls",
+    66: "tls",
+    77: "tls",
+    80: "tls",
+    82: "tls",
+    83: "tls",
+    90: "tls",
+    91: "tls",
+}
+
+
+def classify_error(error):
+    """
+    The class (one of `ERRORS`) of the `error` of a response with a code of
+    599, from whichever client or engine made the request.
+
+    """
+    if isinstance(error, iostream.StreamClosedError):
+        if error.real_error is None:
+            # The other end closed the connection.
+            return "reset"
+        error = error.real_error
+    if curl_httpclient is not None and isinstance(error, curl_httpclient.CurlError):
+        return CURL_ERRORS.get(error.errno, "other")
+    if isinstance(error, httpclient.HTTPError):
+        # Tornado's clients report their timeouts as "Timeout while
+        # connecting", "Timeout during request" and so on.
+        if error.code == 599 and (error.message or "").startswith("Timeout"):
+            return "timeout"
+        return "other"
+    if isinstance(error, (socket.timeout, gen.TimeoutError)):
+        return "timeout"
+    if isinstance(error, socket.gaierror):
+        return "dns"
+    if isinstance(error, (ssl.SSLError, ssl.CertificateError)):
+        return "tls"
+    if isinstance(error, socket.error):
+        return SOCKET_ERRORS.get(error.errno, "other")
+    return "other"
+
+
+class Engine(abc.ABCMeta("ABC", (object,), {})):
+    """
+    Makes HTTP requests on an `IOLoop` for a runner.
+
+    At most `max_clients` requests are made at a time, `active` being the
+    number currently in flight; any more are queued until one finishes. As
+    each request gets a connection one of `CONNECTION_EVENTS` is emitted:
+    whether a new connection was opened, an idle one was reused, or the
+    connection failed.
+
+    """
+    def __init__(self, io_loop, max_clients):
+        self.io_loop = io_loop
+        self.max_clients = max_clients
+        self.active = 0
+        self.events = EventEmitter()
+
+    @abc.abstractmethod
+    def fetch(self, request, callback):
+        """
+        Make a request, calling `callback` with its `HTTPResponse` once it is
+        finished. Errors are reported as a response with a code of 599, as
+        with Tornado's clients.
+
+        """
+
+    def close(self):
+        """
+        Release the resources (e.g. connections) held by the engine.
+
+        """
+
+
+def _close_connected(future):
+    """
+    Close the connection of a connection attempt that was given up on.
+
+    """
+    if future.exception() is None:
+        future.result().close()
+
+
+class _ClosedBeforeResponse(iostream.StreamClosedError):
+    """
+    The connection was closed before any of the response was received.
+
+    """
+
+
+def _forbid_reuse(curl):
+    curl.setopt(curl_httpclient.pycurl.FORBID_REUSE, 1)
+    curl.setopt(curl_httpclient.pycurl.FRESH_CONNECT, 1)
+
+
+class TornadoEngine(Engine):
+    """
+    Engine making requests with a Tornado `AsyncHTTPClient`.
+
+    Only the libcurl based client keeps connections alive, and only it can be
+    told not to (by setting `keepalive` to `False`). Whether its requests used
+    a new connection is told by their `time_info`, since curl reports no time
+    spent connecting when a connection is reused; every request of the simple
+    client opens a new connection. A request that failed without a response
+    is counted as a failed connection if its connection was refused, reset or
+    could not be made secure or resolved; those that timed out or failed
+    otherwise are not counted, since the clients do not tell whether they got
+    a connection.
+
+    """
+    def __init__(self, client, keepalive=None):
+        super(TornadoEngine, self).__init__(client.io_loop, client.max_clients)
+        self.client = client
+        self.keepalive = keepalive
+
+    def _on_response(self, response, callback):
+        self.active -= 1
+        if response.code == 599:
+            if classify_error(response.error) in CONNECTION_ERRORS:
+                self.events.emit("connection_failed")
+        elif response.time_info.get("connect", 1) > 0:
+            self.events.emit("connection_opened")
+        else:
+            self.events.emit("connection_reused")
+        callback(response)
+
+    def fetch(self, request, callback):
+        if self.keepalive is False and curl_httpclient is not None:
+            request.prepare_curl_callback = _forbid_reuse
+
+        self.active += 1
+        self.client.fetch(
+            request,
+            callback=lambda response: self._on_response(response, callback))
+
+    def close(self):
+        self.client.close()
+
+
+class RawEngine(Engine):
+    """
+    Engine making plain HTTP/1.1 requests over kept-alive connections.
+
+    The request line, headers and body of a request are sent exactly as given
+    (with a Host and Content-Length header added if missing), and are encoded
+    only once when the same request object is fetched repeatedly (e.g. from a
+    `thuum.sources.RequestPool`). Responses are read using their
+    Content-Length or chunked encoding; redirects are not followed, and HTTPS
+    and proxies are not supported. As with Tornado's clients, a request's
+    `connect_timeout` limits how long opening a connection for it may take,
+    and its `request_timeout` how long it may take in all; unlike them,
+    neither is limited by default.
+
+    Unless `keepalive` is `False`, in which case every request is sent with
+    "Connection: close", connections are kept open for reuse by later
+    requests. No more than `max_connections` are open at once: requests are
+    limited to that many in flight, and idle connections to other hosts are
+    closed to make way for new ones. A request sent on an idle connection that
+    the server closed before responding is sent again on a new connection,
+    but only if its method is idempotent.
+
+    """
+    def __init__(self, io_loop, max_clients, keepalive=True,
+                 max_connections=None):
+        if max_connections:
+            max_clients = min(max_clients, max_connections)
+        super(RawEngine, self).__init__(io_loop, max_clients)
+        self.keepalive = keepalive
+        self.max_connections = max_connections
+        self._tcp_client = tcpclient.TCPClient(io_loop=io_loop)
+        self._idle = collections.defaultdict(list)
+        self._queue = collections.deque()
+        self._connections = 0
+
+    def fetch(self, request, callback):
+        if self.active >= self.max_clients:
+            self._queue.append((request, callback))
+            return
+        self.active += 1
+        self.io_loop.add_future(
+            self._fetch(request),
+            lambda future: self._on_fetched(future, request, callback))
+
+    def _on_fetched(self, future, request, callback):
+        self.active -= 1
+        if self._queue:
+            self.fetch(*self._queue.popleft())
+        try:
+            response = future.result()
+        except Exception as error:
+            response = httpclient.HTTPResponse(request, 599, error=error)
+        callback(response)
+
+    def _encode(self, request):
+        """
+        The address to send a request to and its encoded bytes.
+
+        """
+        cached = getattr(request, "_raw_encoding", None)
+        if cached is not None:
+            return cached
+
+        url = urlparse.urlsplit(request.url)
+        if url.scheme != "http":
+            raise ValueError("Only http URLs are supported, not %r." % request.url)
+
+        target = url.path or "/"
+        if url.query:
+            target += "?" + url.query
+
+        headers = httputil.HTTPHeaders(request.headers)
+        headers.setdefault("Host", url.netloc)
+        if not self.keepalive:
+            headers["Connection"] = "close"
+        body = httputil.utf8(request.body or "")
+        if body or request.method in ("PATCH", "POST", "PUT"):
+            headers.setdefault("Content-Length", str(len(body)))
+
+        lines = ["%s %s HTTP/1.1" % (request.method, target)]
+        lines.extend("%s: %s" % (name, value) for name, value in headers.get_all())
+        data = httputil.utf8("\r\n".join(lines)) + b"\r\n\r\n" + body
+
+        encoded = (url.hostname, url.port or 80), data
+        request._raw_encoding = encoded
+        return encoded
+
+    @gen.coroutine
+    def _fetch(self, request):
+        started = time.time()
+        deadline = None
+        connect_timeout = request.connect_timeout
+        if request.request_timeout:
+            deadline = self.io_loop.time() + request.request_timeout
+            connect_timeout = min(
+                connect_timeout or request.request_timeout,
+                request.request_timeout)
+        stream = None
+        try:
+            address, data = self._encode(request)
+            if self._idle[address]:
+                stream = self._idle[address].pop()
+                try:
+                    result = yield self._timed_exchange(stream, data, request, deadline)
+                    self.events.emit("connection_reused")
+                except _ClosedBeforeResponse:
+                    # The server may have closed the idle connection.
+                    if request.method not in IDEMPOTENT_METHODS:
+                        raise
+                    self._close(stream)
+                    stream = None
+
+            if stream is None:
+                stream = yield self._connect(address, connect_timeout)
+                result = yield self._timed_exchange(stream, data, request, deadline)
+            code, reason, headers, keep_alive = result
+        except (iostream.StreamClosedError, httputil.HTTPInputError,
+                httpclient.HTTPError, socket.error, ValueError) as error:
+            if stream is not None:
+                if not isinstance(error, httpclient.HTTPError):
+                    self.events.emit("connection_failed")
+                self._close(stream)
+            raise gen.Return(httpclient.HTTPResponse(
+                request,
+                599,
+                error=error,
+                request_time=time.time() - started))
+
+        if keep_alive and self.keepalive:
+            self._idle[address].append(stream)
+        else:
+            self._close(stream)
+
+        raise gen.Return(httpclient.HTTPResponse(
+            request,
+            code,
+            headers=headers,
+            reason=reason,
+            request_time=time.time() - started))
+
+    @gen.coroutine
+    def _connect(self, address, timeout=None):
+        if self.max_connections and self._connections >= self.max_connections:
+            self._evict()
+
+        connecting = self._tcp_client.connect(*address)
+        try:
+            if timeout:
+                stream = yield gen.with_timeout(
+                    datetime.timedelta(seconds=timeout),
+                    connecting,
+                    self.io_loop,
+                    quiet_exceptions=(iostream.StreamClosedError, socket.error))
+            else:
+                stream = yield connecting
+        except gen.TimeoutError:
+            self.events.emit("connection_failed")
+            self.io_loop.add_future(connecting, _close_connected)
+            raise httpclient.HTTPError(599, "Timeout while connecting")
+        except (iostream.StreamClosedError, socket.error):
+            self.events.emit("connection_failed")
+            raise
+
+        stream.set_nodelay(True)
+        self._connections += 1
+        self.events.emit("connection_opened")
+        raise gen.Return(stream)
+
+    def _evict(self):
+        """
+        Close an idle connection to make way for a new one.
+
+        """
+        for streams in self._idle.values():
+            if streams:
+                self._close(streams.pop(0))
+                return
+
+    def _close(self, stream):
+        stream.close()
+        self._connections -= 1
+
+    @gen.coroutine
+    def _timed_exchange(self, stream, data, request, deadline=None):
+        """
+        `_exchange()` a request, closing the connection if it has not finished
+        by the `IOLoop` time `deadline`.
+
+        """
+        if deadline is None:
+            result = yield self._exchange(stream, data, request)
+            raise gen.Return(result)
+
+        timed_out = []
+
+        def on_timeout():
+            timed_out.append(True)
+            stream.close()
+
+        timeout = self.io_loop.call_at(deadline, on_timeout)
+        try:
+            result = yield self._exchange(stream, data, request)
+        except iostream.StreamClosedError:
+            if timed_out:
+                raise httpclient.HTTPError(599, "Timeout during request")
+            raise
+        finally:
+            self.io_loop.remove_timeout(timeout)
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def _exchange(self, stream, data, request):
+        """
+        Send a request's data and read its response, returning the response's
+        code, reason, headers and whether the connection may be kept alive.
+
+        """
+        on_chunk = request.streaming_callback or (lambda chunk: None)
+
+        try:
+            yield stream.write(data)
+            header_data = yield stream.read_until(b"\r\n\r\n")
+        except iostream.StreamClosedError as error:
+            raise _ClosedBeforeResponse(real_error=error.real_error)
+        start_line, _, header_data = header_data.partition(b"\r\n")
+        start_line = httputil.parse_response_start_line(start_line)
+        headers = httputil.HTTPHeaders.parse(header_data.decode("latin1"))
+
+        keep_alive = (
+            start_line.version == "HTTP/1.1"
+            and headers.get("Connection", "").lower() != "close")
+
+        if request.method == "HEAD" or start_line.code in (204, 304):
+            pass
+        elif headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = yield stream.read_until(b"\r\n")
+                size = int(size.split(b";")[0], 16)
+                if size == 0:
+                    # Skip any trailers up to the final empty line.
+                    while (yield stream.read_until(b"\r\n")) != b"\r\n":
+                        pass
+                    break
+                chunk = yield stream.read_bytes(size + 2)
+                on_chunk(chunk[:-2])
+        elif "Content-Length" in headers:
+            length = int(headers["Content-Length"])
+            if length:
+                yield stream.read_bytes(length, streaming_callback=on_chunk)
+        else:
+            keep_alive = False
+            yield stream.read_until_close(streaming_callback=on_chunk)
+
+        raise gen.Return(
+            (start_line.code, start_line.reason, headers, keep_alive))
+
+    def close(self):
+        for streams in self._idle.values():
+            for stream in streams:
+                self._close(stream)
+        self._idle.clear()
+
+
+def get_engine(name, max_clients, io_loop=None, keepalive=None,
+               max_connections=None):
+    """
+    Create the named engine (one of `ENGINES`) on `io_loop`, defaulting to the
+    current `IOLoop`. The "curl" engine requires `pycurl`.
+
+    `keepalive` (when not `None`) and `max_connections` control the reuse and
+    number of connections. Tornado's clients open a connection per request in
+    flight, so for them `max_connections` only limits `max_clients`.
+
+    """
+    assert name in ENGINES
+    io_loop = io_loop or ioloop.IOLoop.current()
+
+    if name == "raw":
+        return RawEngine(
+            io_loop,
+            max_clients,
+            keepalive=keepalive is not False,
+            max_connections=max_connections)
+
+    if max_connections:
+        max_clients = min(max_clients, max_connections)
+
+    client_class = None
+    if name == "curl":
+        assert curl_httpclient is not None, "curl engine requires pycurl"
+        client_class = curl_httpclient.CurlAsyncHTTPClient
+
+    httpclient.AsyncHTTPClient.configure(client_class, max_clients=max_clients)
+    return TornadoEngine(
+        httpclient.AsyncHTTPClient(io_loop=io_loop),
+        keepalive=keepalive)
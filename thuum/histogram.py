@@ -0,0 +1,249 @@
+"""
+Fixed-memory, log-bucketed histogram of latencies.
+
+Values are stored in the spirit of HdrHistogram: each power of two range of
+values is divided into the same number of linear sub-buckets, so the relative
+error of any value read back from the histogram is bounded by the configured
+number of significant figures no matter how large it is. Memory use depends
+only on that precision and on the range of recorded values, never on how many
+values were recorded.
+
+"""
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_SIGNIFICANT_FIGURES = 2
+DEFAULT_UNIT = 1e-6
+
+
+class Histogram(object):
+    """
+    Histogram of non-negative values (seconds, by default resolved to the
+    microsecond) accurate to `significant_figures`.
+
+    Besides the bucket counts the exact count, minimum, maximum, mean and
+    variance of recorded values are maintained so that only percentiles are
+    approximate.
+
+    """
+    def __init__(self, significant_figures=DEFAULT_SIGNIFICANT_FIGURES,
+                 unit=DEFAULT_UNIT):
+        assert 1 <= significant_figures <= 5
+        self.significant_figures = significant_figures
+        self.unit = unit
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._bits = int(math.ceil(math.log(2 * 10 ** significant_figures, 2)))
+        self._mask = (1 << self._bits) - 1
+        self._counts = {}
+
+    def _index(self, value):
+        units = max(0, int(value / self.unit))
+        shift = max(0, units.bit_length() - self._bits)
+        return (shift << self._bits) | (units >> shift)
+
+    def _bounds(self, index):
+        """
+        The lowest and highest values (in units) equivalent to a bucket.
+
+        """
+        shift = index >> self._bits
+        sub_bucket = index & self._mask
+        return sub_bucket << shift, ((sub_bucket + 1) << shift) - 1
+
+    def _value_at(self, index):
+        """
+        The value reported for a bucket: as in HdrHistogram, the highest value
+        equivalent to it (but never more than the largest recorded value), so
+        percentiles err on the side of being slower.
+
+        """
+        _, highest = self._bounds(index)
+        return max(self.min, min(self.max, (highest + 1) * self.unit))
+
+    @property
+    def buckets(self):
+        return len(self._counts)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def variance(self):
+        """
+        Population variance of the recorded values.
+
+        """
+        return self._m2 / self.count if self.count else None
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance) if self.count else None
+
+    def record(self, value, count=1):
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + count
+
+        if self.count == 0:
+            self.min = self.max = value
+        else:
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+        # Welford's online algorithm, generalized for repeated values.
+        previous = self.count
+        self.count += count
+        self.total += value * count
+        delta = value - self._mean
+        self._mean += delta * count / self.count
+        self._m2 += delta * delta * previous * count / self.count
+
+    def record_many(self, values):
+        """
+        Record a sequence of values. With NumPy installed the values (which
+        may be any array-like, e.g. an `array.array`) are bucketed in bulk.
+
+        """
+        if numpy is None:
+            for value in values:
+                self.record(value)
+            return
+
+        values = numpy.asarray(values, dtype=float)
+        if not len(values):
+            return
+
+        units = numpy.maximum(0, values / self.unit).astype(numpy.int64)
+        # The exponent from `frexp` is the bit length of a positive integer.
+        shift = numpy.maximum(0, numpy.frexp(units)[1] - self._bits)
+        indices = (shift << self._bits) | (units >> shift)
+        buckets, counts = numpy.unique(indices, return_counts=True)
+
+        batch = Histogram(self.significant_figures, self.unit)
+        batch._counts = dict(zip(buckets.tolist(), counts.tolist()))
+        batch.count = len(values)
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        batch.total = float(values.sum())
+        batch._mean = batch.total / batch.count
+        batch._m2 = float(((values - batch._mean) ** 2).sum())
+        self.merge(batch)
+
+    def merge(self, other):
+        """
+        Add all values recorded by `other` to this histogram.
+
+        """
+        assert other.unit == self.unit
+        assert other.significant_figures == self.significant_figures
+        if other.count == 0:
+            return
+
+        for index, count in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + count
+
+        if self.count == 0:
+            self.min, self.max = other.min, other.max
+        else:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+
+        count = self.count + other.count
+        delta = other._mean - self._mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self._mean += delta * other.count / count
+        self.total += other.total
+        self.count = count
+
+    def to_dict(self):
+        """
+        The state of the histogram as a JSON serializable dict, from which
+        `from_dict()` builds an equal histogram.
+
+        """
+        return {
+            "significant_figures": self.significant_figures,
+            "unit": self.unit,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "total": self.total,
+            "mean": self._mean,
+            "m2": self._m2,
+            "counts": sorted(self._counts.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        histogram = cls(state["significant_figures"], state["unit"])
+        histogram.count = state["count"]
+        histogram.min = state["min"]
+        histogram.max = state["max"]
+        histogram.total = state["total"]
+        histogram._mean = state["mean"]
+        histogram._m2 = state["m2"]
+        histogram._counts = dict(
+            (index, count) for index, count in state["counts"])
+        return histogram
+
+    def percentiles(self, percentiles):
+        """
+        Return a `{percentile: value}` mapping for the given percentiles
+        (0-100) in a single pass over the buckets.
+
+        """
+        if self.count == 0:
+            return dict((p, None) for p in percentiles)
+
+        wanted = sorted(percentiles)
+        results = {}
+        seen = 0
+        position = 0
+
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            while position < len(wanted):
+                percentile = wanted[position]
+                rank = max(1, int(math.ceil(percentile / 100.0 * self.count)))
+                if rank > seen:
+                    break
+                results[percentile] = self._value_at(index)
+                position += 1
+
+        for percentile in wanted[position:]:
+            results[percentile] = self.max
+
+        for percentile in wanted:
+            if percentile == 100:
+                results[percentile] = self.max
+            elif percentile == 0:
+                results[percentile] = self.min
+
+        return results
+
+    def percentile(self, percentile):
+        return self.percentiles([percentile])[percentile]
+
+    def distribution(self):
+        """
+        The recorded values as `(value, count)` pairs in order of value, each
+        value being the middle of its bucket, so that histograms of the same
+        precision give equal values for equivalent buckets.
+
+        """
+        distribution = []
+        for index in sorted(self._counts):
+            lowest, highest = self._bounds(index)
+            value = (lowest + highest + 1) / 2.0 * self.unit
+            distribution.append((value, self._counts[index]))
+        return distribution
@@ -0,0 +1,97 @@
+"""
+Event loops to run load tests on.
+
+Runners, engines and trackers only use the interface of Tornado's `IOLoop`,
+so a test runs the same on Tornado's own loop or, through Tornado's
+`tornado.platform.asyncio` bridge, on an asyncio event loop: the standard
+library's, or uvloop's faster one when it is installed. asyncio requires
+Python 3.
+
+`new_loop()` creates a loop of one of these kinds for a test of its own, and
+`attach()` gives the `IOLoop` of an asyncio loop that is already running,
+such as that of an application or test harness, so that a test can be
+`start()`ed from one of its coroutines:
+
+    io_loop = loops.attach()
+    engine = engines.get_engine("raw", 10, io_loop)
+    runner = runners.QuantityRunner(engine, make_request, 1000)
+    tracker = stats.Tracker(runner)
+    await loops.start(runner)
+
+"""
+
+from tornado import (
+    concurrent,
+    ioloop,
+)
+
+try:
+    import asyncio
+    from tornado.platform import asyncio as tornado_asyncio
+except ImportError:
+    asyncio = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+LOOPS = ("tornado", "asyncio", "uvloop")
+
+
+def available_loops():
+    """
+    The names of the loops (of `LOOPS`) that can be used here.
+
+    """
+    names = ["tornado"]
+    if asyncio is not None:
+        names.append("asyncio")
+        if uvloop is not None:
+            names.append("uvloop")
+    return names
+
+
+def new_loop(name="tornado"):
+    """
+    Create an `IOLoop` of the named kind (one of `LOOPS`), which is neither
+    made current nor started. Closing it closes its asyncio loop, if any.
+
+    """
+    assert name in LOOPS
+    if name == "tornado":
+        return ioloop.IOLoop()
+
+    assert asyncio is not None, "%s loop requires asyncio" % name
+    if name == "uvloop":
+        assert uvloop is not None, "uvloop loop requires uvloop"
+        event_loop = uvloop.new_event_loop()
+    else:
+        event_loop = asyncio.new_event_loop()
+    return tornado_asyncio.BaseAsyncIOLoop(event_loop, close_loop=True)
+
+
+def attach(event_loop=None):
+    """
+    Make an `IOLoop` running on the asyncio `event_loop` (by default the
+    current one) current and return it, so that engines and runners created
+    afterwards run their tests on that loop.
+
+    """
+    assert asyncio is not None, "attaching to an event loop requires asyncio"
+    io_loop = tornado_asyncio.BaseAsyncIOLoop(
+        event_loop or asyncio.get_event_loop())
+    io_loop.make_current()
+    return io_loop
+
+
+def start(runner):
+    """
+    Start `runner`'s test (see `thuum.runners.Runner.start()`) on an
+    `attach()`ed loop, returning an asyncio `Future` resolved once it has
+    finished.
+
+    """
+    future = runner.engine.io_loop.asyncio_loop.create_future()
+    concurrent.chain_future(runner.start(), future)
+    return future
@@ -0,0 +1,246 @@
+"""
+Live metrics of a load test for monitoring systems, so that thuum's view of
+the target's latency can be graphed next to the target's own metrics.
+
+Both exporters read statistics the `thuum.stats.Tracker` keeps anyway, in
+fixed memory, rather than handling every request themselves:
+
+* `PrometheusExporter` serves the tracker's counts and latency histogram in
+  Prometheus' text format at `/metrics`, from the test's own `IOLoop`. The
+  metrics are only computed when scraped.
+* `StatsdExporter` sends the totals and latency percentiles of each window of
+  the test (see `thuum.stats.Windows`) to a StatsD server, as UDP packets of
+  as many metrics as fit.
+
+"""
+
+import numbers
+import socket
+
+from tornado import (
+    httpserver,
+    web,
+)
+
+from thuum import engines
+
+DEFAULT_STATSD_PORT = 8125
+DEFAULT_PREFIX = "thuum"
+
+# The upper bounds in seconds of the buckets of the latency histogram, as in
+# Prometheus' client libraries.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The StatsD counters sent for each window, and the statistics they are of.
+WINDOW_COUNTERS = (
+    ("requests", "count"),
+    ("errors", "errors"),
+    ("received", "received"),
+)
+
+# Small enough not to be fragmented on most networks.
+MAX_PACKET_SIZE = 1432
+
+COUNTER_HELP = {
+    "late": "Requests started late by the rate runner.",
+    "dropped": "Requests the rate runner could not start.",
+    "connections_opened": "Connections opened.",
+    "connections_reused": "Requests made on a reused connection.",
+    "connections_failed": "Connections that could not be opened.",
+    "bodies_checked": "Response bodies sampled for validation.",
+    "invalid_status": "Responses with an unexpected status.",
+    "invalid_header": "Responses missing an expected header.",
+    "invalid_body": "Response bodies lacking the expected content.",
+}
+
+
+def _summaries(tracker):
+    # Warm-up requests are left out of the statistics of the report, but are
+    # still load on the target.
+    return (tracker.get_summary(), tracker.warmup_summary)
+
+
+def _bucket_counts(histograms, bounds=BUCKETS):
+    """
+    The cumulative number of values of `histograms` at most each of `bounds`,
+    as counted by the middle of each of their buckets.
+
+    """
+    counts = [0] * len(bounds)
+    for latencies in histograms:
+        position = 0
+        for value, count in latencies.distribution():
+            while position < len(bounds) and value > bounds[position]:
+                position += 1
+            if position == len(bounds):
+                break
+            counts[position] += count
+    for position in range(1, len(counts)):
+        counts[position] += counts[position - 1]
+    return counts
+
+
+def _format_value(value):
+    if isinstance(value, numbers.Integral):
+        return "%d" % value
+    return repr(float(value))
+
+
+def render(tracker):
+    """
+    The statistics of `tracker` so far in Prometheus' text exposition format.
+
+    """
+    summaries = _summaries(tracker)
+    lines = []
+
+    def metric(name, kind, help_, samples):
+        lines.append("# HELP %s %s" % (name, help_))
+        lines.append("# TYPE %s %s" % (name, kind))
+        for suffix, labels, value in samples:
+            labels = ",".join('%s="%s"' % label for label in labels)
+            lines.append("%s%s%s %s" % (
+                name, suffix, "{%s}" % labels if labels else "",
+                _format_value(value)))
+
+    codes = {}
+    for summary in summaries:
+        for code, count in summary.codes.items():
+            codes[code] = codes.get(code, 0) + count
+    metric(
+        "thuum_requests_total", "counter",
+        "Requests completed, by status code (599 if they failed).",
+        [("", [("code", code)], count) for code, count in sorted(codes.items())])
+
+    failures = [
+        ("", [("error", error)], sum(
+            summary.failures[error].count
+            for summary in summaries if error in summary.failures))
+        for error in engines.ERRORS
+    ]
+    metric(
+        "thuum_failures_total", "counter",
+        "Requests that failed without a response, by class of error.",
+        [sample for sample in failures if sample[2]])
+
+    histograms = [summary.histogram for summary in summaries]
+    count = sum(latencies.count for latencies in histograms)
+    samples = [
+        ("_bucket", [("le", repr(bound))], cumulative)
+        for bound, cumulative in zip(BUCKETS, _bucket_counts(histograms))]
+    samples.append(("_bucket", [("le", "+Inf")], count))
+    samples.append(("_sum", [], sum(latencies.total for latencies in histograms)))
+    samples.append(("_count", [], count))
+    metric(
+        "thuum_request_duration_seconds", "histogram",
+        "Latency of the requests that got a response.",
+        samples)
+
+    metric(
+        "thuum_received_bytes_total", "counter",
+        "Bytes of response bodies received.",
+        [("", [], sum(summary.received for summary in summaries))])
+
+    for name, value in sorted(tracker.counters.items()):
+        metric(
+            "thuum_%s_total" % name, "counter",
+            COUNTER_HELP.get(name, name.replace("_", " ").capitalize() + "."),
+            [("", [], value)])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(web.RequestHandler):
+    def initialize(self, tracker):
+        self.tracker = tracker
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(render(self.tracker))
+
+
+class PrometheusExporter(object):
+    """
+    Serves the statistics of `tracker` at `/metrics` on `address:port` (for
+    Prometheus to scrape) from the current `IOLoop` until closed.
+
+    """
+    def __init__(self, tracker, port, address="127.0.0.1"):
+        application = web.Application([
+            (r"/metrics", MetricsHandler, {"tracker": tracker}),
+        ])
+        self._server = httpserver.HTTPServer(application)
+        self._server.listen(port, address)
+
+    def close(self):
+        self._server.stop()
+
+
+class StatsdExporter(object):
+    """
+    Sends the statistics of each window of `tracker` to the StatsD server at
+    `host:port` as it finishes, with names starting with `prefix`: the number
+    of requests, errors (a status of 400 or more, including failures) and
+    bytes received and each of the tracker's counters since the last window
+    as counters, and the RPS and p50 and p99 latency (in milliseconds) as
+    gauges.
+
+    Packets are sent without waiting; those that cannot be sent at once are
+    counted in `dropped`.
+
+    """
+    def __init__(self, tracker, host, port=DEFAULT_STATSD_PORT,
+                 prefix=DEFAULT_PREFIX):
+        family, _, _, _, address = socket.getaddrinfo(
+            host, port, 0, socket.SOCK_DGRAM)[0]
+        self.address = address
+        self.prefix = prefix
+        self.dropped = 0
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._tracker = tracker
+        self._counters = {}
+        tracker.events.on("window_finished", self.window)
+
+    def get_metrics(self, window):
+        """
+        The StatsD metrics ("name:value|type") of a window.
+
+        """
+        metrics = [
+            "%s.%s:%d|c" % (self.prefix, name, window[field])
+            for name, field in WINDOW_COUNTERS
+        ]
+        metrics.append("%s.rps:%.2f|g" % (self.prefix, window["rps"]))
+        for label in ("p50", "p99"):
+            if window[label] is not None:
+                metrics.append("%s.latency.%s:%.3f|g" % (
+                    self.prefix, label, window[label] * 1000))
+
+        for name, value in sorted(self._tracker.counters.items()):
+            change = value - self._counters.get(name, 0)
+            self._counters[name] = value
+            if change:
+                metrics.append("%s.%s:%d|c" % (self.prefix, name, change))
+        return metrics
+
+    def window(self, window):
+        packet = []
+        size = 0
+        for metric in self.get_metrics(window):
+            if packet and size + len(metric) + 1 > MAX_PACKET_SIZE:
+                self._send(packet)
+                packet, size = [], 0
+            packet.append(metric)
+            size += len(metric) + 1
+        if packet:
+            self._send(packet)
+
+    def _send(self, metrics):
+        try:
+            self._socket.sendto(
+                "\n".join(metrics).encode("utf-8"), self.address)
+        except socket.error:
+            self.dropped += 1
+
+    def close(self):
+        self._socket.close()
@@ -0,0 +1,183 @@
+"""
+Measurement of the load generator's own overhead.
+
+A load test only measures the target while thuum can start requests and
+handle responses as soon as it should. `Monitor` measures how far behind the
+`IOLoop` runs (how late a callback runs after the time it was scheduled for),
+the CPU used by the process, and the time spent dispatching events and in the
+reporters, and judges whether the generator was saturated: whether it used
+nearly all of a CPU, or the loop lagged for a sustained part of the test.
+A single pause (e.g. for garbage collection) delays a single lag sample, so
+it is not taken for saturation.
+
+"""
+
+import functools
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+from tornado import ioloop
+
+from thuum import histogram
+
+LAG_INTERVAL = 0.05
+
+# Past either of these the generator was likely too busy to start requests or
+# time responses promptly, so the results may reflect thuum rather than the
+# target. The lag is that of the `LAG_PERCENTILE` of samples, and is only
+# judged once there are `MIN_LAG_SAMPLES` of them.
+LAG_THRESHOLD = 0.01
+LAG_PERCENTILE = 90
+MIN_LAG_SAMPLES = 20
+CPU_THRESHOLD = 90.0
+
+# The per-request events of runners (and of worker pools and controllers,
+# which receive their records) in which the time spent is "dispatch".
+DISPATCHED_EVENTS = (
+    "request_ready",
+    "request_started",
+    "request_finished",
+    "record_received",
+    "digest_received",
+)
+OBSERVED_EVENTS = ("request_ready", "request_started", "request_finished")
+
+
+def cpu_time():
+    """
+    The CPU time used by this process so far, in seconds.
+
+    """
+    if resource is None:
+        # On Windows, `time.clock()` of Python 2 is the wall clock time.
+        if hasattr(time, "process_time"):
+            return time.process_time()
+        return time.clock()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Monitor(object):
+    """
+    Measures the overhead of the test run by `runner`, setting the `overhead`
+    of the tracker it is `attach()`ed to to a dict of the results before the
+    tracker reports the end of the test.
+
+    The event loop's lag is sampled every `interval` seconds. Only this
+    process's CPU use is measured, so the overhead of worker processes or
+    agents is not included. Time spent handling each of `DISPATCHED_EVENTS`
+    (in the runner's observers, the tracker, its listeners and reporters) is
+    measured as "dispatch", and callbacks wrapped with `timed()` are measured
+    under their own name.
+
+    A monitor must be created before anything else observes or listens to
+    `runner`: it notes when each event is dispatched as the runner's first
+    observer (or first listener of the event), and when that has finished as
+    its last listener.
+
+    """
+    def __init__(self, runner, io_loop=None, interval=LAG_INTERVAL):
+        self.io_loop = io_loop or ioloop.IOLoop.current()
+        self.interval = interval
+        self.lag = histogram.Histogram()
+        self.timings = {"dispatch": 0.0}
+        self._runner = runner
+        self._dispatch_started = None
+        self._expected = None
+        self._timeout = None
+        self._started = None
+        self._cpu_started = None
+
+        add_observer = getattr(runner, "add_observer", None)
+        if add_observer is not None:
+            add_observer(self)
+        for event in DISPATCHED_EVENTS:
+            if add_observer is None or event not in OBSERVED_EVENTS:
+                runner.events.on(event, self._dispatching)
+        runner.events.on("tests_started", self.start)
+
+    def attach(self, tracker):
+        """
+        Report the overhead of the test as the `overhead` of `tracker`.
+
+        """
+        tracker.events.on("tests_finished", self.stop)
+
+    def _dispatching(self, *args):
+        self._dispatch_started = time.time()
+
+    def _dispatched(self, *args):
+        if self._dispatch_started is not None:
+            self.timings["dispatch"] += time.time() - self._dispatch_started
+            self._dispatch_started = None
+
+    # Called by the runner as an observer, before the events of the same names.
+    request_ready = request_started = request_finished = _dispatching
+
+    def timed(self, name, function):
+        """
+        Wrap `function` so that the time spent in it is added to the timing
+        called `name`.
+
+        """
+        self.timings.setdefault(name, 0.0)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.timings[name] += time.time() - started
+        return wrapper
+
+    def _schedule(self):
+        self._expected = self.io_loop.time() + self.interval
+        self._timeout = self.io_loop.call_at(self._expected, self._sample)
+
+    def _sample(self):
+        self.lag.record(max(0.0, self.io_loop.time() - self._expected))
+        self._schedule()
+
+    def start(self):
+        if self._started is None:
+            # Listeners added now follow all of those added before the test.
+            for event in DISPATCHED_EVENTS:
+                self._runner.events.on(event, self._dispatched)
+        self._started = time.time()
+        self._cpu_started = cpu_time()
+        self._schedule()
+
+    def stop(self, tracker):
+        if self._timeout is not None:
+            self.io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+        tracker.overhead = self.get_stats()
+
+    def get_stats(self):
+        duration = time.time() - self._started
+        cpu = (cpu_time() - self._cpu_started) / duration * 100 if duration else 0.0
+        lag = self.lag.percentiles([50, LAG_PERCENTILE, 99])
+
+        stats = {
+            "duration": duration,
+            "cpu": cpu,
+            "lag": {
+                "p50": lag[50],
+                "p90": lag[LAG_PERCENTILE],
+                "p99": lag[99],
+                "max": self.lag.max,
+                "samples": self.lag.count,
+            },
+        }
+        stats.update(self.timings)
+        stats["saturated"] = (
+            cpu >= CPU_THRESHOLD
+            or (self.lag.count >= MIN_LAG_SAMPLES
+                and lag[LAG_PERCENTILE] >= LAG_THRESHOLD))
+        return stats
@@ -4,11 +4,21 @@ Encoding of per-request results of a load test useful for further analysis.
 """
 
 import abc
-import collections
 import csv
 import json
+import sys
+import threading
+import time
 
-from thuum import stats
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from thuum import (
+    stats,
+    validation,
+)
 
 FIELDS = (
     "started",
@@ -16,6 +26,8 @@ FIELDS = (
     "code",
     "sent",
     "received",
+    "error",
+    "invalid",
 )
 
 PROGRESS_TEMPLATE = "[{current:.1f}/{total:.1f} {unit}] {percentage:.1f}%"
@@ -28,19 +40,225 @@ Slowest     {max:>15.4f}s
 Deviation   {dev:>15.4f}
 Received    {received:>10}B
 RPS         {rps:>13.2f}"""
+PERCENTILE_TEMPLATE = "{label:<12}{value:>15.4f}s"
+WINDOW_TEMPLATE = (
+    "[{started:>7.1f}s] {count:>8} requests {rps:>10.2f} RPS  "
+    "p50 {p50:>9}  p99 {p99:>9}  {errors} errors  {received}B")
+WARMUP_TEMPLATE = (
+    "Warm-up     {count:10} requests excluded "
+    "(avg {avg:.4f}s, slowest {max:.4f}s)")
+STAGE_TEMPLATE = "{stage:<7}{duration:>10.1f}s{target:>11g}"
+OVERHEAD_TEMPLATE = (
+    "Generator   CPU {cpu:.0f}%, loop lag p90 {lag[p90]:.4f}s, "
+    "p99 {lag[p99]:.4f}s (max {lag[max]:.4f}s), dispatch {dispatch:.2f}s, "
+    "reporters {reporters:.2f}s")
+SATURATION_WARNING = (
+    "Warning: the load generator was saturated, so these results may "
+    "reflect thuum rather than the target. Try more --workers or agents.\n")
+UNWRITTEN_WARNING = (
+    "Warning: {count} records were not written because the output could "
+    "not keep up with the test.\n")
+
+# Records are handed to the writer thread in batches of up to `BATCH_SIZE`,
+# or whatever has accumulated after `BATCH_INTERVAL` seconds, and at most
+# `MAX_BATCHES` batches may be waiting to be written.
+BATCH_SIZE = 500
+BATCH_INTERVAL = 0.5
+MAX_BATCHES = 200
+
+PHASE_LABELS = {
+    "queue": "Queue",
+    "dns": "DNS",
+    "connect": "Connect",
+    "tls": "TLS",
+    "ttfb": "First byte",
+    "transfer": "Transfer",
+}
+
+FAILURE_LABELS = {
+    "timeout": "Timeout",
+    "refused": "Refused",
+    "reset": "Reset",
+    "tls": "TLS",
+    "dns": "DNS",
+    "other": "Other",
+}
+
+COUNTER_LABELS = {
+    "late": "Late starts",
+    "dropped": "Dropped starts",
+    "connections_opened": "Connections opened",
+    "connections_reused": "Connections reused",
+    "connections_failed": "Connections failed",
+    "bodies_checked": "Bodies checked",
+    "invalid_status": "Invalid status",
+    "invalid_header": "Invalid header",
+    "invalid_body": "Invalid body",
+}
 
 
 def filter_record(record):
-    record = record.__dict__
-    record = dict([(k, v) for k, v in record.iteritems() if k in FIELDS])
-    return record
+    return dict((field, getattr(record, field)) for field in FIELDS)
+
+
+class BackgroundWriter(object):
+    """
+    Calls `write` with batches of the items given to `add()` from a
+    background thread, so that encoding and writing them to a slow disk or
+    pipe does not hold up the `IOLoop` making the requests.
+
+    The queue of batches is bounded: rather than blocking the test when the
+    writer has fallen that far behind, a batch that does not fit is discarded
+    and its items counted in `dropped`. `join()` waits for every batch queued
+    so far to be written.
+
+    """
+    def __init__(self, write, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+        self.write = write
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(max_batches)
+        self._batch = []
+        self._batch_started = None
+        self._thread = None
+
+    def add(self, item):
+        if not self._batch:
+            self._batch_started = time.time()
+        self._batch.append(item)
+        if (len(self._batch) >= self.batch_size
+                or time.time() - self._batch_started >= BATCH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        """
+        Queue the items added since the last batch.
 
-class BaseReporter(object):
+        """
+        if not self._batch:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+        try:
+            self._queue.put_nowait(self._batch)
+        except queue.Full:
+            self.dropped += len(self._batch)
+        self._batch = []
+
+    def join(self):
+        self.flush()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            self.write(batch)
+
+class BaseReporter(abc.ABCMeta("ABC", (object,), {})):
     """
     Base class for turning `thuum.stats.Record` objects into textual reports.
 
     """
-    __metaclass__ = abc.ABCMeta
+    def __init__(self, stream, percentiles=stats.DEFAULT_PERCENTILES):
+        self.stream = stream
+        self.percentiles = percentiles
+
+    def get_time_stats(self, tracker):
+        """
+        Timing statistics (including the configured percentiles) for the
+        requests completed by the given tracker.
+
+        """
+        return stats.get_time_stats(tracker.get_summary(), self.percentiles)
+
+    def get_warmup_stats(self, tracker):
+        """
+        Timing statistics for the requests the given tracker excluded from
+        its summary as warm-up, if there were any.
+
+        """
+        return stats.get_time_stats(tracker.warmup_summary, self.percentiles)
+
+    def get_failure_stats(self, tracker):
+        """
+        The number of requests made by the given tracker's runner that failed
+        without a response, and the time they took to fail, for each class of
+        error.
+
+        """
+        return stats.get_failure_stats(tracker.get_summary(), self.percentiles)
+
+    def get_label_stats(self, tracker):
+        """
+        The timing statistics and number of error responses of the requests
+        made by the given tracker's runner for each label (e.g. route), in
+        order of label.
+
+        """
+        return [
+            {
+                "label": label,
+                "errors": sum(
+                    count for code, count in summary.codes.items()
+                    if code >= 400),
+                "stats": stats.get_time_stats(summary, self.percentiles),
+            }
+            for label, summary in sorted(tracker.labels.items())
+            if summary.count
+        ]
+
+    def get_stage_stats(self, tracker):
+        """
+        The duration, target and timing statistics of each stage of the load
+        applied by the given tracker's runner, if it had stages.
+
+        """
+        return [
+            {
+                "stage": index + 1,
+                "duration": stage.duration,
+                "target": stage.target,
+                "stats": stats.get_time_stats(summary, self.percentiles),
+            }
+            for index, (stage, summary) in enumerate(tracker.stages)
+        ]
+
+    def get_counters(self, tracker):
+        """
+        The counts of events (e.g. late requests and connections opened)
+        during the test tracked by the given tracker.
+
+        """
+        return dict(tracker.counters)
+
+    def get_summary(self, tracker):
+        """
+        Every statistic of the test tracked by the given tracker, as a dict of
+        JSON encodable values. This includes the state of its latency
+        histogram, against which later tests may be compared (see
+        `thuum.checks`).
+
+        """
+        summary = tracker.get_summary()
+        return {
+            "stats": self.get_time_stats(tracker),
+            "histogram": summary.histogram.to_dict(),
+            "codes": dict(summary.codes),
+            "failures": self.get_failure_stats(tracker),
+            "counters": self.get_counters(tracker),
+            "warmup": self.get_warmup_stats(tracker),
+            "labels": self.get_label_stats(tracker),
+            "stages": self.get_stage_stats(tracker),
+            "overhead": tracker.overhead,
+        }
 
     def progress(self, runner):
         """
@@ -54,6 +272,13 @@ class BaseReporter(object):
 
         """
 
+    def window(self, window):
+        """
+        Add the statistics of a window of the test (see
+        `thuum.stats.Windows`) to the report.
+
+        """
+
     def summarize(self, tracker):
         """
         Display a summary of the results collected by the given tracker.
@@ -62,9 +287,6 @@ class BaseReporter(object):
 
 
 class TerminalReporter(BaseReporter):
-    def __init__(self, stream):
-        self.stream = stream
-
     def progress(self, runner):
         if self.stream.isatty():
             update = runner.progress()
@@ -72,44 +294,313 @@ class TerminalReporter(BaseReporter):
             self.stream.write(PROGRESS_TEMPLATE.format(**update))
             self.stream.flush()
 
+    def window(self, window):
+        if self.stream.isatty():
+            latencies = dict(
+                (label, "-" if window[label] is None else "%.4fs" % window[label])
+                for label in ("p50", "p99"))
+            values = dict(window, **latencies)
+            self.stream.write("\r\x1b[K" + WINDOW_TEMPLATE.format(**values) + "\n")
+            self.stream.flush()
+
     def summarize(self, tracker):
-        records = tracker.get_records()
-        time_stats = stats.get_time_stats(records)
+        summary = tracker.get_summary()
+        time_stats = self.get_time_stats(tracker)
 
         self.stream.write("\n")
         if time_stats is None:
             self.stream.write("**No completed requests**")
+            failures = self.get_failure_stats(tracker)
+            if failures:
+                self.stream.write("\n")
+                self._write_failures(failures)
             return
 
         self.stream.write(TIMING_REPORT_TEMPLATE.format(**time_stats) + "\n")
+        for label, value in time_stats["percentiles"].items():
+            line = PERCENTILE_TEMPLATE.format(label=label, value=value)
+            self.stream.write(line + "\n")
 
-        codes = collections.Counter([r.code for r in records if r.code >= 300])
-        for code, count in codes.iteritems():
+        warmup_stats = self.get_warmup_stats(tracker)
+        if warmup_stats is not None:
+            self.stream.write(WARMUP_TEMPLATE.format(**warmup_stats) + "\n")
+
+        if time_stats["phases"]:
+            self._write_phases(time_stats["phases"])
+
+        for code, count in sorted(summary.codes.items()):
+            # Requests without a response (599) are broken down by failure.
+            if code < 300 or code == 599:
+                continue
             self.stream.write("[%d] responses: %d\n" % (code, count))
 
+        failures = self.get_failure_stats(tracker)
+        if failures:
+            self._write_failures(failures)
+
+        for name, count in sorted(tracker.counters.items()):
+            if count:
+                label = COUNTER_LABELS.get(name, name)
+                self.stream.write("%s: %d\n" % (label, count))
+
+        labels = self.get_label_stats(tracker)
+        if labels:
+            self._write_labels(labels)
+
+        stages = self.get_stage_stats(tracker)
+        if stages:
+            self._write_stages(stages)
+
+        if tracker.overhead is not None:
+            self._write_overhead(tracker.overhead)
+
+    def _write_overhead(self, overhead):
+        if overhead["lag"]["p99"] is None:
+            return
+        values = dict(overhead)
+        values.setdefault("reporters", 0.0)
+        self.stream.write("\n" + OVERHEAD_TEMPLATE.format(**values) + "\n")
+        if overhead["saturated"]:
+            self.stream.write(SATURATION_WARNING)
+
+    def _write_phases(self, phases):
+        labels = [stats.percentile_label(p) for p in self.percentiles]
+        columns = ["avg"] + labels
+        header = "Phase".ljust(12) + "".join(c.rjust(11) for c in columns)
+        self.stream.write("\n" + header + "\n")
+
+        for phase, phase_stats in phases.items():
+            values = [phase_stats["avg"]] + list(phase_stats["percentiles"].values())
+            self.stream.write(PHASE_LABELS.get(phase, phase).ljust(12))
+            self.stream.write("".join("%10.4fs" % value for value in values))
+            self.stream.write("\n")
+
+    def _write_failures(self, failures):
+        labels = [stats.percentile_label(p) for p in self.percentiles]
+        columns = ["Requests", "Average"] + labels
+        header = "Failure".ljust(12) + "".join(c.rjust(11) for c in columns)
+        self.stream.write("\n" + header + "\n")
+
+        for error, failure_stats in failures.items():
+            self.stream.write(FAILURE_LABELS.get(error, error).ljust(12))
+            self.stream.write("%11d" % failure_stats["count"])
+            self.stream.write("".join(
+                "%10.4fs" % value
+                for value in [failure_stats["avg"]]
+                + list(failure_stats["percentiles"].values())))
+            self.stream.write("\n")
+
+    def _write_labels(self, labels):
+        width = max(12, max(len(label["label"]) for label in labels) + 2)
+        percentiles = [stats.percentile_label(p) for p in self.percentiles]
+        columns = ["Requests", "RPS", "Average"] + percentiles + ["Errors"]
+        header = "Route".ljust(width) + "".join(c.rjust(11) for c in columns)
+        self.stream.write("\n" + header + "\n")
+
+        for label in labels:
+            time_stats = label["stats"]
+            self.stream.write(label["label"].ljust(width))
+            self.stream.write("%11d%11.2f%10.4fs" % (
+                time_stats["count"],
+                time_stats["rps"],
+                time_stats["avg"]))
+            self.stream.write("".join(
+                "%10.4fs" % value
+                for value in time_stats["percentiles"].values()))
+            self.stream.write("%11d\n" % label["errors"])
+
+    def _write_stages(self, stages):
+        labels = [stats.percentile_label(p) for p in self.percentiles]
+        columns = ["Duration", "Target", "Requests", "RPS"] + labels
+        header = "Stage".ljust(7) + "".join(c.rjust(11) for c in columns)
+        self.stream.write("\n" + header + "\n")
+
+        for stage in stages:
+            self.stream.write(STAGE_TEMPLATE.format(**stage))
+            time_stats = stage["stats"]
+            if time_stats is None:
+                self.stream.write("%11d\n" % 0)
+                continue
+            self.stream.write("%11d%11.2f" % (time_stats["count"], time_stats["rps"]))
+            self.stream.write("".join(
+                "%10.4fs" % value
+                for value in time_stats["percentiles"].values()))
+            self.stream.write("\n")
+
+
+class BufferedReporter(BaseReporter):
+    """
+    Base class for reporters writing every record, which they do in batches
+    from a `BackgroundWriter`. Records reach the stream once `flush()` is
+    called, which `summarize()` does before writing the summary; a warning is
+    written to stderr if any were discarded because the writer fell behind.
 
-class CSVReporter(BaseReporter):
+    """
+    def __init__(self, stream, percentiles=stats.DEFAULT_PERCENTILES):
+        super(BufferedReporter, self).__init__(stream, percentiles)
+        self.output = BackgroundWriter(self.write_records)
+
+    @abc.abstractmethod
+    def write_records(self, records):
+        """
+        Write a batch of records to the stream (from the writer's thread).
+
+        """
+
+    def record(self, record):
+        self.output.add(record)
+
+    def flush(self):
+        """
+        Write all of the records reported so far.
+
+        """
+        self.output.join()
+        self.stream.flush()
+        if self.output.dropped:
+            sys.stderr.write(UNWRITTEN_WARNING.format(count=self.output.dropped))
+
+    def get_counters(self, tracker):
+        counters = super(BufferedReporter, self).get_counters(tracker)
+        if self.output.dropped:
+            counters["unwritten"] = self.output.dropped
+        return counters
+
+
+class CSVReporter(BufferedReporter):
     """
     CSV formatted report of `thuum.stats.Record` objects.
 
+    The summary is written after the records, separated by an empty row, as a
+    header row of statistic names (with per-phase statistics prefixed by the
+    phase name, e.g. "ttfb_p99", those of the warm-up requests by "warmup" and
+    those of the requests that failed with each class of error by its name and
+    "failures", e.g. "timeout_failures_avg", and the number of responses that
+    failed each validation check by "invalid", e.g. "invalid_body") and a row
+    of their values. When
+    requests are labelled (e.g. by route) this is followed by another empty
+    row and a table of each label's statistics, and likewise for each stage of
+    a staged test.
+
     """
-    def __init__(self, stream):
+    SUMMARY_FIELDS = ("count", "dur", "avg", "min", "max", "dev", "rps", "received")
+
+    def __init__(self, stream, percentiles=stats.DEFAULT_PERCENTILES):
+        super(CSVReporter, self).__init__(stream, percentiles)
         self.writer = csv.DictWriter(stream, FIELDS)
 
-    def record(self, record):
-        record = filter_record(record)
-        self.writer.writerow(record)
+    def write_records(self, records):
+        self.writer.writerows(filter_record(record) for record in records)
+
+    def summarize(self, tracker):
+        self.flush()
+        time_stats = self.get_time_stats(tracker)
+        if time_stats is None:
+            return
+
+        names = list(self.SUMMARY_FIELDS)
+        values = [time_stats[field] for field in self.SUMMARY_FIELDS]
+        names.extend(time_stats["percentiles"].keys())
+        values.extend(time_stats["percentiles"].values())
+
+        for phase, phase_stats in time_stats["phases"].items():
+            names.append("%s_avg" % phase)
+            values.append(phase_stats["avg"])
+            for label, value in phase_stats["percentiles"].items():
+                names.append("%s_%s" % (phase, label))
+                values.append(value)
+
+        warmup_stats = self.get_warmup_stats(tracker)
+        if warmup_stats is not None:
+            for field in self.SUMMARY_FIELDS:
+                names.append("warmup_%s" % field)
+                values.append(warmup_stats[field])
+            for label, value in warmup_stats["percentiles"].items():
+                names.append("warmup_%s" % label)
+                values.append(value)
+
+        for error, failure_stats in self.get_failure_stats(tracker).items():
+            names.extend(["%s_failures" % error, "%s_failures_avg" % error])
+            values.extend([failure_stats["count"], failure_stats["avg"]])
+            for label, value in failure_stats["percentiles"].items():
+                names.append("%s_failures_%s" % (error, label))
+                values.append(value)
+
+        for check in validation.CHECKS:
+            count = tracker.counters.get("invalid_%s" % check)
+            if count:
+                names.append("invalid_%s" % check)
+                values.append(count)
 
+        writer = csv.writer(self.stream)
+        writer.writerow([])
+        writer.writerow(names)
+        writer.writerow(values)
 
-class JSONReporter(BaseReporter):
+        labels = self.get_label_stats(tracker)
+        if labels:
+            self._write_labels(writer, labels)
+
+        stages = self.get_stage_stats(tracker)
+        if stages:
+            self._write_stages(writer, stages)
+
+    def _write_labels(self, writer, labels):
+        percentiles = [stats.percentile_label(p) for p in self.percentiles]
+        writer.writerow([])
+        writer.writerow(
+            ["label"] + list(self.SUMMARY_FIELDS) + percentiles + ["errors"])
+
+        for label in labels:
+            time_stats = label["stats"]
+            row = [label["label"]]
+            row.extend(time_stats[field] for field in self.SUMMARY_FIELDS)
+            row.extend(time_stats["percentiles"].values())
+            row.append(label["errors"])
+            writer.writerow(row)
+
+    def _write_stages(self, writer, stages):
+        labels = [stats.percentile_label(p) for p in self.percentiles]
+        writer.writerow([])
+        writer.writerow(
+            ["stage", "duration", "target"] + list(self.SUMMARY_FIELDS) + labels)
+
+        for stage in stages:
+            row = [stage["stage"], stage["duration"], stage["target"]]
+            time_stats = stage["stats"]
+            if time_stats is not None:
+                row.extend(time_stats[field] for field in self.SUMMARY_FIELDS)
+                row.extend(time_stats["percentiles"].values())
+            writer.writerow(row)
+
+
+class JSONReporter(BufferedReporter):
     """
     JSON encoded report of `thuum.stats.Record` objects and test summary.
 
+    Each record is written as a JSON object on its own line, followed by a
+    final `{"summary": {...}}` line which includes the statistics of every
+    window of the test as a time series, of the warm-up requests excluded from
+    the other statistics, of the requests with each label and of every stage
+    of a staged test, and the latency histogram (so that the report can be the
+    `--baseline` of a later test).
+
     """
-    def __init__(self, stream):
-        self.stream = stream
+    def __init__(self, stream, percentiles=stats.DEFAULT_PERCENTILES):
+        super(JSONReporter, self).__init__(stream, percentiles)
+        self.timeseries = []
 
-    def record(self, record):
-        record = filter_record(record)
-        record = json.dumps(record, sort_keys=True)
-        self.stream.write(record + "\n")
+    def window(self, window):
+        self.timeseries.append(window)
+
+    def write_records(self, records):
+        self.stream.write("".join(
+            json.dumps(filter_record(record), sort_keys=True) + "\n"
+            for record in records))
+
+    def summarize(self, tracker):
+        self.flush()
+        summary = self.get_summary(tracker)
+        summary["timeseries"] = self.timeseries
+        self.stream.write(json.dumps({"summary": summary}, sort_keys=True))
+        self.stream.write("\n")
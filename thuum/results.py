@@ -0,0 +1,224 @@
+"""
+Compact binary files of the records of load tests.
+
+A results file starts with `MAGIC` and a line of JSON describing its columns
+(their type codes and sizes, and the byte order they were written in), and is
+followed by any number of chunks, each a 4 byte kind and the length of its
+payload:
+
+* "RECS" chunks hold a batch of records: their number, a JSON list of the
+  labels they refer to and then each column of `thuum.stats.RecordStore` in
+  turn, as a contiguous array of fixed-size values.
+* "CNTR" chunks hold the counters of a test as a JSON object.
+
+Chunks are only ever added to the end of a file, so a file can be appended to
+by later tests (or written by several runs in turn) and a test that is
+interrupted leaves every chunk but the one being written readable; the partial
+chunk is cut off when the file is next appended to. Files are
+read through `mmap` a chunk at a time, so they may be far larger than would fit
+in memory.
+
+"""
+
+import array
+import collections
+import json
+import mmap
+import os
+import struct
+import sys
+
+from thuum import stats
+
+MAGIC = b"THUUM-RESULTS\n"
+CHUNK_HEADER = struct.Struct("<4sQ")
+CHUNK_SIZE = 10000
+
+RECORDS = b"RECS"
+COUNTERS = b"CNTR"
+
+
+def _layout():
+    columns = list(stats.RecordStore.COLUMNS)
+    columns.extend((phase, "d") for phase in stats.PHASES)
+    return columns
+
+
+def _to_bytes(values):
+    return values.tobytes() if hasattr(values, "tobytes") else values.tostring()
+
+
+def _from_bytes(values, data):
+    if hasattr(values, "frombytes"):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+
+
+def _description():
+    return {
+        "byteorder": sys.byteorder,
+        "columns": [
+            (name, typecode, array.array(typecode).itemsize)
+            for name, typecode in _layout()
+        ],
+    }
+
+
+class ResultsWriter(object):
+    """
+    Writes the records completed by a tracker (see `add()`) to a results file
+    in chunks of `chunk_size`, appending to the file if it already exists
+    (after any partial chunk left by an interrupted test is cut off).
+
+    """
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._store = stats.RecordStore()
+
+        description = (json.dumps(_description()) + "\n").encode("utf-8")
+        if os.path.exists(path) and os.path.getsize(path):
+            # Appending to another machine's file would mix up the columns.
+            with open(path, "r+b") as f:
+                _read_header(f, path)
+                f.truncate(_chunks_end(f))
+            self._file = open(path, "ab")
+        else:
+            self._file = open(path, "wb")
+            self._file.write(MAGIC + description)
+
+    def attach(self, tracker):
+        """
+        Write the records and final counters of `tracker`.
+
+        """
+        tracker.events.on("request_finished", self.add)
+        tracker.events.on(
+            "tests_finished",
+            lambda tracker: self.close(tracker.counters))
+
+    def add(self, record):
+        self._store.append(record)
+        if len(self._store) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        store = self._store
+        if not len(store):
+            return
+
+        labels = json.dumps(store.labels).encode("utf-8")
+        parts = [struct.pack("<QQ", len(store), len(labels)), labels]
+        for name, _ in _layout():
+            parts.append(_to_bytes(store.column(name)))
+        self._write_chunk(RECORDS, b"".join(parts))
+        self._store = stats.RecordStore()
+
+    def _write_chunk(self, kind, payload):
+        self._file.write(CHUNK_HEADER.pack(kind, len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+
+    def close(self, counters=None):
+        self.flush()
+        if counters:
+            self._write_chunk(
+                COUNTERS, json.dumps(dict(counters)).encode("utf-8"))
+        self._file.close()
+
+
+def _read_header(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("%s is not a results file" % path)
+    description = json.loads(f.readline().decode("utf-8"))
+    if description != json.loads(json.dumps(_description())):
+        raise ValueError(
+            "%s was written with a different column layout" % path)
+
+
+def _chunks_end(f):
+    """
+    The offset just after the last complete chunk of a file that has been
+    read up to its first chunk.
+
+    """
+    size = os.fstat(f.fileno()).st_size
+    offset = f.tell()
+    while offset + CHUNK_HEADER.size <= size:
+        f.seek(offset)
+        _, length = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+        if offset + CHUNK_HEADER.size + length > size:
+            break
+        offset += CHUNK_HEADER.size + length
+    return offset
+
+
+class ResultsFile(object):
+    """
+    Reads a results file, giving its records a chunk at a time as
+    `thuum.stats.RecordStore`s and the sum of its counters.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.counters = collections.Counter()
+        with open(path, "rb") as f:
+            _read_header(f, path)
+            self._start = f.tell()
+
+    def stores(self):
+        """
+        Generate a `RecordStore` for each chunk of records in the file,
+        adding the counters of the file to `counters` as they are found.
+
+        """
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= self._start:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offset = self._start
+                while offset + CHUNK_HEADER.size <= size:
+                    kind, length = CHUNK_HEADER.unpack_from(data, offset)
+                    offset += CHUNK_HEADER.size
+                    if offset + length > size:
+                        # The test was interrupted while writing this chunk.
+                        break
+                    if kind == RECORDS:
+                        yield self._read_records(data, offset)
+                    elif kind == COUNTERS:
+                        self.counters.update(json.loads(
+                            data[offset:offset + length].decode("utf-8")))
+                    offset += length
+            finally:
+                data.close()
+
+    def _read_records(self, data, offset):
+        count, labels_length = struct.unpack_from("<QQ", data, offset)
+        offset += 16
+        labels = json.loads(data[offset:offset + labels_length].decode("utf-8"))
+        offset += labels_length
+
+        columns = {}
+        for name, typecode in _layout():
+            values = array.array(typecode)
+            length = count * values.itemsize
+            _from_bytes(values, data[offset:offset + length])
+            columns[name] = values
+            offset += length
+        return stats.RecordStore.from_columns(columns, labels)
+
+
+def load(paths, tracker):
+    """
+    Add the records and counters of every results file in `paths` to
+    `tracker`, a chunk at a time.
+
+    """
+    for path in paths:
+        results = ResultsFile(path)
+        for store in results.stores():
+            tracker.add_store(store)
+        tracker.add_counters(results.counters)
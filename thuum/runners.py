@@ -1,56 +1,172 @@
+import collections
+import functools
+import random
 import time
 
 from pyee import EventEmitter
 from tornado import (
     concurrent,
+    ioloop,
 )
 
+from thuum import engines
+
+# A stage of a `StagedRunner`: `target` is reached by the end of `duration`
+# seconds, ramping from the target of the previous stage.
+Stage = collections.namedtuple("Stage", ("duration", "target"))
+
+
+def _discard(chunk):
+    pass
+
+
 class Runner(object):
-    def __init__(self, client, make_request):
-        self.client = client
+    """
+    Base class for running load tests: starts requests made by `make_request`
+    with an `engine` (a `thuum.engines.Engine`, or a Tornado `AsyncHTTPClient`
+    which is adapted to one) and emits events as each progresses.
+
+    The per-request events ("request_ready", "request_started" and
+    "request_finished") are also delivered to observers (see `add_observer()`)
+    by calling their methods of the same names directly, which costs far less
+    than going through the `EventEmitter` for every request.
+
+    A test is either `run()` on the engine's `IOLoop`, which blocks until it
+    has finished, or `start()`ed on a loop that is already running (e.g. from
+    a coroutine of an application using asyncio, see `thuum.loops`).
+
+    """
+    def __init__(self, engine, make_request):
+        if not isinstance(engine, engines.Engine):
+            engine = engines.TornadoEngine(engine)
+        self.engine = engine
         self.make_request = make_request
-        self._pending = []
+        # Pools of requests (see `thuum.sources.RequestPool`) take back each
+        # request once it is finished.
+        self._release = getattr(make_request, "release", None)
+        self._pending = set()
+        self._observers = []
+        self._finished = None
+        self._stopped = False
         self.events = EventEmitter()
+        for event in engines.CONNECTION_EVENTS:
+            self.engine.events.on(event, self._forward(event))
+
+    def _forward(self, event):
+        return lambda *args: self.events.emit(event, *args)
+
+    def add_observer(self, observer):
+        """
+        Call `observer`'s `request_ready(future, request)`,
+        `request_started(future)` and `request_finished(future)` for each
+        request, before the listeners of the events of the same names.
+
+        """
+        self._observers.append(observer)
+
+    def start(self):
+        """
+        Start the test without waiting for it, returning a `Future` resolved
+        once it has finished.
+
+        The test only makes progress while the engine's `IOLoop` is running,
+        and ending it does not stop the loop.
+
+        """
+        self._finished = concurrent.Future()
+        self._stopped = False
+        self.events.emit("tests_started")
+        self._begin()
+        return self._finished
+
+    def run(self):
+        """
+        Run the test on the engine's `IOLoop`, returning once it has finished.
+
+        """
+        io_loop = self.engine.io_loop
+        finished = self.start()
+        finished.add_done_callback(lambda future: io_loop.stop())
+        io_loop.start()
+        if not finished.done():
+            # Something else stopped the loop (e.g. a listener abandoning the
+            # test), which ends the test as well.
+            self._stopped = True
+            self.events.emit("tests_finished")
+
+    def _begin(self):
+        """
+        Start the first requests, or schedule their arrival.
+
+        """
+        raise NotImplementedError
+
+    def _stop(self):
+        """
+        End the test. Requests still in flight are neither reported nor
+        followed by others.
+
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        self.events.emit("tests_finished")
+        self._finished.set_result(None)
 
     def _on_request_finished(self, _):
         """
         Start the next waiting request if possible.
 
         """
-        if len(self.client.active) < self.client.max_clients:
+        if self.engine.active < self.engine.max_clients:
             self._start_request()
 
     def _start_request(self):
         """
-        Start a request and add callbacks to its future.
+        Start a request and add a callback to its future.
 
         Most notably, the completion of the requests's future will also trigger
         the completion of a future we had prepared earlier.
 
         """
-        request = self.make_request(streaming_callback=lambda c: None)
+        request = self.make_request(streaming_callback=_discard)
         future = concurrent.Future()
 
+        for observer in self._observers:
+            observer.request_ready(future, request)
         self.events.emit("request_ready", future, request)
-        self.client.fetch(request, callback=future.set_result)
+        self.engine.fetch(request, future.set_result)
+        for observer in self._observers:
+            observer.request_started(future)
         self.events.emit("request_started", future)
 
-        self._pending.append(future)
-        future.add_done_callback(lambda f: self.events.emit("request_finished", f))
-        future.add_done_callback(self._pending.remove)
-        future.add_done_callback(self._on_request_finished)
+        self._pending.add(future)
+        # A single callback per request, as each one added to a future is
+        # wrapped in a stack context.
+        future.add_done_callback(functools.partial(self._finish_request, request))
+
+    def _finish_request(self, request, future):
+        if self._stopped:
+            return
+        for observer in self._observers:
+            observer.request_finished(future)
+        self.events.emit("request_finished", future)
+        self._pending.discard(future)
+        if self._release is not None:
+            self._release(request)
+        self._on_request_finished(future)
 
 
 class QuantityRunner(Runner):
-    def __init__(self, client, make_request, num_requests):
+    def __init__(self, engine, make_request, num_requests):
         assert num_requests > 0
-        super(QuantityRunner, self).__init__(client, make_request)
+        super(QuantityRunner, self).__init__(engine, make_request)
         self._total = num_requests
         self._remaining = num_requests
 
     def _on_request_finished(self, _):
         if len(self._pending) == 0 and self._remaining == 0:
-            self.client.io_loop.stop()
+            self._stop()
         elif self._remaining > 0:
             super(QuantityRunner, self)._on_request_finished(_)
 
@@ -58,17 +174,12 @@ class QuantityRunner(Runner):
         self._remaining -= 1
         super(QuantityRunner, self)._start_request()
 
-    def run(self):
-        self.events.emit("tests_started")
+    def _begin(self):
         # Start the number of desired requests, up to the maximum number of
         # desired concurrent requests.
-        for _ in xrange(min(self._total, self.client.max_clients)):
+        for _ in range(min(self._total, self.engine.max_clients)):
             self._start_request()
 
-        # a single future which completes once all futures are complete.
-        self.client.io_loop.start()
-        self.events.emit("tests_finished")
-
     def progress(self):
         sent = self._total - self._remaining
         return {
@@ -80,24 +191,261 @@ class QuantityRunner(Runner):
 
 
 class DurationRunner(Runner):
-    def __init__(self, client, make_request, duration):
+    def __init__(self, engine, make_request, duration):
         assert duration > 0
-        super(DurationRunner, self).__init__(client, make_request)
+        super(DurationRunner, self).__init__(engine, make_request)
         self._duration = duration
         self._started = None
 
-    def run(self):
-        self.events.emit("tests_started")
+    def _begin(self):
         self._started = time.time()
 
         # Start the number of desired requests, up to the maximum number of
         # desired concurrent requests.
-        for _ in xrange(self.client.max_clients):
+        for _ in range(self.engine.max_clients):
             self._start_request()
 
-        self.client.io_loop.call_later(self._duration, self.client.io_loop.stop)
-        self.client.io_loop.start()
-        self.events.emit("tests_finished")
+        self.engine.io_loop.call_later(self._duration, self._stop)
+
+    def progress(self):
+        current = time.time() - self._started
+        return {
+            "unit": "seconds",
+            "total": self._duration,
+            "current": current,
+            "percentage": min(100.0, current / float(self._duration) * 100),
+        }
+
+
+class RateRunner(Runner):
+    """
+    Start requests at a fixed rate regardless of how quickly they complete.
+
+    Unlike the other runners, which only start a request once another one has
+    finished, arrivals are scheduled on the `IOLoop` at `rate` requests per
+    second (evenly spaced, or exponentially distributed when `poisson` is
+    set) so that a slow server faces the same offered load as a fast one.
+
+    At most `max_pending` requests (defaulting to the engine's `max_clients`)
+    are in flight at a time; arrivals beyond that are dropped. Arrivals that
+    could not be started within `late_threshold` seconds of their scheduled
+    time are counted as late. Both emit events so a tracker can report them.
+
+    The test ends after `num_requests` arrivals or `duration` seconds.
+
+    """
+    late_threshold = 0.01
+
+    def __init__(self, engine, make_request, rate, num_requests=None,
+                 duration=None, poisson=False, max_pending=None):
+        assert rate > 0
+        assert (num_requests is None) != (duration is None)
+        super(RateRunner, self).__init__(engine, make_request)
+        self._rate = float(rate)
+        self._poisson = poisson
+        self._max_pending = max_pending or self.engine.max_clients
+        self._total = num_requests
+        self._remaining = num_requests
+        self._duration = duration
+        self._started = None
+        self._next_start = None
+
+    def _interval(self):
+        if self._poisson:
+            return random.expovariate(self._rate)
+        return 1 / self._rate
+
+    def _arrivals_remaining(self):
+        return not self._stopped and self._remaining != 0
+
+    def _on_arrival(self):
+        io_loop = self.engine.io_loop
+        now = io_loop.time()
+
+        while self._next_start <= now and self._arrivals_remaining():
+            if now - self._next_start > self.late_threshold:
+                self.events.emit("request_late")
+
+            if len(self._pending) >= self._max_pending:
+                self.events.emit("request_dropped")
+            else:
+                self._start_request()
+
+            if self._remaining is not None:
+                self._remaining -= 1
+            self._next_start += self._interval()
+
+        if self._arrivals_remaining():
+            io_loop.call_at(self._next_start, self._on_arrival)
+        elif not self._pending:
+            self._stop()
+
+    def _on_request_finished(self, _):
+        if not self._arrivals_remaining() and not self._pending:
+            self._stop()
+
+    def _begin(self):
+        io_loop = self.engine.io_loop
+        self._started = time.time()
+        self._next_start = io_loop.time()
+
+        if self._duration is not None:
+            io_loop.call_later(self._duration, self._stop)
+
+        io_loop.add_callback(self._on_arrival)
+
+    def progress(self):
+        if self._duration is not None:
+            current = time.time() - self._started
+            total = self._duration
+            unit = "seconds"
+        else:
+            current = self._total - self._remaining
+            total = self._total
+            unit = "requests"
+
+        return {
+            "unit": unit,
+            "total": total,
+            "current": current,
+            "percentage": min(100.0, current / float(total) * 100),
+        }
+
+
+class StagedRunner(Runner):
+    """
+    Vary the load over a sequence of `Stage`s rather than applying all of it
+    from the start.
+
+    Over each stage the target ramps linearly from that of the previous stage
+    (zero for the first) to the stage's own target. The target is the number
+    of requests kept in flight or, when `rate` is set, the arrival rate in
+    requests per second; arrivals then behave as with `RateRunner`, including
+    `poisson` arrivals, at most `max_pending` requests in flight and the late
+    and dropped events.
+
+    "stage_started" is emitted with the index and `Stage` as each stage
+    begins, and the test ends with the last stage.
+
+    """
+    late_threshold = RateRunner.late_threshold
+    tick = 0.1
+
+    def __init__(self, engine, make_request, stages, rate=False, poisson=False,
+                 max_pending=None):
+        assert stages
+        assert all(stage.duration > 0 and stage.target >= 0 for stage in stages)
+        super(StagedRunner, self).__init__(engine, make_request)
+        self._stages = tuple(stages)
+        self._duration = sum(stage.duration for stage in stages)
+        self._rate = rate
+        self._poisson = poisson
+        self._max_pending = max_pending or self.engine.max_clients
+        self._started = None
+        self._origin = None
+        self._last_arrival = None
+        self._due = 0.0
+        self._threshold = 1.0
+        self._ticker = None
+
+    def target(self, elapsed):
+        """
+        The target concurrency or rate `elapsed` seconds into the test.
+
+        """
+        previous = 0
+        for stage in self._stages:
+            if elapsed < stage.duration:
+                fraction = max(0.0, elapsed) / float(stage.duration)
+                return previous + (stage.target - previous) * fraction
+            elapsed -= stage.duration
+            previous = stage.target
+        return previous
+
+    def _elapsed(self):
+        return self.engine.io_loop.time() - self._origin
+
+    def _fill(self):
+        """
+        Start requests until the target number are in flight.
+
+        """
+        target = int(self.target(self._elapsed()))
+        while not self._stopped and len(self._pending) < target:
+            self._start_request()
+
+    def _next_threshold(self):
+        if self._poisson:
+            return random.expovariate(1)
+        return 1.0
+
+    def _on_arrival(self):
+        """
+        Start the requests that have arrived since the last call.
+
+        The expected number of arrivals is accumulated from the average target
+        rate over the time since then, and one is started whenever it reaches
+        the (exponentially distributed, for `poisson`) threshold.
+
+        """
+        if self._stopped:
+            return
+
+        elapsed = self._elapsed()
+        rate = self.target(elapsed)
+        previous = self.target(self._last_arrival)
+        self._due += (previous + rate) / 2.0 * (elapsed - self._last_arrival)
+        self._last_arrival = elapsed
+
+        late = self._due >= self._threshold + rate * self.late_threshold
+        while self._due >= self._threshold:
+            self._due -= self._threshold
+            self._threshold = self._next_threshold()
+            if late:
+                self.events.emit("request_late")
+            if len(self._pending) >= self._max_pending:
+                self.events.emit("request_dropped")
+            else:
+                self._start_request()
+
+        delay = self.tick
+        if rate > 0:
+            delay = min(delay, (self._threshold - self._due) / rate)
+        self.engine.io_loop.call_later(delay, self._on_arrival)
+
+    def _on_request_finished(self, _):
+        if not self._rate:
+            self._fill()
+
+    def _start_stage(self, index):
+        if not self._stopped:
+            self.events.emit("stage_started", index, self._stages[index])
+
+    def _stop(self):
+        if self._ticker is not None:
+            self._ticker.stop()
+        super(StagedRunner, self)._stop()
+
+    def _begin(self):
+        io_loop = self.engine.io_loop
+        self._started = time.time()
+        self._origin = io_loop.time()
+        self._last_arrival = 0.0
+        self._threshold = self._next_threshold()
+
+        offset = 0
+        for index, stage in enumerate(self._stages):
+            io_loop.call_at(self._origin + offset, self._start_stage, index)
+            offset += stage.duration
+        io_loop.call_at(self._origin + offset, self._stop)
+
+        if self._rate:
+            io_loop.add_callback(self._on_arrival)
+        else:
+            self._ticker = ioloop.PeriodicCallback(
+                self._fill, self.tick * 1000, io_loop)
+            self._ticker.start()
+            io_loop.add_callback(self._fill)
 
     def progress(self):
         current = time.time() - self._started
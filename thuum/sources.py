@@ -0,0 +1,258 @@
+"""
+Sources of the requests made by a load test.
+
+A runner calls its `make_request` function for every request it starts, with
+keyword arguments (such as `streaming_callback`) to set on the request. The
+functions here build such a function from a fixed body, a body read from a
+file or a Python callable generating each request's body, URL or headers
+(such as `UrlList` and `Replay`, which spread requests across many URLs), and
+`RequestPool` builds every request up front so that starting one does no more
+than take it from the pool.
+
+"""
+
+import bisect
+import collections
+import importlib
+import itertools
+import random
+import re
+
+from tornado import httpclient
+
+try:
+    from urllib import parse as urlparse
+except ImportError:
+    import urlparse
+
+GENERATED_FIELDS = ("url", "method", "headers", "body", "label")
+BODY_METHODS = ("PATCH", "POST", "PUT")
+
+# The request line of an access log entry in the common or combined format.
+ACCESS_LOG_REQUEST = re.compile(r'"([A-Z]+) (\S+) HTTP/[\d.]+"')
+
+# Path segments that identify a resource rather than a route: numbers, UUIDs
+# and long hexadecimal strings (e.g. hashes or object IDs).
+ID_SEGMENT = re.compile(
+    r"^(\d+|[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}"
+    r"|[0-9a-fA-F]{16,})$")
+ID_PLACEHOLDER = "{id}"
+
+
+def read_body(path):
+    """
+    Read a request body from a file.
+
+    The body is read once and the same string is given to every request, so
+    no copy of it is made per request.
+
+    """
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_callable(name):
+    """
+    Import a callable from its fully-qualified name, e.g. "package.module.func".
+
+    """
+    module_name, _, attribute = name.rpartition(".")
+    if not module_name:
+        raise ImportError("%r is not a fully-qualified name." % name)
+
+    module = importlib.import_module(module_name)
+    try:
+        function = getattr(module, attribute)
+    except AttributeError:
+        raise ImportError("%r has no attribute %r." % (module_name, attribute))
+
+    if not callable(function):
+        raise ImportError("%r is not callable." % name)
+    return function
+
+
+def route_label(url):
+    """
+    The label grouping the statistics of requests to a URL: its path, with
+    segments identifying a resource (see `ID_SEGMENT`) replaced by
+    `ID_PLACEHOLDER` so that e.g. "/users/1" and "/users/2" share a label.
+
+    """
+    path = urlparse.urlparse(url).path or "/"
+    return "/".join(
+        ID_PLACEHOLDER if ID_SEGMENT.match(segment) else segment
+        for segment in path.split("/"))
+
+
+def request_factory(url, method="GET", headers=None, body=None, generate=None,
+                    connect_timeout=None, request_timeout=None):
+    """
+    A `make_request` function for requests to `url`, which fail as timed out
+    after `connect_timeout` seconds connecting or `request_timeout` seconds
+    in all (by default, those of the HTTP client).
+
+    If given, `generate` is called (with no arguments) for every request. It
+    may return a body, or a dict of any of `GENERATED_FIELDS` which take the
+    place of the default values. A request's "label", if any, is set as an
+    attribute of the request so that its statistics can be grouped with those
+    of other requests with the same label.
+
+    """
+    defaults = {
+        "url": url,
+        "method": method,
+        "headers": headers,
+        "body": body,
+        "label": None,
+        "connect_timeout": connect_timeout,
+        "request_timeout": request_timeout,
+    }
+
+    def make_request(**kwargs):
+        values = dict(defaults)
+        if generate is not None:
+            generated = generate()
+            if isinstance(generated, dict):
+                values.update(
+                    (field, generated[field])
+                    for field in GENERATED_FIELDS
+                    if field in generated)
+            else:
+                values["body"] = generated
+        values.update(kwargs)
+
+        label = values.pop("label")
+        if values["body"] is None and values["method"] in BODY_METHODS:
+            values["body"] = ""
+
+        request = httpclient.HTTPRequest(**values)
+        request.label = label
+        return request
+
+    return make_request
+
+
+class UrlList(object):
+    """
+    Generates requests to URLs chosen at random from a file, in proportion to
+    their weights.
+
+    Each line of the file is a URL (which may be relative to `base_url`)
+    optionally followed by its weight, defaulting to 1, and the label to group
+    its statistics under, defaulting to its `route_label`. Blank lines and
+    lines starting with "#" are ignored.
+
+    """
+    def __init__(self, path, base_url):
+        self.targets = []
+        self._totals = []
+
+        total = 0.0
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                fields = line.split()
+                if not fields or fields[0].startswith("#"):
+                    continue
+                if len(fields) > 3:
+                    raise ValueError(
+                        "%s:%d: expected 'url [weight [label]]'" % (path, number))
+
+                url = urlparse.urljoin(base_url, fields[0])
+                weight = float(fields[1]) if len(fields) > 1 else 1.0
+                if weight <= 0:
+                    raise ValueError(
+                        "%s:%d: weights must be positive" % (path, number))
+
+                total += weight
+                self._totals.append(total)
+                self.targets.append({
+                    "url": url,
+                    "label": fields[2] if len(fields) > 2 else route_label(url),
+                })
+
+        if not self.targets:
+            raise ValueError("%s contains no URLs" % path)
+
+    def __call__(self):
+        index = bisect.bisect_right(self._totals, random.random() * self._totals[-1])
+        return self.targets[min(index, len(self.targets) - 1)]
+
+
+class Replay(object):
+    """
+    Generates the requests found in an access log, in the order they were
+    logged, starting over from the beginning of the log at its end.
+
+    The method and path of each entry are taken from its request line (as in
+    the common and combined log formats) and the path is resolved against
+    `base_url`. The log is read lazily a line at a time, so it may be far
+    larger than would fit in memory.
+
+    """
+    def __init__(self, path, base_url):
+        self.path = path
+        self.base_url = base_url
+        entries = self._read()
+        # Fail now, rather than during the test, if there is nothing to replay.
+        self._entries = itertools.chain([next(entries)], entries)
+
+    def _read(self):
+        while True:
+            found = False
+            with open(self.path) as f:
+                for line in f:
+                    match = ACCESS_LOG_REQUEST.search(line)
+                    if match is None:
+                        continue
+                    found = True
+                    method, path = match.groups()
+                    url = urlparse.urljoin(self.base_url, path)
+                    yield {
+                        "url": url,
+                        "method": method,
+                        "label": route_label(url),
+                    }
+
+            if not found:
+                raise ValueError("%s contains no requests" % self.path)
+
+    def __call__(self):
+        return next(self._entries)
+
+
+class RequestPool(object):
+    """
+    A `make_request` function handing out requests built in advance.
+
+    `size` requests are made with `make_request` when the pool is created and
+    are reused for the whole test. Since the attributes a runner or tracker
+    sets on a request (e.g. its `streaming_callback`) belong to the request in
+    flight, a request is only handed out again once it has been `release()`d;
+    if every request in the pool is in flight, another is made and added to it.
+    Requests are handed out in turn, so that however few are in flight at
+    once, every request in the pool is made.
+
+    """
+    def __init__(self, make_request, size):
+        assert size > 0
+        self.make_request = make_request
+        self.size = size
+        self._free = collections.deque(make_request() for _ in range(size))
+
+    def __call__(self, **kwargs):
+        if self._free:
+            request = self._free.popleft()
+        else:
+            request = self.make_request()
+            self.size += 1
+
+        for name, value in kwargs.items():
+            setattr(request, name, value)
+        return request
+
+    def release(self, request):
+        """
+        Return a request to the pool once it is finished.
+
+        """
+        self._free.append(request)
@@ -1,8 +1,22 @@
+import array
+import bisect
+import collections
+import functools
 import math
 import time
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from pyee import EventEmitter
 
+from thuum import (
+    engines,
+    histogram,
+)
+
 PROGRESS_TEMPLATE = "[{current:.1f}/{total:.1f} {unit}] {percentage:.1f}%"
 
 TIMING_REPORT_TEMPLATE = """\
@@ -15,16 +29,105 @@ Deviation   {dev:>15.4f}
 Received    {received:>10}B
 RPS         {rps:>13.2f}"""
 
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+WINDOW_PERCENTILES = (50, 99)
+
+# Phases of a request, in order, that a record may have a duration for.
+# Connection phases are only known when the HTTP client provides curl's
+# `time_info`; time to first byte and transfer are measured for all requests.
+PHASES = (
+    "queue",
+    "dns",
+    "connect",
+    "tls",
+    "ttfb",
+    "transfer",
+)
+
+ROW_FIELDS = (
+    "started",
+    "finished",
+    "code",
+    "sent",
+    "received",
+    "phases",
+    "label",
+    "error",
+    "invalid",
+)
+
+# The most labels a tracker keeps statistics for; the requests of any others
+# are grouped under `OTHER_LABEL`.
+MAX_LABELS = 1000
+OTHER_LABEL = "(other)"
+
+# The class of failure of a record, as stored in a `RecordStore`.
+ERROR_CODES = (None,) + engines.ERRORS
+ERROR_INDICES = dict((error, index) for index, error in enumerate(ERROR_CODES))
+
 
 class Record(object):
+    """
+    The timings and outcome of a request.
+
+    A request that got no response has a `code` of 599 and the class of its
+    failure (one of `thuum.engines.ERRORS`, e.g. "timeout") as its `error`
+    ("other" being assumed where it is missing); `finished` is then when it
+    failed.
+
+    A response that failed validation (see `thuum.validation`) has the check
+    it failed (one of `thuum.validation.CHECKS`) as its `invalid`. Only
+    records and counters keep this; summaries of records do not.
+
+    """
+    __slots__ = (
+        "started",
+        "finished",
+        "code",
+        "sent",
+        "received",
+        "first_byte",
+        "phases",
+        "warmup",
+        "label",
+        "error",
+        "invalid",
+    )
+
     def __init__(self):
         self.started = None
         self.finished = None
         self.code = None
         self.sent = 0
         self.received = 0
+        self.first_byte = None
+        self.phases = {}
+        self.warmup = False
+        self.label = None
+        self.error = None
+        self.invalid = None
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Build a record from a tuple of `ROW_FIELDS` values.
+
+        """
+        record = cls()
+        for field, value in zip(ROW_FIELDS, row):
+            setattr(record, field, value)
+        return record
+
+    def to_row(self):
+        """
+        Flatten the record into a tuple of `ROW_FIELDS` values.
+
+        """
+        return tuple(getattr(self, field) for field in ROW_FIELDS)
 
     def on_received(self, chunk):
+        if self.first_byte is None:
+            self.first_byte = time.time()
         self.received += len(chunk)
 
     def start(self):
@@ -34,16 +137,517 @@ class Record(object):
         response = future.result()
         self.finished = time.time()
         self.code = response.code
+        if response.code == 599:
+            self.error = engines.classify_error(response.error)
+        self._add_time_info(response.time_info)
+
+        if self.first_byte is not None:
+            self.phases["ttfb"] = self.first_byte - self.started
+            self.phases["transfer"] = self.finished - self.first_byte
+
+    def _add_time_info(self, time_info):
+        """
+        Derive connection phases from curl's cumulative `time_info`.
+
+        """
+        queue = time_info.get("queue")
+        namelookup = time_info.get("namelookup")
+        connect = time_info.get("connect")
+        appconnect = time_info.get("appconnect")
+
+        if queue is not None:
+            self.phases["queue"] = queue
+        if namelookup is not None:
+            self.phases["dns"] = namelookup
+            if connect is not None:
+                self.phases["connect"] = connect - namelookup
+                if appconnect:
+                    self.phases["tls"] = appconnect - connect
+
+
+class RecordStore(object):
+    """
+    Compact, columnar storage of records.
+
+    Each field is kept in a typed `array.array` column (with `NaN` standing in
+    for a missing time or phase duration, and `0` for a missing status code)
+    rather than as an object per record. Indexing or iterating the store
+    rebuilds `Record` objects on demand; `column()` gives direct access to the
+    underlying values. Labels are stored as indices into `labels` (of which
+    there can be at most `MAX_LABEL_INDEX`), and errors as indices into
+    `ERROR_CODES`.
+    Statistics computed from a store exclude the records tagged as warm-up.
+
+    """
+    COLUMNS = (
+        ("started", "d"),
+        ("finished", "d"),
+        ("code", "H"),
+        ("sent", "L"),
+        ("received", "L"),
+        ("warmup", "B"),
+        ("label", "H"),
+        ("error", "B"),
+    )
+    MAX_LABEL_INDEX = 0xFFFF
+
+    def __init__(self):
+        self._columns = collections.OrderedDict(
+            (name, array.array(typecode)) for name, typecode in self.COLUMNS)
+        self._phases = collections.OrderedDict(
+            (phase, array.array("d")) for phase in PHASES)
+        self.labels = [None]
+        self._label_indices = {None: 0}
+
+    @classmethod
+    def from_columns(cls, columns, labels):
+        """
+        Build a store from a dict of arrays, one for each of `COLUMNS` and
+        `PHASES`, and the list of labels its label column indexes.
+
+        """
+        store = cls()
+        for name in store._columns:
+            store._columns[name] = columns[name]
+        for phase in store._phases:
+            store._phases[phase] = columns[phase]
+        store.labels = list(labels)
+        store._label_indices = dict(
+            (label, index) for index, label in enumerate(store.labels))
+        return store
+
+    def __len__(self):
+        return len(self._columns["started"])
+
+    def __getitem__(self, index):
+        record = Record()
+        for name, values in self._columns.items():
+            setattr(record, name, values[index])
+        for name in ("started", "finished"):
+            if math.isnan(getattr(record, name)):
+                setattr(record, name, None)
+        record.code = record.code or None
+        record.warmup = bool(record.warmup)
+        record.label = self.labels[record.label]
+        record.error = ERROR_CODES[record.error]
+        record.phases = dict(
+            (phase, values[index])
+            for phase, values in self._phases.items()
+            if not math.isnan(values[index]))
+        return record
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def column(self, name):
+        """
+        The array of values for a field, or for the duration of a phase.
+
+        """
+        if name in self._columns:
+            return self._columns[name]
+        return self._phases[name]
+
+    def append(self, record):
+        """
+        Add a record to the store, returning its index.
+
+        """
+        for name, values in self._columns.items():
+            values.append(0)
+        for values in self._phases.values():
+            values.append(0)
+
+        index = len(self) - 1
+        self.update(index, record)
+        return index
+
+    def update(self, index, record):
+        """
+        Overwrite the values stored at `index` with those of `record`.
+
+        """
+        nan = float("nan")
+        columns = self._columns
+        columns["started"][index] = _or(record.started, nan)
+        columns["finished"][index] = _or(record.finished, nan)
+        columns["code"][index] = record.code or 0
+        columns["sent"][index] = record.sent
+        columns["received"][index] = record.received
+        columns["warmup"][index] = record.warmup
+        columns["label"][index] = self._label_index(record.label)
+        columns["error"][index] = ERROR_INDICES[record.error]
+        for phase, values in self._phases.items():
+            values[index] = record.phases.get(phase, nan)
+
+    def _label_index(self, label):
+        index = self._label_indices.get(label)
+        if index is None:
+            if len(self.labels) > self.MAX_LABEL_INDEX:
+                raise ValueError(
+                    "Cannot store more than %d labels." % self.MAX_LABEL_INDEX)
+            index = self._label_indices[label] = len(self.labels)
+            self.labels.append(label)
+        return index
+
+
+def _or(value, default):
+    return default if value is None else value
+
+
+class Summary(object):
+    """
+    Fixed-memory aggregate of completed records.
+
+    Latencies go into a `thuum.histogram.Histogram`; everything else needed by
+    `get_time_stats` is kept as running totals, so a summary can be updated
+    per request and read back in time proportional to the number of buckets.
+
+    Requests that failed without a response are left out of the latencies
+    and throughput (a slow timeout would otherwise pass for a slow response)
+    and counted in `failures` instead, a histogram of the time taken to fail
+    for each class of error. Their status codes and bytes received are still
+    counted.
+
+    """
+    def __init__(self,
+                 significant_figures=histogram.DEFAULT_SIGNIFICANT_FIGURES):
+        self.significant_figures = significant_figures
+        self.histogram = histogram.Histogram(significant_figures)
+        self.phases = {}
+        self.failures = {}
+        self.codes = collections.Counter()
+        self.received = 0
+        self.started = None
+        self.finished = None
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        summary = cls(**kwargs)
+        for record in records:
+            summary.add(record)
+        return summary
+
+    @property
+    def count(self):
+        return self.histogram.count
+
+    def _get_phase(self, phase):
+        if phase not in self.phases:
+            self.phases[phase] = histogram.Histogram(self.significant_figures)
+        return self.phases[phase]
+
+    def _get_failures(self, error):
+        if error not in self.failures:
+            self.failures[error] = histogram.Histogram(self.significant_figures)
+        return self.failures[error]
+
+    @property
+    def failed(self):
+        return sum(latencies.count for latencies in self.failures.values())
+
+    def add(self, record):
+        if record.finished is None:
+            return
+
+        self.codes[record.code] += 1
+        self.received += record.received
+        if record.code == 599:
+            self._get_failures(record.error or "other").record(
+                record.finished - record.started)
+            return
+
+        self.histogram.record(record.finished - record.started)
+        for phase, duration in record.phases.items():
+            self._get_phase(phase).record(duration)
+
+        if self.started is None or record.started < self.started:
+            self.started = record.started
+        if self.finished is None or record.finished > self.finished:
+            self.finished = record.finished
+
+    def add_columns(self, store, selected):
+        """
+        Add the records of a `RecordStore` selected by a NumPy boolean mask,
+        working on its columns in bulk rather than record by record.
+
+        """
+        started = _column(store, "started")[selected]
+        if not len(started):
+            return
+        finished = _column(store, "finished")[selected]
+        failed = _column(store, "code")[selected] == 599
+        errors = _column(store, "error")[selected]
+
+        self.histogram.record_many((finished - started)[~failed])
+        for phase in PHASES:
+            durations = _column(store, phase)[selected][~failed]
+            durations = durations[~numpy.isnan(durations)]
+            if len(durations):
+                self._get_phase(phase).record_many(durations)
+        for index in numpy.unique(errors[failed]).tolist():
+            error = failed & (errors == index)
+            self._get_failures(ERROR_CODES[index] or "other").record_many(
+                (finished - started)[error])
+
+        codes, counts = numpy.unique(
+            _column(store, "code")[selected], return_counts=True)
+        self.codes.update(dict(zip(codes.tolist(), counts.tolist())))
+        self.received += int(_column(store, "received")[selected].sum())
+        if failed.all():
+            return
+
+        first = float(started[~failed].min())
+        last = float(finished[~failed].max())
+        if self.started is None or first < self.started:
+            self.started = first
+        if self.finished is None or last > self.finished:
+            self.finished = last
+
+    def merge(self, other):
+        """
+        Add everything summarized by `other` to this summary.
+
+        """
+        self.histogram.merge(other.histogram)
+        for phase, latencies in other.phases.items():
+            self._get_phase(phase).merge(latencies)
+        for error, latencies in other.failures.items():
+            self._get_failures(error).merge(latencies)
+        self.codes.update(other.codes)
+        self.received += other.received
+
+        if other.started is not None:
+            if self.started is None or other.started < self.started:
+                self.started = other.started
+        if other.finished is not None:
+            if self.finished is None or other.finished > self.finished:
+                self.finished = other.finished
+
+    def to_dict(self, origin=0.0):
+        """
+        The summary as a JSON serializable dict, with its start and finish
+        times relative to `origin`.
+
+        """
+        return {
+            "histogram": self.histogram.to_dict(),
+            "phases": dict(
+                (phase, latencies.to_dict())
+                for phase, latencies in self.phases.items()),
+            "failures": dict(
+                (error, latencies.to_dict())
+                for error, latencies in self.failures.items()),
+            "codes": sorted(self.codes.items()),
+            "received": self.received,
+            "started": _offset(self.started, -origin),
+            "finished": _offset(self.finished, -origin),
+        }
+
+    @classmethod
+    def from_dict(cls, state, origin=0.0):
+        """
+        Rebuild a summary from `to_dict()`, adding `origin` to its times.
+
+        """
+        histogram_ = histogram.Histogram.from_dict(state["histogram"])
+        summary = cls(histogram_.significant_figures)
+        summary.histogram = histogram_
+        summary.phases = dict(
+            (phase, histogram.Histogram.from_dict(latencies))
+            for phase, latencies in state["phases"].items())
+        summary.failures = dict(
+            (error, histogram.Histogram.from_dict(latencies))
+            for error, latencies in state["failures"].items())
+        summary.codes.update(dict(state["codes"]))
+        summary.received = state["received"]
+        summary.started = _offset(state["started"], origin)
+        summary.finished = _offset(state["finished"], origin)
+        return summary
+
+
+def _offset(value, offset):
+    return None if value is None else value + offset
+
+
+class Windows(object):
+    """
+    Statistics of the requests completed in consecutive `interval` second
+    windows of a test, starting at `origin`.
+
+    Adding a record only updates the running totals and histogram of the
+    window it finished in. Windows are closed, in order and including any in
+    which nothing completed, once `advance()` is called with a time at least
+    `lag` seconds past their end; `on_window` is then called with a dict of
+    the window's statistics. Records finishing in a window that was already
+    closed are counted in the oldest open one.
+
+    """
+    def __init__(self, on_window, interval=1.0, lag=0.0,
+                 significant_figures=histogram.DEFAULT_SIGNIFICANT_FIGURES):
+        assert interval > 0
+        self.on_window = on_window
+        self.interval = float(interval)
+        self.lag = lag
+        self.significant_figures = significant_figures
+        self.origin = None
+        self._next = 0
+        self._open = {}
+
+    def _new_window(self):
+        return {
+            "count": 0,
+            "errors": 0,
+            "received": 0,
+            "latencies": histogram.Histogram(self.significant_figures),
+        }
+
+    def add(self, record):
+        if record.finished is None:
+            return
+        if self.origin is None:
+            self.origin = record.started
+        index = max(self._next, int((record.finished - self.origin) / self.interval))
+        window = self._open.get(index)
+        if window is None:
+            window = self._open[index] = self._new_window()
+        window["count"] += 1
+        window["received"] += record.received
+        window["latencies"].record(record.finished - record.started)
+        if record.code >= 400:
+            window["errors"] += 1
+
+    def merge(self, index, window):
+        """
+        Add the totals of a window counted elsewhere (as in a `Digest`) to the
+        window at `index`, or to the oldest open window if it is closed.
+
+        """
+        index = max(self._next, index)
+        ours = self._open.get(index)
+        if ours is None:
+            ours = self._open[index] = self._new_window()
+        for name in ("count", "errors", "received"):
+            ours[name] += window[name]
+        ours["latencies"].merge(window["latencies"])
+
+    def _close(self, index, end):
+        window = self._open.pop(index, None) or self._new_window()
+        started = index * self.interval
+        duration = min(self.interval, end - started) or self.interval
+        latencies = window["latencies"].percentiles(WINDOW_PERCENTILES)
+
+        stats = collections.OrderedDict([
+            ("started", started),
+            ("duration", duration),
+            ("count", window["count"]),
+            ("rps", window["count"] / duration),
+            ("errors", window["errors"]),
+            ("received", window["received"]),
+        ])
+        for percentile in WINDOW_PERCENTILES:
+            stats[percentile_label(percentile)] = latencies[percentile]
+
+        self._next = index + 1
+        self.on_window(stats)
+
+    def advance(self, now):
+        """
+        Close every window that ended at least `lag` seconds before `now`.
+
+        """
+        if self.origin is None:
+            return
+        elapsed = now - self.origin - self.lag
+        while (self._next + 1) * self.interval <= elapsed:
+            self._close(self._next, (self._next + 1) * self.interval)
+
+    def finish(self, now):
+        """
+        Close all remaining windows, the last of which may be partial.
+
+        """
+        if self.origin is None:
+            return
+        elapsed = now - self.origin
+        last = max([int(elapsed / self.interval)] + list(self._open))
+        while self._next <= last:
+            self._close(self._next, elapsed)
 
 
 class Tracker(object):
-    def __init__(self, runner=None):
+    """
+    Collects `Record` objects for the requests made by a runner.
+
+    Every completed record is added to `summary`. The records themselves are
+    only retained (in a `RecordStore`, returned by `get_records()`) when
+    `keep_records` is set, as a long test can make far more requests than is
+    reasonable to hold in memory.
+
+    Records are also grouped by when they finished into `window_interval`
+    second windows, the statistics of which are emitted as "window_finished"
+    events during the test (see `Windows` and `update_windows()`).
+
+    For runners that vary the load in stages each completed record is also
+    added to the summary of the stage it was started in. `stages` is a list of
+    `(stage, summary)` pairs in the order the stages began.
+
+    Records started in the first `warmup` seconds of the test, or among the
+    first `warmup_requests` to complete, are tagged as warm-up and added to
+    `warmup_summary` instead of `summary` and the stages. They are still
+    included in the windows.
+
+    Records of requests with a `label` (see `thuum.sources.request_factory`)
+    are also added to the summary for that label in `labels`. Only the first
+    `max_labels` labels are kept apart, so that labelling requests by e.g. an
+    unbounded number of URLs cannot use unbounded memory; records with any
+    other label are relabelled `OTHER_LABEL`.
+
+    `overhead` holds the measurements of the load generator's own overhead
+    made during the test, if any (see `thuum.monitor.Monitor`).
+
+    With a `validator` (see `thuum.validation.Validator`) the responses to the
+    requests it makes are checked as they stream in, and those failing a
+    check counted as "invalid_<check>" in `counters` ("bodies_checked"
+    counting the bodies sampled).
+
+    Instead of records, a tracker may be given the `Digest`s of requests
+    tracked elsewhere (e.g. by a `thuum.distributed` agent), which are merged
+    into its summaries and windows.
+
+    """
+    max_labels = MAX_LABELS
+
+    def __init__(self, runner=None, keep_records=True,
+                 significant_figures=histogram.DEFAULT_SIGNIFICANT_FIGURES,
+                 window_interval=1.0, window_lag=0.0, warmup=0,
+                 warmup_requests=0, validator=None):
         self.events = EventEmitter()
         self.started = None
         self.finished = None
         self.requests = 0
+        self.counters = collections.Counter()
+        self.overhead = None
+        self.summary = Summary(significant_figures)
+        self.warmup_summary = Summary(significant_figures)
+        self.warmup = warmup
+        self.warmup_requests = warmup_requests
+        self.stages = []
+        self.labels = {}
+        self._label_names = set()
+        self.windows = Windows(
+            functools.partial(self.events.emit, "window_finished"),
+            window_interval,
+            window_lag,
+            significant_figures)
+        self.keep_records = keep_records
+        self.validator = validator
         self._pending = {}
-        self._records = []
+        self._bodies = {}
+        self._records = RecordStore()
+        self._stage_starts = []
+        self._completed = 0
 
         if runner:
             self._attach_to(runner)
@@ -51,33 +655,314 @@ class Tracker(object):
     def _attach_to(self, runner):
         runner.events.on("tests_started", self.tests_started)
         runner.events.on("tests_finished", self.tests_finished)
-        runner.events.on("request_ready", self.request_ready)
-        runner.events.on("request_started", self.request_started)
-        runner.events.on("request_finished", self.request_finished)
+        # Runners that can call the tracker for each request directly (see
+        # `thuum.runners.Runner.add_observer()`) skip their event emitter.
+        add_observer = getattr(runner, "add_observer", None)
+        if add_observer is not None:
+            add_observer(self)
+        else:
+            runner.events.on("request_ready", self.request_ready)
+            runner.events.on("request_started", self.request_started)
+            runner.events.on("request_finished", self.request_finished)
+        runner.events.on("request_late", self.request_late)
+        runner.events.on("request_dropped", self.request_dropped)
+        runner.events.on("stage_started", self.stage_started)
+        runner.events.on("connection_opened", self.connection_opened)
+        runner.events.on("connection_reused", self.connection_reused)
+        runner.events.on("connection_failed", self.connection_failed)
+        runner.events.on("record_received", self.add_record)
+        runner.events.on("counters_received", self.add_counters)
+        runner.events.on("digest_received", self.add_digest)
 
     def get_records(self):
         return self._records
 
+    def get_summary(self):
+        return self.summary
+
+    def update_windows(self):
+        """
+        Emit the statistics of any windows that have ended.
+
+        """
+        self.windows.advance(time.time())
+
     def tests_started(self):
         self.started = time.time()
+        self.windows.origin = self.started
 
     def tests_finished(self):
         self.finished = time.time()
+        self.windows.finish(self.finished)
         self.events.emit("tests_finished", self)
 
+    def stage_started(self, index, stage):
+        self._stage_starts.append(time.time())
+        self.stages.append((stage, Summary(self.summary.significant_figures)))
+
+    def _stage_index(self, record):
+        index = bisect.bisect_right(self._stage_starts, record.started) - 1
+        return max(0, index)
+
+    def _add_to_stage(self, record):
+        if not self.stages or record.finished is None:
+            return
+        _, summary = self.stages[self._stage_index(record)]
+        summary.add(record)
+
+    def _is_warmup(self, record):
+        self._completed += 1
+        if self._completed <= self.warmup_requests:
+            return True
+        return (
+            self.started is not None
+            and record.started < self.started + self.warmup)
+
+    def _add_completed(self, record):
+        if record.warmup:
+            self.warmup_summary.add(record)
+        else:
+            self.summary.add(record)
+            self._add_to_stage(record)
+            if record.label is not None:
+                self._add_to_label(record)
+        self.windows.add(record)
+        self.events.emit("request_finished", record)
+
+    def _cap_label(self, label):
+        """
+        `label`, or `OTHER_LABEL` if it would be one more than `max_labels`.
+
+        """
+        if label is None or label in self._label_names:
+            return label
+        if len(self._label_names) >= self.max_labels:
+            return OTHER_LABEL
+        self._label_names.add(label)
+        return label
+
+    def _get_label_summary(self, label):
+        label = self._cap_label(label)
+        summary = self.labels.get(label)
+        if summary is None:
+            summary = Summary(self.summary.significant_figures)
+            self.labels[label] = summary
+        return summary
+
+    def _add_to_label(self, record):
+        self._get_label_summary(record.label).add(record)
+
     def request_ready(self, future, request):
         record = Record()
+        record.label = self._cap_label(getattr(request, "label", None))
         request.streaming_callback = record.on_received
-        self._pending[future] = record
-        self._records.append(record)
+        if self.validator is not None:
+            body = self.validator.start()
+            if body is not None:
+                self._bodies[future] = body
+                request.streaming_callback = functools.partial(
+                    _on_received, record, body)
+        index = self._records.append(record) if self.keep_records else None
+        self._pending[future] = (record, index)
 
     def request_started(self, future):
-        self._pending[future].start()
+        record, _ = self._pending[future]
+        record.start()
 
     def request_finished(self, future):
-        record = self._pending.pop(future)
+        record, index = self._pending.pop(future)
         record.complete(future)
-        self.events.emit("request_finished", record)
+        if self.validator is not None:
+            self._validate(record, future.result(), self._bodies.pop(future, None))
+        record.warmup = self._is_warmup(record)
+        if index is not None:
+            self._records.update(index, record)
+        self._add_completed(record)
+
+    def _validate(self, record, response, body):
+        if record.code == 599:
+            return
+        if body is not None:
+            self.counters["bodies_checked"] += 1
+        record.invalid = self.validator.check(response, body)
+        if record.invalid is not None:
+            self.counters["invalid_%s" % record.invalid] += 1
+
+    def request_late(self):
+        self.counters["late"] += 1
+
+    def request_dropped(self):
+        self.counters["dropped"] += 1
+
+    def connection_opened(self):
+        self.counters["connections_opened"] += 1
+
+    def connection_reused(self):
+        self.counters["connections_reused"] += 1
+
+    def connection_failed(self):
+        self.counters["connections_failed"] += 1
+
+    def add_counters(self, counters):
+        """
+        Add counters collected elsewhere (e.g. in a worker process).
+
+        """
+        self.counters.update(counters)
+
+    def add_record(self, record):
+        """
+        Add a record completed elsewhere (e.g. in a worker process).
+
+        """
+        record.warmup = self._is_warmup(record)
+        record.label = self._cap_label(record.label)
+        if self.keep_records:
+            self._records.append(record)
+        self._add_completed(record)
+
+    def add_store(self, store):
+        """
+        Add the completed records of a `RecordStore`, e.g. one read from a
+        results file, keeping their warm-up tags. Only the summaries are
+        updated; with NumPy installed they are updated in bulk.
+
+        """
+        if numpy is None:
+            for record in store:
+                if record.finished is None:
+                    continue
+                if record.warmup:
+                    self.warmup_summary.add(record)
+                else:
+                    self.summary.add(record)
+                    if record.label is not None:
+                        self._add_to_label(record)
+            return
+
+        completed = ~numpy.isnan(_column(store, "finished"))
+        warmup = _column(store, "warmup") != 0
+        self.warmup_summary.add_columns(store, completed & warmup)
+        completed &= ~warmup
+        self.summary.add_columns(store, completed)
+
+        labels = _column(store, "label")
+        for index, label in enumerate(store.labels):
+            if label is None:
+                continue
+            self._get_label_summary(label).add_columns(
+                store, completed & (labels == index))
+
+    def add_digest(self, state):
+        """
+        Merge the state of a `Digest` taken elsewhere (e.g. by an agent), whose
+        times are relative to the start of its test, as if it were this one.
+
+        """
+        origin = self.started or 0.0
+
+        def load(summary_state):
+            return Summary.from_dict(summary_state, origin)
+
+        self.summary.merge(load(state["summary"]))
+        self.warmup_summary.merge(load(state["warmup"]))
+        for label, summary_state in state["labels"]:
+            self._get_label_summary(label).merge(load(summary_state))
+        for index, summary_state in state["stages"]:
+            if self.stages:
+                _, summary = self.stages[min(index, len(self.stages) - 1)]
+                summary.merge(load(summary_state))
+        for index, window in state["windows"]:
+            window = dict(window)
+            window["latencies"] = histogram.Histogram.from_dict(window["latencies"])
+            self.windows.merge(index, window)
+
+
+def _on_received(record, body, chunk):
+    record.on_received(chunk)
+    body.feed(chunk)
+
+
+class Digest(object):
+    """
+    Compact, mergeable statistics of the requests completed by a `Tracker`
+    since the digest was last taken.
+
+    Rather than sending every record, the digest keeps a `Summary` of the
+    test, of its warm-up, and of each label and stage, as well as the totals
+    of each of the tracker's windows. `take()` returns all of these as a JSON
+    serializable dict (with times relative to the start of the test) for
+    `Tracker.add_digest()`, and starts over.
+
+    """
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.count = 0
+        self._reset()
+        tracker.events.on("request_finished", self.add)
+
+    def _reset(self):
+        significant_figures = self.tracker.summary.significant_figures
+        self.summary = Summary(significant_figures)
+        self.warmup = Summary(significant_figures)
+        self.labels = {}
+        self.stages = {}
+        self.windows = Windows(
+            lambda stats: None,
+            self.tracker.windows.interval,
+            significant_figures=significant_figures)
+
+    def _get(self, summaries, key):
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = Summary(self.summary.significant_figures)
+        return summary
+
+    def add(self, record):
+        if record.finished is None:
+            return
+
+        self.count += 1
+        self.windows.origin = self.tracker.started
+        self.windows.add(record)
+        if record.warmup:
+            self.warmup.add(record)
+            return
+
+        self.summary.add(record)
+        if record.label is not None:
+            self._get(self.labels, record.label).add(record)
+        if self.tracker.stages:
+            self._get(self.stages, self.tracker._stage_index(record)).add(record)
+
+    def take(self):
+        """
+        Return the state of the digest and start a new one.
+
+        """
+        origin = self.tracker.started or 0.0
+        state = {
+            "count": self.count,
+            "summary": self.summary.to_dict(origin),
+            "warmup": self.warmup.to_dict(origin),
+            "labels": [
+                (label, summary.to_dict(origin))
+                for label, summary in self.labels.items()
+            ],
+            "stages": [
+                (index, summary.to_dict(origin))
+                for index, summary in self.stages.items()
+            ],
+            "windows": [],
+        }
+        for index, window in sorted(self.windows._open.items()):
+            window = dict(window)
+            window["latencies"] = window["latencies"].to_dict()
+            state["windows"].append((index, window))
+
+        self.count = 0
+        self._reset()
+        return state
 
 
 def standard_deviation(values):
@@ -89,30 +974,147 @@ def standard_deviation(values):
             for v in values
         ) / count)
 
-def get_time_stats(results):
-    completed = [r for r in results if r.finished is not None]
+def percentile_label(percentile):
+    """
+    Label for a percentile, e.g. "p50" or "p99.9".
+
+    """
+    return "p%g" % percentile
+
+
+def get_phase_stats(latencies, percentiles=DEFAULT_PERCENTILES):
+    values = latencies.percentiles(percentiles)
+    return {
+        "avg": latencies.mean,
+        "min": latencies.min,
+        "max": latencies.max,
+        "percentiles": collections.OrderedDict(
+            (percentile_label(p), values[p]) for p in percentiles),
+    }
+
+
+def get_failure_stats(summary, percentiles=DEFAULT_PERCENTILES):
+    """
+    The number of requests of a `Summary` that failed without a response for
+    each class of error (in the order of `thuum.engines.ERRORS`), with the
+    average, fastest, slowest and percentiles of the time they took to fail.
+
+    """
+    failures = collections.OrderedDict()
+    for error in engines.ERRORS:
+        latencies = summary.failures.get(error)
+        if latencies is not None and latencies.count:
+            failures[error] = dict(
+                get_phase_stats(latencies, percentiles), count=latencies.count)
+    return failures
+
 
-    if len(completed) == 0:
+def get_time_stats(results, percentiles=DEFAULT_PERCENTILES):
+    """
+    Compute timing statistics from a `Summary`, a `RecordStore` or an iterable
+    of records. The columns of a `RecordStore` are aggregated with NumPy when
+    it is installed, giving exact percentiles.
+
+    The requested latency percentiles are included (ordered, and keyed by
+    `percentile_label`) under "percentiles", and the average, fastest, slowest
+    and percentiles of each measured phase of the requests under "phases".
+    Requests that failed without a response are left out (see
+    `get_failure_stats()`). Returns `None` if no requests were completed.
+
+    """
+    if isinstance(results, RecordStore) and numpy is not None:
+        return _get_store_time_stats(results, percentiles)
+
+    summary = results
+    if isinstance(results, RecordStore):
+        summary = Summary.from_records(r for r in results if not r.warmup)
+    elif not isinstance(summary, Summary):
+        summary = Summary.from_records(results)
+
+    latencies = summary.histogram
+    if latencies.count == 0:
         return None
 
-    times = [r.finished - r.started for r in completed]
-    total = sum(times)
-    count = len(times)
-    received = sum(r.received for r in completed)
-    duration = (
-        max(r.finished for r in completed)
-        -min(r.started for r in completed)
-    )
+    duration = summary.finished - summary.started
+    values = latencies.percentiles(percentiles)
 
     stats = {
-        "count": count,
+        "count": latencies.count,
         "dur": duration,
-        "avg": total / float(count),
-        "min": min(times),
-        "max": max(times),
-        "rps": count / float(duration),
-        "received": received,
-        "dev": standard_deviation(times),
+        "avg": latencies.mean,
+        "min": latencies.min,
+        "max": latencies.max,
+        "rps": latencies.count / float(duration),
+        "received": summary.received,
+        "dev": latencies.stddev,
+        "percentiles": collections.OrderedDict(
+            (percentile_label(p), values[p]) for p in percentiles),
+        "phases": collections.OrderedDict(
+            (phase, get_phase_stats(summary.phases[phase], percentiles))
+            for phase in PHASES
+            if phase in summary.phases),
     }
 
     return stats
+
+
+def _column(store, name):
+    values = store.column(name)
+    return numpy.frombuffer(values, dtype=numpy.dtype(values.typecode))
+
+
+def _select_percentiles(values, percentiles):
+    """
+    Nearest-rank percentiles of `values` found by a single partial sort.
+
+    """
+    ranks = [
+        min(len(values), max(1, int(math.ceil(p / 100.0 * len(values))))) - 1
+        for p in percentiles
+    ]
+    selected = numpy.partition(values, sorted(set(ranks)))
+    return collections.OrderedDict(
+        (percentile_label(p), float(selected[rank]))
+        for p, rank in zip(percentiles, ranks))
+
+
+def _get_store_time_stats(store, percentiles):
+    started = _column(store, "started")
+    finished = _column(store, "finished")
+    counted = ~numpy.isnan(finished) & (_column(store, "warmup") == 0)
+    completed = counted & (_column(store, "code") != 599)
+    count = int(completed.sum())
+
+    if count == 0:
+        return None
+
+    started = started[completed]
+    finished = finished[completed]
+    times = finished - started
+    duration = float(finished.max() - started.min())
+    received = _column(store, "received")
+
+    phases = collections.OrderedDict()
+    for phase in PHASES:
+        durations = _column(store, phase)[completed]
+        durations = durations[~numpy.isnan(durations)]
+        if len(durations):
+            phases[phase] = {
+                "avg": float(durations.mean()),
+                "min": float(durations.min()),
+                "max": float(durations.max()),
+                "percentiles": _select_percentiles(durations, percentiles),
+            }
+
+    return {
+        "count": count,
+        "dur": duration,
+        "avg": float(times.mean()),
+        "min": float(times.min()),
+        "max": float(times.max()),
+        "rps": count / duration,
+        "received": int(received[counted].sum()),
+        "dev": float(times.std()),
+        "percentiles": _select_percentiles(times, percentiles),
+        "phases": phases,
+    }
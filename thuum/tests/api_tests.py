@@ -0,0 +1,103 @@
+import mock
+import os
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from tornado import ioloop
+
+import thuum
+from thuum import (
+    api,
+    benchmark,
+    loops,
+)
+
+
+class Function_run_Tests(unittest.TestCase):
+    def setUp(self):
+        process, self.url = benchmark.start_server("raw")
+        self.addCleanup(process.terminate)
+
+    def test_run(self):
+        result = thuum.run(
+            [self.url, "-n", "20", "-c", "2", "--percentiles", "50,99"])
+
+        self.assertEqual(result.count, 20)
+        self.assertGreater(result.rps, 0)
+        self.assertEqual(result.codes, {200: 20})
+        self.assertEqual(list(result.percentiles), ["p50", "p99"])
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(result.counters["connections_opened"], 20)
+        self.assertIn("timeseries", result.to_dict())
+
+    def test_failed_requests(self):
+        result = thuum.run(["http://127.0.0.1:1/", "-n", "5", "--engine", "raw"])
+
+        self.assertEqual(result.count, 0)
+        self.assertIsNone(result.stats)
+        self.assertEqual(result.percentiles, {})
+        self.assertEqual(result.failed, 5)
+        self.assertEqual(result.failures["refused"]["count"], 5)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "requires /proc")
+    def test_repeated_runs(self):
+        current = ioloop.IOLoop.current()
+        plan = [self.url, "-n", "20", "-c", "2", "--engine", "raw"]
+        thuum.run(plan)
+        descriptors = len(os.listdir("/proc/self/fd"))
+
+        for _ in range(3):
+            self.assertEqual(thuum.run(plan).count, 20)
+
+        self.assertEqual(len(os.listdir("/proc/self/fd")), descriptors)
+        self.assertIs(ioloop.IOLoop.current(), current)
+
+    def test_checks(self):
+        result = thuum.run([self.url, "-n", "20", "--assert", "rps>0,errors>0"])
+
+        self.assertFalse(result.passed)
+        self.assertEqual(
+            [check["passed"] for check in result.summary["checks"]["thresholds"]],
+            [True, False])
+        self.assertTrue(thuum.run([self.url, "-n", "20"]).passed)
+
+    def test_invalid_plan(self):
+        with self.assertRaises(ValueError):
+            thuum.run([self.url])
+        with self.assertRaises(ValueError):
+            thuum.run([self.url, "-n", "20", "-w", "0"])
+
+    @unittest.skipUnless("asyncio" in loops.available_loops(), "requires asyncio")
+    def test_run_async(self):
+        event_loop = loops.asyncio.new_event_loop()
+        self.addCleanup(event_loop.close)
+        loops.asyncio.set_event_loop(event_loop)
+        self.addCleanup(loops.asyncio.set_event_loop, None)
+
+        result = event_loop.run_until_complete(
+            thuum.run_async([self.url, "-n", "20"]))
+
+        self.assertEqual(result.count, 20)
+
+
+class Function_parse_plan_Tests(unittest.TestCase):
+    def test_parse_plan(self):
+        args = api.parse_plan(["http://localhost/", "-d", "10", "-c", "5"])
+
+        self.assertEqual(args.duration, 10)
+        self.assertEqual(args.concurrency, 5)
+
+    def test_invalid_argument(self):
+        with self.assertRaises(ValueError) as context:
+            api.parse_plan(["http://localhost/", "-n", "ten"])
+
+        self.assertIn("invalid int value", str(context.exception))
+
+    def test_help(self):
+        with mock.patch("sys.stdout", new_callable=StringIO):
+            with self.assertRaises(ValueError):
+                api.parse_plan(["--help"])
@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from thuum import (
+    benchmark,
+    loops,
+)
+
+
+def get_case(engine="raw", concurrency=10, rps=1000.0, cpu=0.001):
+    return {
+        "engine": engine,
+        "runner": "quantity",
+        "concurrency": concurrency,
+        "count": 100,
+        "rps": rps,
+        "cpu": cpu,
+    }
+
+
+class Function_main_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_benchmark(self):
+        stdout = StringIO()
+
+        benchmark.main(["-n", "20", "-c", "2", "--engine", "raw"], stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertRegexpMatches(lines[1], r"^raw\s+quantity\s+tornado\s+2\s+20\s+\d+\.\d+")
+
+    def test_suite(self):
+        stdout = StringIO()
+        output = os.path.join(self.directory, "results.json")
+
+        benchmark.main([
+            "-n", "20", "-c", "1", "-c", "2", "-d", "0.2",
+            "--engine", "raw",
+            "--runner", "quantity", "--runner", "staged",
+            "--server", "raw", "--size", "100", "--latency", "0.001",
+            "--output", output,
+        ], stdout)
+
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(
+            [(c["runner"], c["concurrency"]) for c in results["cases"]],
+            [("quantity", 1), ("quantity", 2), ("staged", 1), ("staged", 2)])
+        self.assertEqual(results["cases"][0]["count"], 20)
+        self.assertGreater(results["cases"][0]["cpu"], 0)
+        self.assertEqual(results["server"]["kind"], "raw")
+        self.assertEqual(len(stdout.getvalue().splitlines()), 5)
+
+    def test_baseline_regression(self):
+        stdout = StringIO()
+        baseline = os.path.join(self.directory, "baseline.json")
+        with open(baseline, "w") as f:
+            json.dump({"cases": [get_case(concurrency=2, rps=1e9, cpu=1e-9)]}, f)
+
+        status = benchmark.main([
+            "-n", "20", "-c", "2", "--engine", "raw", "--baseline", baseline,
+        ], stdout)
+
+        self.assertEqual(status, 1)
+        self.assertRegexpMatches(
+            stdout.getvalue().splitlines()[-1],
+            r"^raw\s+quantity\s+tornado\s+2\s+RPS.*REGRESSION$")
+
+    def test_overhead(self):
+        stdout = StringIO()
+
+        benchmark.main(["--overhead", "-n", "20", "-c", "2"], stdout)
+
+        self.assertRegexpMatches(
+            stdout.getvalue(), r"^Overhead per request on tornado: \d+\.\d+us")
+
+    @unittest.skipUnless("asyncio" in loops.available_loops(), "requires asyncio")
+    def test_loops(self):
+        stdout = StringIO()
+
+        benchmark.main([
+            "-n", "20", "-c", "2", "--engine", "raw",
+            "--loop", "tornado", "--loop", "asyncio",
+        ], stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertRegexpMatches(lines[1], r"^raw\s+quantity\s+tornado\s+2\s+20\s")
+        self.assertRegexpMatches(lines[2], r"^raw\s+quantity\s+asyncio\s+2\s+20\s")
+
+    def test_unavailable_loop(self):
+        with mock.patch.object(loops, "available_loops", return_value=["tornado"]):
+            with mock.patch("sys.stderr", new_callable=StringIO):
+                with self.assertRaises(SystemExit):
+                    benchmark.main(["--loop", "uvloop"], StringIO())
+
+
+class Function_compare_Tests(unittest.TestCase):
+    def test_compare(self):
+        baseline = {"cases": [
+            get_case(concurrency=10),
+            get_case(concurrency=100),
+            get_case(engine="simple"),
+        ]}
+        cases = [
+            get_case(concurrency=10, rps=950.0, cpu=0.00105),
+            get_case(concurrency=100, rps=800.0),
+            get_case(concurrency=1000),
+            dict(get_case(concurrency=10), loop="uvloop"),
+        ]
+
+        changes = list(benchmark.compare(cases, baseline, 0.1))
+
+        self.assertEqual(
+            [(c["concurrency"], c["regression"]) for c in changes],
+            [(10, False), (100, True)])
+        self.assertAlmostEqual(changes[0]["rps_change"], -0.05)
+        self.assertAlmostEqual(changes[0]["cpu_change"], 0.05)
+
+
+class Function_measure_overhead_Tests(unittest.TestCase):
+    def test_overhead(self):
+        # Generous enough for a slow machine, but catches any dispatch cost
+        # that grows with the number of requests or their concurrency.
+        overhead = benchmark.measure_overhead(5000, 1000)
+
+        self.assertGreater(overhead, 0)
+        self.assertLess(overhead, 0.002)
@@ -0,0 +1,218 @@
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from thuum import (
+    checks,
+    histogram,
+    stats,
+)
+
+
+def get_summary(latencies, significant_figures=2):
+    records = []
+    for started, latency in enumerate(latencies):
+        record = stats.Record()
+        record.started = float(started)
+        record.finished = started + latency
+        record.code = 200
+        records.append(record)
+    return stats.Summary.from_records(
+        records, significant_figures=significant_figures)
+
+
+def get_histogram(values, significant_figures=2):
+    latencies = histogram.Histogram(significant_figures)
+    for value in values:
+        latencies.record(value)
+    return latencies
+
+
+class Function_parse_threshold_Tests(unittest.TestCase):
+    def test_latency(self):
+        self.assertEqual(
+            checks.parse_threshold(" p99.9 <= 200ms"),
+            checks.Threshold("p99.9 <= 200ms", "p99.9", "<=", 0.2))
+        self.assertEqual(checks.parse_threshold("avg<2").limit, 2)
+        self.assertAlmostEqual(checks.parse_threshold("max<5us").limit, 5e-6)
+
+    def test_errors(self):
+        self.assertEqual(
+            checks.parse_threshold("errors<0.1%"),
+            checks.Threshold("errors<0.1%", "error_rate", "<", 0.001))
+        self.assertEqual(checks.parse_threshold("errors<5").metric, "errors")
+
+    def test_invalid(self):
+        for expression in ("p99", "p99=1", "p0<1", "rps>5ms", "p99<1%", "foo<1"):
+            with self.assertRaises(ValueError):
+                checks.parse_threshold(expression)
+
+    def test_parse_thresholds(self):
+        thresholds = checks.parse_thresholds("p99<200ms,rps>500")
+
+        self.assertEqual([t.metric for t in thresholds], ["p99", "rps"])
+
+
+class Function_check_thresholds_Tests(unittest.TestCase):
+    def test_check_thresholds(self):
+        summary = get_summary([0.1] * 9 + [0.3])
+        summary.codes[500] += 1
+        thresholds = checks.parse_thresholds(
+            "p50<200ms,p99<200ms,errors<=1,errors<10%,requests>=10")
+
+        results = checks.check_thresholds(thresholds, summary)
+
+        self.assertEqual(
+            [result["passed"] for result in results],
+            [True, False, True, True, True])
+        self.assertEqual(results[1]["formatted"], "0.3000s")
+        self.assertEqual(results[3]["formatted"], "9.09%")
+
+    def test_no_requests(self):
+        thresholds = checks.parse_thresholds("p99<1s,rps<1,errors<1%")
+
+        results = checks.check_thresholds(thresholds, stats.Summary())
+
+        self.assertEqual(
+            [result["passed"] for result in results], [False, True, False])
+
+
+class Function_mann_whitney_Tests(unittest.TestCase):
+    def test_separated(self):
+        baseline = get_histogram([0.001, 0.002, 0.003])
+        latencies = get_histogram([0.004, 0.005, 0.006])
+
+        # U is 9 of a mean of 4.5 with a variance of 5.25.
+        z = (9 - 4.5 - 0.5) / math.sqrt(5.25)
+        self.assertAlmostEqual(
+            checks.mann_whitney(baseline, latencies),
+            0.5 * math.erfc(z / math.sqrt(2)))
+        self.assertGreater(checks.mann_whitney(latencies, baseline), 0.9)
+
+    def test_ties(self):
+        latencies = get_histogram([0.001] * 10)
+
+        self.assertEqual(checks.mann_whitney(latencies, latencies), 1.0)
+
+    def test_noise(self):
+        random.seed(0)
+        baseline = get_histogram(random.gauss(0.1, 0.01) for _ in range(2000))
+        latencies = get_histogram(random.gauss(0.1, 0.01) for _ in range(2000))
+        slower = get_histogram(random.gauss(0.105, 0.01) for _ in range(2000))
+
+        self.assertGreater(checks.mann_whitney(baseline, latencies), 0.01)
+        self.assertLess(checks.mann_whitney(baseline, slower), 1e-6)
+
+
+class Function_compare_Tests(unittest.TestCase):
+    def get_baseline(self, latencies):
+        summary = get_summary(latencies)
+        return {
+            "stats": stats.get_time_stats(summary),
+            "histogram": summary.histogram.to_dict(),
+        }
+
+    def test_regression(self):
+        baseline = self.get_baseline([0.1] * 100)
+
+        comparison = checks.compare(get_summary([0.15] * 100), baseline)
+
+        self.assertTrue(comparison["regression"])
+        self.assertAlmostEqual(comparison["p50_change"], 0.5, places=1)
+
+    def test_within_tolerance(self):
+        baseline = self.get_baseline([0.1] * 100)
+
+        comparison = checks.compare(get_summary([0.104] * 100), baseline)
+
+        self.assertLess(comparison["p_value"], checks.SIGNIFICANCE)
+        self.assertFalse(comparison["regression"])
+
+    def test_faster(self):
+        baseline = self.get_baseline([0.1] * 100)
+
+        comparison = checks.compare(get_summary([0.05] * 100), baseline, 0)
+
+        self.assertFalse(comparison["regression"])
+
+    def test_different_precision(self):
+        baseline = self.get_baseline([0.1] * 100)
+
+        comparison = checks.compare(get_summary([0.1] * 100, 3), baseline, 0)
+
+        self.assertFalse(comparison["regression"])
+        self.assertGreater(comparison["p_value"], checks.SIGNIFICANCE)
+
+    def test_no_requests(self):
+        baseline = self.get_baseline([0.1] * 100)
+
+        self.assertTrue(
+            checks.compare(stats.Summary(), baseline)["regression"])
+
+
+class Function_load_baseline_Tests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "baseline.json")
+
+    def write(self, *lines):
+        with open(self.path, "w") as f:
+            f.write("\n".join(json.dumps(line) for line in lines) + "\n")
+
+    def test_report(self):
+        histogram_ = get_histogram([0.1]).to_dict()
+        self.write({"code": 200}, {"summary": {"histogram": histogram_}})
+
+        baseline = checks.load_baseline(self.path)
+
+        self.assertEqual(list(baseline), ["histogram"])
+        self.assertEqual(baseline["histogram"]["count"], 1)
+
+    def test_summary(self):
+        histogram_ = get_histogram([0.1]).to_dict()
+        self.write({"histogram": histogram_})
+
+        self.assertEqual(
+            checks.load_baseline(self.path)["histogram"]["count"], 1)
+
+    def test_invalid(self):
+        self.write({"summary": {"stats": None}})
+        with self.assertRaises(ValueError):
+            checks.load_baseline(self.path)
+
+        self.write({"histogram": histogram.Histogram().to_dict()})
+        with self.assertRaises(ValueError):
+            checks.load_baseline(self.path)
+
+        with open(self.path, "w") as f:
+            f.write("requests")
+        with self.assertRaises(ValueError):
+            checks.load_baseline(self.path)
+
+
+class Function_run_checks_Tests(unittest.TestCase):
+    def test_run_checks(self):
+        summary = get_summary([0.1] * 10)
+
+        results = checks.run_checks(
+            summary, checks.parse_thresholds("p99<1s"), None)
+
+        self.assertTrue(results["passed"])
+        self.assertIsNone(results["baseline"])
+
+    def test_regression(self):
+        baseline = get_summary([0.01] * 10)
+        baseline = {
+            "stats": stats.get_time_stats(baseline),
+            "histogram": baseline.histogram.to_dict(),
+        }
+
+        results = checks.run_checks(
+            get_summary([0.1] * 10), checks.parse_thresholds("p99<1s"), baseline)
+
+        self.assertFalse(results["passed"])
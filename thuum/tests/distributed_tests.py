@@ -0,0 +1,147 @@
+import json
+import mock
+import socket
+import threading
+import unittest
+
+from tornado import httpclient
+
+from thuum import (
+    distributed,
+    runners,
+    stats,
+)
+from thuum.tests import utils
+
+
+class Function_parse_address_Tests(unittest.TestCase):
+    def test_host_and_port(self):
+        self.assertEqual(
+            distributed.parse_address("example.com:8000"),
+            ("example.com", 8000))
+
+    def test_default_port(self):
+        self.assertEqual(
+            distributed.parse_address("example.com"),
+            ("example.com", distributed.DEFAULT_PORT))
+
+
+class Function_decode_plan_Tests(unittest.TestCase):
+    def test_decode_plan(self):
+        plan = distributed.decode_plan(distributed.encode(
+            "plan", {"argv": [], "start_in": 1, "agent": 1, "agents": 2}))
+
+        self.assertEqual(plan["start_in"], 1.0)
+        self.assertEqual((plan["agent"], plan["agents"]), (1, 2))
+
+    def test_invalid(self):
+        for line in (b"\xff\n", b"[]\n", b'["digest", {}]\n',
+                     b'["plan", {"start_in": "soon", "agent": 0, "agents": 1}]\n',
+                     b'["plan", {"start_in": 0, "agent": 1, "agents": 1}]\n'):
+            with self.assertRaises(distributed.AgentError):
+                distributed.decode_plan(line)
+
+
+class AgentTests(unittest.TestCase):
+    def test_local_only_by_default(self):
+        agent = distributed.Agent(mock.MagicMock(), port=0)
+        self.addCleanup(agent.close)
+
+        self.assertEqual(agent.address[0], "127.0.0.1")
+
+
+class ControllerTests(utils.Base):
+    def prepare(self, plan):
+        if plan.get("fail"):
+            raise distributed.AgentError("cannot run")
+
+        client = httpclient.AsyncHTTPClient(force_instance=True)
+        runner = runners.QuantityRunner(
+            client,
+            lambda **kwargs: httpclient.HTTPRequest(self.get_url("/foo"), **kwargs),
+            plan["requests"][plan["agent"]])
+        return runner, stats.Tracker(runner, keep_records=False)
+
+    def start_agents(self, count, tests=1):
+        agents = []
+        for _ in range(count):
+            agent = distributed.Agent(self.prepare, "127.0.0.1", 0)
+            thread = threading.Thread(target=agent.serve, args=(tests,))
+            thread.daemon = True
+            thread.start()
+            self.addCleanup(agent.close)
+            agents.append(agent.address)
+        return agents
+
+    def test_run(self):
+        agents = self.start_agents(2)
+        controller = distributed.Controller(
+            agents,
+            {"requests": [3, 4]},
+            num_requests=7,
+            start_delay=0.05)
+        tracker = stats.Tracker(controller)
+
+        controller.run()
+
+        self.assertEqual(tracker.summary.count, 7)
+        self.assertEqual(tracker.summary.codes, {200: 7})
+        self.assertEqual(controller.progress()["percentage"], 100.0)
+
+    def test_agent_error(self):
+        agents = self.start_agents(1)
+        controller = distributed.Controller(
+            agents, {"fail": True}, num_requests=1, start_delay=0.05)
+
+        with self.assertRaises(distributed.AgentError) as context:
+            controller.run()
+
+        self.assertIn("cannot run", str(context.exception))
+
+    def start_fake_agent(self, reply):
+        server = socket.socket()
+        self.addCleanup(server.close)
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+
+        def serve():
+            connection, _ = server.accept()
+            self.addCleanup(connection.close)
+            connection.makefile("rb").readline()
+            # Keep the connection open, so that only the reply can end the test.
+            connection.sendall(reply)
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        return server.getsockname()
+
+    def test_bad_agent_messages(self):
+        for reply in (b"{truncated\n", b'["digest"]\n', b"5\n", b"\xff\n"):
+            agent = self.start_fake_agent(reply)
+            controller = distributed.Controller(
+                [agent], {"requests": [1]}, num_requests=1, start_delay=0.05)
+
+            with self.assertRaises(distributed.AgentError) as context:
+                controller.run()
+
+            self.assertIn("Bad message from agent", str(context.exception))
+
+    def test_invalid_messages(self):
+        agents = self.start_agents(1, tests=4)
+
+        for message in (b"hello\n", b'["plan", 1]\n', b'["plan", {}]\n'):
+            connection = socket.create_connection(agents[0])
+            self.addCleanup(connection.close)
+            connection.sendall(message)
+            kind, _ = json.loads(
+                connection.makefile("rb").readline().decode("utf-8"))
+
+            self.assertEqual(kind, "error")
+
+        # The agent still runs the tests of other controllers.
+        controller = distributed.Controller(
+            agents, {"requests": [2]}, num_requests=2, start_delay=0.05)
+        tracker = stats.Tracker(controller)
+        controller.run()
+        self.assertEqual(tracker.summary.count, 2)
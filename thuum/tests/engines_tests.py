@@ -0,0 +1,335 @@
+import errno
+import socket
+import ssl
+import unittest
+
+import mock
+
+from tornado import (
+    concurrent,
+    gen,
+    httpclient,
+    iostream,
+    testing,
+    web,
+)
+
+from thuum import (
+    engines,
+    runners,
+)
+from thuum.tests import utils
+
+
+class Chunked(web.RequestHandler):
+    def get(self):
+        self.write("foo")
+        self.flush()
+        self.write("barbaz")
+
+
+class Fixed(web.RequestHandler):
+    def get(self):
+        self.write("foobarbaz")
+
+    def post(self):
+        self.write(self.request.body)
+
+
+class Slow(web.RequestHandler):
+    @gen.coroutine
+    def get(self):
+        yield gen.sleep(0.5)
+        self.write("foo")
+
+
+def closed_future():
+    future = concurrent.Future()
+    future.set_exception(iostream.StreamClosedError())
+    return future
+
+
+def done_future(result=None):
+    future = concurrent.Future()
+    future.set_result(result)
+    return future
+
+
+class Function_classify_error_Tests(unittest.TestCase):
+    def assertClass(self, error, expected):
+        self.assertEqual(engines.classify_error(error), expected)
+
+    def test_timeouts(self):
+        self.assertClass(
+            httpclient.HTTPError(599, "Timeout while connecting"), "timeout")
+        self.assertClass(httpclient.HTTPError(599, "Timeout"), "timeout")
+        self.assertClass(socket.timeout(), "timeout")
+
+    def test_socket_errors(self):
+        refused = socket.error(errno.ECONNREFUSED, "Connection refused")
+        self.assertClass(refused, "refused")
+        self.assertClass(iostream.StreamClosedError(refused), "refused")
+        self.assertClass(socket.error(errno.ECONNRESET, "reset"), "reset")
+        self.assertClass(socket.gaierror(-2, "Name or service not known"), "dns")
+        self.assertClass(ssl.SSLError(1, "certificate verify failed"), "tls")
+
+    def test_closed(self):
+        self.assertClass(iostream.StreamClosedError(), "reset")
+
+    def test_other(self):
+        self.assertClass(httpclient.HTTPError(599, "Stream closed"), "other")
+        self.assertClass(ValueError("Only http URLs are supported"), "other")
+        self.assertClass(None, "other")
+
+
+class TornadoEngineTests(utils.Base):
+    def test_fetch(self):
+        engine = engines.TornadoEngine(self.http_client)
+        callback = mock.MagicMock(side_effect=lambda r: self.stop())
+
+        engine.fetch(self.get_request(), callback)
+        self.assertEqual(engine.active, 1)
+        self.wait()
+
+        self.assertEqual(engine.active, 0)
+        self.assertEqual(callback.call_args[0][0].code, 200)
+
+    def test_connection_events(self):
+        engine = engines.TornadoEngine(self.http_client)
+        opened = mock.MagicMock()
+        engine.events.on("connection_opened", opened)
+
+        engine.fetch(self.get_request(), lambda r: self.stop())
+        self.wait()
+
+        self.assertEqual(opened.call_count, 1)
+
+    def fetch_failing(self, port, **kwargs):
+        engine = engines.TornadoEngine(self.http_client)
+        connections = mock.MagicMock()
+        for event in engines.CONNECTION_EVENTS:
+            engine.events.on(event, getattr(connections, event))
+        request = httpclient.HTTPRequest(
+            "http://127.0.0.1:%d/" % port, **kwargs)
+
+        engine.fetch(request, self.stop)
+        response = self.wait()
+
+        self.assertEqual(response.code, 599)
+        self.assertEqual(connections.connection_opened.call_count, 0)
+        self.assertEqual(connections.connection_reused.call_count, 0)
+        return response, connections.connection_failed.call_count
+
+    def test_timeout_not_counted(self):
+        # Connections are accepted, but no response is ever sent.
+        sock, port = testing.bind_unused_port()
+        self.addCleanup(sock.close)
+
+        response, failed = self.fetch_failing(port, request_timeout=0.05)
+
+        self.assertEqual(engines.classify_error(response.error), "timeout")
+        self.assertEqual(failed, 0)
+
+    def test_connection_failed(self):
+        sock, port = testing.bind_unused_port()
+        sock.close()
+
+        response, failed = self.fetch_failing(port)
+
+        self.assertEqual(engines.classify_error(response.error), "refused")
+        self.assertEqual(failed, 1)
+
+
+class RawEngineTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return web.Application([
+            (r"/chunked", Chunked),
+            (r"/fixed", Fixed),
+            (r"/slow", Slow),
+        ])
+
+    def setUp(self):
+        super(RawEngineTests, self).setUp()
+        self.engine = engines.RawEngine(self.io_loop, 2)
+        self.received = []
+        self.connections = mock.MagicMock()
+        for event in engines.CONNECTION_EVENTS:
+            self.engine.events.on(event, getattr(self.connections, event))
+
+    def fetch(self, path, **kwargs):
+        request = httpclient.HTTPRequest(
+            self.get_url(path),
+            streaming_callback=self.received.append,
+            **kwargs)
+        self.engine.fetch(request, self.stop)
+        return self.wait()
+
+    def test_content_length(self):
+        response = self.fetch("/fixed")
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(b"".join(self.received), b"foobarbaz")
+
+    def test_chunked(self):
+        response = self.fetch("/chunked")
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(b"".join(self.received), b"foobarbaz")
+
+    def test_body(self):
+        response = self.fetch("/fixed", method="POST", body="qux")
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(b"".join(self.received), b"qux")
+
+    def test_error_code(self):
+        response = self.fetch("/missing")
+
+        self.assertEqual(response.code, 404)
+        self.assertIsNotNone(response.error)
+
+    def test_keep_alive(self):
+        self.fetch("/fixed")
+        self.fetch("/chunked")
+
+        streams, = self.engine._idle.values()
+        self.assertEqual(len(streams), 1)
+        self.assertEqual(self.connections.connection_opened.call_count, 1)
+        self.assertEqual(self.connections.connection_reused.call_count, 1)
+
+    def test_no_keep_alive(self):
+        self.engine.keepalive = False
+        self.fetch("/fixed")
+        self.fetch("/chunked")
+
+        self.assertEqual(list(self.engine._idle.values()), [[]])
+        self.assertEqual(self.engine._connections, 0)
+        self.assertEqual(self.connections.connection_opened.call_count, 2)
+        self.assertEqual(self.connections.connection_reused.call_count, 0)
+
+    def test_max_connections(self):
+        engine = engines.RawEngine(self.io_loop, 10, max_connections=1)
+        self.assertEqual(engine.max_clients, 1)
+
+        self.engine = engine
+        self.fetch("/fixed")
+        # Pretend the idle connection is to another host.
+        address, = engine._idle.keys()
+        engine._idle[("example.invalid", 80)] = engine._idle.pop(address)
+        self.fetch("/fixed")
+
+        self.assertEqual(engine._connections, 1)
+        self.assertEqual(engine._idle[("example.invalid", 80)], [])
+
+    def test_connection_failed(self):
+        sock, port = testing.bind_unused_port()
+        sock.close()
+        request = httpclient.HTTPRequest("http://127.0.0.1:%d/" % port)
+        self.engine.fetch(request, self.stop)
+
+        response = self.wait()
+
+        self.assertEqual(response.code, 599)
+        self.assertEqual(engines.classify_error(response.error), "refused")
+        self.assertEqual(self.connections.connection_failed.call_count, 1)
+        self.assertEqual(self.engine._connections, 0)
+
+    def test_request_timeout(self):
+        response = self.fetch("/slow", request_timeout=0.05)
+
+        self.assertEqual(response.code, 599)
+        self.assertEqual(engines.classify_error(response.error), "timeout")
+        self.assertLess(response.request_time, 0.5)
+        self.assertEqual(self.engine._connections, 0)
+        self.assertEqual(self.connections.connection_failed.call_count, 0)
+
+    def test_request_within_timeout(self):
+        response = self.fetch("/fixed", request_timeout=1, connect_timeout=1)
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(self.engine._connections, 1)
+
+    def test_unsupported_url(self):
+        request = httpclient.HTTPRequest("https://localhost/")
+        self.engine.fetch(request, self.stop)
+
+        response = self.wait()
+
+        self.assertEqual(response.code, 599)
+
+    def add_idle(self, path, stream):
+        request = httpclient.HTTPRequest(self.get_url(path))
+        address, _ = self.engine._encode(request)
+        self.engine._idle[address].append(stream)
+        self.engine._connections += 1
+
+    def test_idle_closed_before_response(self):
+        stream = mock.Mock()
+        stream.write.return_value = done_future()
+        stream.read_until.return_value = closed_future()
+        self.add_idle("/fixed", stream)
+
+        response = self.fetch("/fixed")
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(b"".join(self.received), b"foobarbaz")
+        self.assertTrue(stream.close.called)
+        self.assertEqual(self.connections.connection_opened.call_count, 1)
+        self.assertEqual(self.engine._connections, 1)
+
+    def test_idle_closed_mid_response(self):
+        def read_bytes(length, streaming_callback):
+            streaming_callback(b"foo")
+            return closed_future()
+
+        stream = mock.Mock()
+        stream.write.return_value = done_future()
+        stream.read_until.return_value = done_future(
+            b"HTTP/1.1 200 OK\r\nContent-Length: 9\r\n\r\n")
+        stream.read_bytes.side_effect = read_bytes
+        self.add_idle("/fixed", stream)
+
+        response = self.fetch("/fixed")
+
+        self.assertEqual(response.code, 599)
+        self.assertEqual(self.received, [b"foo"])
+        self.assertEqual(self.connections.connection_opened.call_count, 0)
+        self.assertEqual(self.connections.connection_failed.call_count, 1)
+
+    def test_idle_closed_not_idempotent(self):
+        stream = mock.Mock()
+        stream.write.return_value = done_future()
+        stream.read_until.return_value = closed_future()
+        self.add_idle("/fixed", stream)
+
+        response = self.fetch("/fixed", method="POST", body="qux")
+
+        self.assertEqual(response.code, 599)
+        self.assertEqual(engines.classify_error(response.error), "reset")
+        self.assertEqual(self.connections.connection_opened.call_count, 0)
+        self.assertEqual(self.engine._connections, 0)
+
+    def test_unexpected_error(self):
+        future = concurrent.Future()
+        future.set_exception(RuntimeError("bug"))
+
+        with mock.patch.object(self.engine, "_fetch", return_value=future):
+            response = self.fetch("/fixed")
+
+        self.assertEqual(response.code, 599)
+        self.assertIsInstance(response.error, RuntimeError)
+        self.assertEqual(self.engine.active, 0)
+
+    def test_runner(self):
+        runner = runners.QuantityRunner(
+            self.engine,
+            lambda **kwargs: httpclient.HTTPRequest(self.get_url("/fixed"), **kwargs),
+            10)
+        finished = mock.MagicMock()
+        runner.events.on("request_finished", finished)
+
+        runner.run()
+
+        self.assertEqual(finished.call_count, 10)
+        self.assertEqual(self.engine.active, 0)
+        self.assertLessEqual(len(list(self.engine._idle.values())[0]), 2)
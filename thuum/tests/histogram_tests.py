@@ -0,0 +1,114 @@
+import json
+import random
+import unittest
+
+from thuum import (
+    histogram,
+    stats,
+)
+
+
+class HistogramTests(unittest.TestCase):
+    def setUp(self):
+        self.histogram = histogram.Histogram()
+
+    def test_empty(self):
+        self.assertEqual(self.histogram.count, 0)
+        self.assertIsNone(self.histogram.mean)
+        self.assertIsNone(self.histogram.stddev)
+        self.assertEqual(self.histogram.percentiles([50]), {50: None})
+
+    def test_exact_statistics(self):
+        values = [0.1, 0.079, 0.118, 0.197]
+
+        for value in values:
+            self.histogram.record(value)
+
+        self.assertEqual(self.histogram.count, 4)
+        self.assertEqual(self.histogram.min, 0.079)
+        self.assertEqual(self.histogram.max, 0.197)
+        self.assertAlmostEqual(self.histogram.mean, sum(values) / 4)
+        self.assertAlmostEqual(
+            self.histogram.stddev,
+            stats.standard_deviation(values))
+
+    def test_distribution(self):
+        for value in (0.001, 0.001, 0.5, 0.0011):
+            self.histogram.record(value)
+
+        distribution = self.histogram.distribution()
+
+        self.assertEqual([count for _, count in distribution], [2, 1, 1])
+        self.assertAlmostEqual(distribution[-1][0], 0.5, delta=0.005)
+        # Each value is equivalent to the values of its bucket.
+        other = histogram.Histogram()
+        for value, count in distribution:
+            other.record(value, count)
+        self.assertEqual(other._counts, self.histogram._counts)
+
+    def test_percentiles_within_precision(self):
+        values = [random.uniform(0.001, 10) for _ in range(10000)]
+        for value in values:
+            self.histogram.record(value)
+
+        values.sort()
+        results = self.histogram.percentiles([50, 90, 99, 99.9])
+
+        for percentile, value in results.items():
+            expected = values[int(percentile / 100.0 * len(values)) - 1]
+            self.assertAlmostEqual(value / expected, 1, delta=0.01)
+
+    def test_percentile_extremes(self):
+        for value in (0.5, 1.5, 2.5):
+            self.histogram.record(value)
+
+        self.assertEqual(self.histogram.percentile(0), 0.5)
+        self.assertEqual(self.histogram.percentile(100), 2.5)
+
+    def test_fixed_memory(self):
+        for _ in range(10000):
+            self.histogram.record(random.uniform(0, 1))
+
+        self.assertLess(self.histogram.buckets, 2000)
+
+    def test_merge(self):
+        other = histogram.Histogram()
+        values = [random.uniform(0, 1) for _ in range(100)]
+        for value in values[:50]:
+            self.histogram.record(value)
+        for value in values[50:]:
+            other.record(value)
+
+        self.histogram.merge(other)
+
+        self.assertEqual(self.histogram.count, 100)
+        self.assertEqual(self.histogram.min, min(values))
+        self.assertEqual(self.histogram.max, max(values))
+        self.assertAlmostEqual(
+            self.histogram.stddev,
+            stats.standard_deviation(values))
+
+    def test_record_many(self):
+        values = [random.expovariate(10) for _ in range(1000)]
+        for value in values:
+            self.histogram.record(value)
+
+        other = histogram.Histogram()
+        other.record_many(values)
+
+        self.assertEqual(other._counts, self.histogram._counts)
+        self.assertEqual(other.count, 1000)
+        self.assertAlmostEqual(other.stddev, self.histogram.stddev)
+
+    def test_to_dict(self):
+        for value in (0.5, 1.5, 2.5):
+            self.histogram.record(value)
+
+        copy = histogram.Histogram.from_dict(
+            json.loads(json.dumps(self.histogram.to_dict())))
+
+        self.assertEqual(copy.count, 3)
+        self.assertEqual(copy.stddev, self.histogram.stddev)
+        self.assertEqual(
+            copy.percentiles([50, 90]),
+            self.histogram.percentiles([50, 90]))
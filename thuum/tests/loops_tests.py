@@ -0,0 +1,90 @@
+import unittest
+
+import mock
+from tornado import (
+    httpclient,
+    ioloop,
+)
+
+from thuum import (
+    benchmark,
+    engines,
+    loops,
+    runners,
+    stats,
+)
+from thuum.tests import utils
+
+
+def requires(loop):
+    return unittest.skipUnless(
+        loop in loops.available_loops(), "requires the %s loop" % loop)
+
+
+class Function_available_loops_Tests(unittest.TestCase):
+    def test_without_asyncio(self):
+        with mock.patch.object(loops, "asyncio", None):
+            self.assertEqual(loops.available_loops(), ["tornado"])
+
+    def test_without_uvloop(self):
+        with mock.patch.object(loops, "uvloop", None):
+            self.assertNotIn("uvloop", loops.available_loops())
+
+
+class Function_new_loop_Tests(unittest.TestCase):
+    def run_test(self, loop):
+        process, url = benchmark.start_server("raw")
+        self.addCleanup(process.terminate)
+        io_loop = loops.new_loop(loop)
+        io_loop.make_current()
+        self.addCleanup(io_loop.close, all_fds=True)
+        self.addCleanup(ioloop.IOLoop.clear_current)
+
+        engine = engines.get_engine("raw", 2, io_loop)
+        runner = runners.QuantityRunner(
+            engine,
+            lambda **kwargs: httpclient.HTTPRequest(url, **kwargs),
+            10)
+        tracker = stats.Tracker(runner)
+        runner.run()
+
+        self.assertEqual(tracker.get_summary().codes, {200: 10})
+        return io_loop
+
+    def test_tornado(self):
+        io_loop = self.run_test("tornado")
+
+        self.assertIsInstance(io_loop, ioloop.PollIOLoop)
+
+    @requires("asyncio")
+    def test_asyncio(self):
+        io_loop = self.run_test("asyncio")
+
+        self.assertIsInstance(io_loop.asyncio_loop, loops.asyncio.AbstractEventLoop)
+
+    @requires("uvloop")
+    def test_uvloop(self):
+        io_loop = self.run_test("uvloop")
+
+        self.assertIsInstance(io_loop.asyncio_loop, loops.uvloop.Loop)
+
+
+@requires("asyncio")
+class Function_start_Tests(utils.Base):
+    def get_new_ioloop(self):
+        self.event_loop = loops.asyncio.new_event_loop()
+        self.addCleanup(self.event_loop.close)
+        return loops.attach(self.event_loop)
+
+    def test_start(self):
+        engine = engines.get_engine("raw", 2, self.io_loop)
+        runner = runners.QuantityRunner(engine, self.get_request, 10)
+        tracker = stats.Tracker(runner)
+        finished = mock.MagicMock()
+        runner.events.on("tests_finished", finished)
+
+        # Fails if the test stops the loop rather than resolving the future.
+        self.event_loop.run_until_complete(loops.start(runner))
+
+        finished.assert_called_once_with()
+        self.assertEqual(tracker.get_summary().codes, {200: 10})
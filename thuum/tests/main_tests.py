@@ -1,11 +1,30 @@
 import mock
-import StringIO
+import os
+import shutil
+import tempfile
 import unittest
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from tornado import (
+    ioloop,
+    testing,
+)
+
 from thuum import (
     __main__ as main_,
+    benchmark,
+    distributed,
+    loops,
     reporters,
+    results,
     runners,
+    sources,
+    stats,
+    workers,
 )
 
 class ExitException(Exception):
@@ -43,7 +62,7 @@ def zero_quantity_runner(*args):
     return runner
 
 
-@mock.patch("sys.stderr", new_callable=StringIO.StringIO)
+@mock.patch("sys.stderr", new_callable=StringIO)
 @mock.patch("sys.exit", side_effect=ExitException)
 class Function_main_Tests(unittest.TestCase):
     OUTPUT_LINES_PATTERN = "\n".join([
@@ -55,6 +74,10 @@ class Function_main_Tests(unittest.TestCase):
         r"Deviation\s*\d+\.\d+",
         r"Received\s*\d+B",
         r"RPS\s*\d+\.\d+",
+        r"p50\s*\d+\.\d+s",
+        r"p90\s*\d+\.\d+s",
+        r"p99\s*\d+\.\d+s",
+        r"p99.9\s*\d+\.\d+s",
     ])
 
     def test_run_without_flags(self, _, stderr):
@@ -64,7 +87,7 @@ class Function_main_Tests(unittest.TestCase):
             main_.main(args)
 
         self.assertIn(
-            "one of the arguments -n/--requests -d/--duration is required",
+            "one of the arguments -n/--requests -d/--duration --stages is required",
             stderr.getvalue())
 
     def test_with_usage_error(self, sys_exit, _):
@@ -76,14 +99,209 @@ class Function_main_Tests(unittest.TestCase):
         exit_call_arg = sys_exit.call_args[0][0]
         self.assertIn("usage:", exit_call_arg)
 
+    def start_server(self):
+        process, url = benchmark.start_server()
+        self.addCleanup(process.join)
+        self.addCleanup(process.terminate)
+        return url
+
     def test_requests_run(self, *_):
-        stdout = StringIO.StringIO()
-        args = ["http://localhost:8080", "-n10", "--header", "Host:foo"]
+        stdout = StringIO()
+        args = [self.start_server(), "-n10", "--header", "Host:foo"]
 
         main_.main(args, stdout)
 
         self.assertRegexpMatches(stdout.getvalue(), self.OUTPUT_LINES_PATTERN)
 
+    def test_requests_run_with_workers(self, *_):
+        stdout = StringIO()
+        args = [self.start_server(), "-n10", "-c2", "-w2"]
+
+        main_.main(args, stdout)
+
+        self.assertRegexpMatches(stdout.getvalue(), r"Requests\s*10\n")
+
+    def test_thresholds(self, *_):
+        stdout = StringIO()
+        args = [self.start_server(), "-n10", "--assert", "rps>0,p99<1ms"]
+
+        status = main_.main(args, stdout)
+
+        self.assertEqual(status, 1)
+        self.assertRegexpMatches(stdout.getvalue(), r"rps>0\s+\d+\.\d+  ok\n")
+        self.assertRegexpMatches(
+            stdout.getvalue(), r"p99<1ms\s+\d+\.\d+s  FAILED\n")
+
+    def test_baseline(self, *_):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "baseline.json")
+        url = self.start_server()
+        with open(path, "w") as f:
+            main_.main([url, "-n20", "--reporter", "json"], f)
+        stdout = StringIO()
+
+        status = main_.main(
+            [url, "-n20", "--baseline", path, "--tolerance", "10"], stdout)
+
+        self.assertEqual(status, 0)
+        self.assertRegexpMatches(stdout.getvalue(), r"Baseline\s+p50 .*  ok\n")
+
+    def test_validation(self, *_):
+        stdout = StringIO()
+        args = [
+            self.start_server(), "-n10", "-w2", "--expect-status", "2xx",
+            "--expect-body", "nope"]
+
+        main_.main(args, stdout)
+
+        self.assertRegexpMatches(stdout.getvalue(), r"Bodies checked: 10\n")
+        self.assertRegexpMatches(stdout.getvalue(), r"Invalid body: 10\n")
+        self.assertNotIn("Invalid status", stdout.getvalue())
+
+    def test_invalid_sample_bodies(self, sys_exit, _):
+        args = [
+            "http://localhost:8080/", "-n10", "--expect-body", "ok",
+            "--sample-bodies", "1.5"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("--sample-bodies", sys_exit.call_args[0][0])
+
+    def test_invalid_baseline(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "--baseline", __file__]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("Cannot read baseline", sys_exit.call_args[0][0])
+
+    def test_requests_failed(self, *_):
+        stdout = StringIO()
+        sock, port = testing.bind_unused_port()
+        sock.close()
+        args = ["http://127.0.0.1:%d/" % port, "-n10", "--engine", "raw"]
+
+        main_.main(args, stdout)
+
+        self.assertRegexpMatches(
+            stdout.getvalue(),
+            r"\*\*No completed requests\*\*\n\n"
+            r"Failure\s+Requests\s+Average\s+p50.*\n"
+            r"Refused\s+10\s+\d+\.\d+s")
+
+    def test_invalid_timeout(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "--request-timeout", "0"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("Timeouts must be positive", sys_exit.call_args[0][0])
+
+    def test_unavailable_loop(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "--loop", "uvloop"]
+
+        with mock.patch.object(loops, "available_loops", return_value=["tornado"]):
+            with self.assertRaises(ExitException):
+                main_.main(args)
+
+        self.assertIn("--loop uvloop requires uvloop", sys_exit.call_args[0][0])
+
+    def test_invalid_workers(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "-w0"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("-w/--workers", sys_exit.call_args[0][0])
+
+    def test_workers_cannot_fork(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "-w2"]
+
+        with mock.patch.object(workers, "can_fork", return_value=False):
+            with self.assertRaises(ExitException):
+                main_.main(args)
+
+        self.assertIn("requires forking", sys_exit.call_args[0][0])
+
+    def test_negative_warmup(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "--warmup", "-1"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("Warm-up", sys_exit.call_args[0][0])
+
+    def test_body_callable_with_urls_file(self, sys_exit, _):
+        args = [
+            "http://localhost:8080/", "-n10", "--urls-file", "urls.txt",
+            "-b", "py:thuum.tests.sources_tests.generate_body"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("--urls-file", sys_exit.call_args[0][0])
+
+    def test_missing_urls_file(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "--urls-file", "/does/not/exist"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("Cannot read requests", sys_exit.call_args[0][0])
+
+    def test_poisson_without_rate(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "--poisson"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("--poisson", sys_exit.call_args[0][0])
+
+    def test_report(self, *_):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "test.thr")
+        writer = results.ResultsWriter(path)
+        for started in range(10):
+            writer.add(stats.Record.from_row(
+                (started, started + 0.5, 200, 0, 10, {})))
+        writer.close()
+        stdout = StringIO()
+
+        main_.main(["report", path, path], stdout)
+
+        self.assertRegexpMatches(stdout.getvalue(), r"Requests\s*20\n")
+
+        status = main_.main(["report", path, "--assert", "p50<=0.5s"], stdout)
+
+        self.assertEqual(status, 0)
+
+    def test_report_invalid_file(self, sys_exit, _):
+        with self.assertRaises(ExitException):
+            main_.main(["report", __file__])
+
+        self.assertIn("Cannot read results", sys_exit.call_args[0][0])
+
+    def test_controller_with_too_many_agents(self, sys_exit, _):
+        args = [
+            "controller", "http://localhost:8080/", "-n10", "-c1",
+            "--agents", "host1,host2:8000"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("more agents", sys_exit.call_args[0][0])
+
+    def test_keepalive_with_simple_engine(self, sys_exit, _):
+        args = ["http://localhost:8080/", "-n10", "--keepalive"]
+
+        with self.assertRaises(ExitException):
+            main_.main(args)
+
+        self.assertIn("keep connections alive", sys_exit.call_args[0][0])
+
 
 class ParserTests(unittest.TestCase):
     def test_custom_headers(self):
@@ -120,7 +338,47 @@ class ParserTests(unittest.TestCase):
 
         self.assertIn(
             "Cannot specify -b/--body with",
-            context.exception.message)
+            str(context.exception))
+
+    def test_add_body_file(self):
+        descriptor, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        os.write(descriptor, b"foobarbaz")
+        os.close(descriptor)
+        parser = main_.get_argument_parser()
+
+        args = parser.parse_args(
+            ["http://localhost:8080/", "-n1", "-m", "POST", "-b", "@" + path])
+
+        self.assertEqual(args.body, b"foobarbaz")
+
+    def test_add_missing_body_file(self):
+        args = ["-m", "POST", "-b", "@/does/not/exist"]
+        parser = main_.get_argument_parser()
+
+        with self.assertRaises(main_.UsageError) as context:
+            parser.parse_args(["http://localhost:8080/", "-n1"] + args)
+
+        self.assertIn("Cannot read", str(context.exception))
+
+    def test_add_body_callable(self):
+        args = ["-b", "py:thuum.tests.sources_tests.generate_body"]
+        parser = main_.get_argument_parser()
+
+        args = parser.parse_args(["http://localhost:8080/", "-n1"] + args)
+        make_request = main_.get_request_factory(args)
+
+        self.assertIsNone(args.body)
+        self.assertEqual(make_request().body, b"generated")
+
+    def test_request_pool(self):
+        parser = main_.get_argument_parser()
+        args = parser.parse_args(["http://localhost:8080/", "-n1", "--pool", "3"])
+
+        make_request = main_.get_request_factory(args)
+
+        self.assertIsInstance(make_request, sources.RequestPool)
+        self.assertEqual(make_request.size, 3)
 
     def test_add_duplicate_body(self):
         args = ["-m", "POST", "-b", "foobarbaz", "-b", "wibwobwub"]
@@ -129,7 +387,220 @@ class ParserTests(unittest.TestCase):
         with self.assertRaises(main_.UsageError) as context:
             args = parser.parse_args(["http://localhost:8080/", "-n1"] + args)
 
-        self.assertIn("more than once", context.exception.message)
+        self.assertIn("more than once", str(context.exception))
+
+    def test_rate_runner(self):
+        parser = main_.get_argument_parser()
+        args = main_.parse_args(
+            parser, ["http://localhost:8080/", "-n1", "-r", "100", "--poisson"])
+
+        runner = main_.get_runner(args, mock.MagicMock())
+
+        self.assertIsInstance(runner, runners.RateRunner)
+        self.assertEqual(args.concurrency, 1)
+
+    def test_connection_options(self):
+        parser = main_.get_argument_parser()
+        args = parser.parse_args([
+            "http://localhost:8080/", "-n1", "-c10", "--engine", "raw",
+            "--no-keepalive", "--max-connections", "4"])
+
+        runner = main_.get_runner(args, mock.MagicMock())
+
+        self.assertFalse(runner.engine.keepalive)
+        self.assertEqual(runner.engine.max_connections, 4)
+        self.assertEqual(runner.engine.max_clients, 4)
+
+    def test_prepare_agent_test(self):
+        plan = {
+            "argv": [
+                "http://localhost:8080/", "-n10", "-c4", "-r", "100",
+                "--warmup-requests", "3", "--agents", "host1,host2"],
+            "agent": 1,
+            "agents": 2,
+        }
+
+        # Agents prepare each test on a new IOLoop.
+        io_loop = ioloop.IOLoop()
+        io_loop.make_current()
+        self.addCleanup(io_loop.close)
+        self.addCleanup(ioloop.IOLoop.clear_current)
+        runner, tracker = main_.prepare_agent_test(plan)
+
+        self.assertIsInstance(runner, runners.RateRunner)
+        self.assertEqual(runner.engine.max_clients, 2)
+        self.assertEqual(runner._total, 5)
+        self.assertEqual(runner._rate, 50)
+        self.assertEqual(tracker.warmup_requests, 1)
+
+    def test_body_file_on_agents(self):
+        descriptor, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        os.write(descriptor, b"foobarbaz")
+        os.close(descriptor)
+        argv = [
+            "http://localhost:8080/", "-n10", "-c2", "-m", "POST", "-b", "@" + path,
+            "--agents", "host1,host2"]
+        args = main_.parse_args(main_.get_controller_parser(), argv)
+        plan = main_.get_controller(args, argv).plan
+
+        io_loop = ioloop.IOLoop()
+        io_loop.make_current()
+        self.addCleanup(io_loop.close)
+        self.addCleanup(ioloop.IOLoop.clear_current)
+        with mock.patch.object(sources, "read_body") as read_body:
+            runner, _ = main_.prepare_agent_test(dict(plan, agent=0, agents=2))
+            with self.assertRaises(distributed.AgentError):
+                main_.prepare_agent_test(dict(argv=argv, agent=0, agents=2))
+
+        # The agent uses the body the controller read, not a file of its own.
+        self.assertFalse(read_body.called)
+        self.assertEqual(runner.make_request().body, b"foobarbaz")
+
+    def test_invalid_agent_plans(self):
+        base = ["http://localhost:8080/", "-n10", "--agents", "host1"]
+
+        for argv, message in [
+                (base + ["-b", "py:thuum.tests.sources_tests.generate_body"],
+                 "cannot load -b/--body callables"),
+                (base + ["--urls-file", __file__], "--urls-file"),
+                (base + ["--no-such-option"], "unrecognized arguments"),
+                (base + ["--help"], ""),
+                (["-n10"], "")]:
+            with self.assertRaises(distributed.AgentError) as context:
+                with mock.patch("sys.stdout", new_callable=StringIO):
+                    main_.prepare_agent_test(
+                        {"argv": argv, "agent": 0, "agents": 1})
+
+            self.assertIn(message, str(context.exception))
+
+        with self.assertRaises(distributed.AgentError):
+            main_.prepare_agent_test({"agent": 0, "agents": 1})
+
+    def test_validator(self):
+        parser = main_.get_argument_parser()
+        args = parser.parse_args([
+            "http://localhost:8080/", "-n1", "--expect-status", "200,3xx",
+            "--expect-header", "Content-Type: json", "--expect-body", "ok"])
+
+        validator = main_.get_validator(args)
+
+        self.assertIn(304, validator.statuses)
+        self.assertNotIn(201, validator.statuses)
+        self.assertEqual(validator.headers, [("Content-Type", "json")])
+        self.assertEqual(validator.contains, b"ok")
+
+    def test_no_validator(self):
+        parser = main_.get_argument_parser()
+        args = parser.parse_args(["http://localhost:8080/", "-n1"])
+
+        self.assertIsNone(main_.get_validator(args))
+
+    def test_invalid_expected_status(self):
+        parser = main_.get_argument_parser()
+
+        with mock.patch("sys.stderr", new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                parser.parse_args(
+                    ["http://localhost:8080/", "-n1", "--expect-status", "ok"])
+
+    def test_stages(self):
+        parser = main_.get_argument_parser()
+
+        args = main_.parse_args(
+            parser, ["http://localhost:8080/", "--stages", "30s:10,2m:100,5:0"])
+        runner = main_.get_runner(args, mock.MagicMock())
+
+        self.assertEqual(
+            args.stages,
+            [(30, 10), (120, 100), (5, 0)])
+        self.assertIsInstance(runner, runners.StagedRunner)
+        self.assertFalse(runner._rate)
+        self.assertEqual(args.concurrency, 100)
+
+    def test_rate_stages(self):
+        parser = main_.get_argument_parser()
+
+        args = main_.parse_args(parser, [
+            "http://localhost:8080/", "--stages", "30s:10,1m:500",
+            "--stages-rate", "-c", "50", "--poisson"])
+        runner = main_.get_runner(args, mock.MagicMock())
+
+        self.assertTrue(runner._rate)
+        self.assertEqual(args.concurrency, 50)
+
+    def test_conflicting_stages_options(self):
+        parser = main_.get_argument_parser()
+
+        for options, message in [
+                (["--stages", "30s:10", "-r", "100"], "-r/--rate with --stages"),
+                (["--stages", "30s:10", "-c", "5"], "-c/--concurrency with"),
+                (["-n1", "--stages-rate"], "without --stages"),
+                (["--stages", "30s:10", "--poisson"], "--poisson without")]:
+            with self.assertRaises(main_.UsageError) as context:
+                main_.parse_args(parser, ["http://localhost:8080/"] + options)
+
+            self.assertIn(message, str(context.exception))
+
+    def test_invalid_stages(self):
+        parser = main_.get_argument_parser()
+
+        with mock.patch("sys.stderr", new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                parser.parse_args(
+                    ["http://localhost:8080/", "--stages", "30s"])
+
+    def test_percentiles(self):
+        parser = main_.get_argument_parser()
+
+        args = parser.parse_args(
+            ["http://localhost:8080/", "-n1", "--percentiles", "50,99.9"])
+
+        self.assertEqual(args.percentiles, (50, 99.9))
+
+    def test_thresholds(self):
+        parser = main_.get_argument_parser()
+        args = parser.parse_args(
+            ["http://localhost/", "-n1", "--assert", "p99<200ms,errors<1%"])
+
+        self.assertEqual(
+            [(t.metric, t.operator, t.limit) for t in args.thresholds],
+            [("p99", "<", 0.2), ("error_rate", "<", 0.01)])
+
+    def test_invalid_thresholds(self):
+        parser = main_.get_argument_parser()
+
+        with mock.patch("sys.stderr", new_callable=StringIO) as stderr:
+            with self.assertRaises(SystemExit):
+                parser.parse_args(["http://localhost/", "-n1", "--assert", "p99"])
+
+        self.assertIn("Invalid threshold 'p99'", stderr.getvalue())
+
+    def test_metrics(self):
+        parser = main_.get_argument_parser()
+        args = parser.parse_args([
+            "http://localhost/", "-n1", "--metrics", "9102",
+            "--statsd", "stats.example.com"])
+
+        self.assertEqual(args.metrics, ("127.0.0.1", 9102))
+        self.assertEqual(args.statsd, ("stats.example.com", 8125))
+        self.assertEqual(args.statsd_prefix, "thuum")
+
+    def test_invalid_metrics_port(self):
+        parser = main_.get_argument_parser()
+
+        with mock.patch("sys.stderr", new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                parser.parse_args(
+                    ["http://localhost/", "-n1", "--metrics", "host:port"])
+
+    def test_invalid_percentiles(self):
+        parser = main_.get_argument_parser()
+
+        with mock.patch("sys.stderr", new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                parser.parse_args(
+                    ["http://localhost:8080/", "-n1", "--percentiles", "0,101"])
 
     def test_use_custom_reporter(self):
         args = ["--reporter", "csv"]
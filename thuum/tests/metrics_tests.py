@@ -0,0 +1,148 @@
+import socket
+import unittest
+
+from tornado import (
+    httpclient,
+    testing,
+)
+
+from thuum import (
+    histogram,
+    metrics,
+    stats,
+)
+
+
+def get_tracker():
+    tracker = stats.Tracker(keep_records=False, warmup_requests=1)
+    for latency, code, error in [
+            (0.003, 200, None),
+            (0.02, 200, None),
+            (0.2, 500, None),
+            (2.0, 599, "timeout")]:
+        record = stats.Record()
+        record.started = 0.0
+        record.finished = latency
+        record.code = code
+        record.error = error
+        record.received = 10
+        tracker.add_record(record)
+    tracker.request_late()
+    return tracker
+
+
+class Function_render_Tests(unittest.TestCase):
+    def test_render(self):
+        lines = metrics.render(get_tracker()).splitlines()
+
+        self.assertIn("# TYPE thuum_requests_total counter", lines)
+        self.assertIn('thuum_requests_total{code="200"} 2', lines)
+        self.assertIn('thuum_requests_total{code="599"} 1', lines)
+        self.assertIn('thuum_failures_total{error="timeout"} 1', lines)
+        self.assertIn("# TYPE thuum_request_duration_seconds histogram", lines)
+        self.assertIn(
+            'thuum_request_duration_seconds_bucket{le="0.005"} 1', lines)
+        self.assertIn(
+            'thuum_request_duration_seconds_bucket{le="0.25"} 3', lines)
+        self.assertIn(
+            'thuum_request_duration_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("thuum_request_duration_seconds_count 3", lines)
+        self.assertIn("thuum_received_bytes_total 40", lines)
+        self.assertIn("thuum_late_total 1", lines)
+
+    def test_empty(self):
+        lines = metrics.render(stats.Tracker()).splitlines()
+
+        self.assertIn(
+            'thuum_request_duration_seconds_bucket{le="+Inf"} 0', lines)
+        self.assertIn("thuum_request_duration_seconds_sum 0.0", lines)
+
+
+class Function_bucket_counts_Tests(unittest.TestCase):
+    def test_bucket_counts(self):
+        first = histogram.Histogram()
+        second = histogram.Histogram()
+        for value in (0.001, 0.5, 20):
+            first.record(value)
+        second.record(0.3, count=2)
+
+        self.assertEqual(
+            metrics._bucket_counts([first, second], (0.01, 0.4, 1.0)),
+            [1, 3, 4])
+
+
+class PrometheusExporterTests(testing.AsyncTestCase):
+    @testing.gen_test
+    def test_metrics(self):
+        sock, port = testing.bind_unused_port()
+        sock.close()
+        exporter = metrics.PrometheusExporter(get_tracker(), port)
+        client = httpclient.AsyncHTTPClient(force_instance=True)
+        try:
+            response = yield client.fetch("http://127.0.0.1:%d/metrics" % port)
+        finally:
+            client.close()
+            exporter.close()
+
+        self.assertIn(b'thuum_requests_total{code="200"} 2', response.body)
+        self.assertTrue(
+            response.headers["Content-Type"].startswith("text/plain"))
+
+
+class StatsdExporterTests(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(self.server.close)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.settimeout(5)
+        self.tracker = stats.Tracker()
+        self.exporter = metrics.StatsdExporter(
+            self.tracker, "127.0.0.1", self.server.getsockname()[1], "load")
+        self.addCleanup(self.exporter.close)
+
+    def window(self, **kwargs):
+        window = dict(
+            count=10, errors=1, received=100, rps=10.0, p50=0.01, p99=None)
+        window.update(kwargs)
+        self.tracker.events.emit("window_finished", window)
+
+    def receive(self):
+        return self.server.recv(65536).decode("utf-8").split("\n")
+
+    def test_window(self):
+        self.tracker.connection_opened()
+
+        self.window()
+
+        self.assertEqual(self.receive(), [
+            "load.requests:10|c",
+            "load.errors:1|c",
+            "load.received:100|c",
+            "load.rps:10.00|g",
+            "load.latency.p50:10.000|g",
+            "load.connections_opened:1|c",
+        ])
+
+    def test_counter_changes(self):
+        self.tracker.connection_opened()
+        self.window()
+        self.receive()
+
+        self.window()
+        self.tracker.connection_opened()
+        self.tracker.connection_opened()
+        self.window()
+
+        self.assertNotIn("load.connections_opened:1|c", self.receive())
+        self.assertIn("load.connections_opened:2|c", self.receive())
+
+    def test_batches(self):
+        self.exporter.prefix = "x" * 300
+
+        self.window()
+
+        packets = [self.receive(), self.receive()]
+        self.assertEqual(len(packets[0]) + len(packets[1]), 5)
+        self.assertTrue(all(
+            len("\n".join(packet)) <= metrics.MAX_PACKET_SIZE
+            for packet in packets))
@@ -0,0 +1,117 @@
+import time
+
+import mock
+from pyee import EventEmitter
+from tornado import testing
+
+from thuum import (
+    engines,
+    monitor,
+    runners,
+    stats,
+)
+
+
+class MonitorTests(testing.AsyncTestCase):
+    def setUp(self):
+        super(MonitorTests, self).setUp()
+        # A runner without observers, as a worker pool.
+        self.runner = mock.MagicMock(spec=["events"], events=EventEmitter())
+        self.monitor = monitor.Monitor(
+            self.runner,
+            self.io_loop,
+            interval=0.01)
+        self.tracker = stats.Tracker(self.runner)
+        self.monitor.attach(self.tracker)
+
+    def finish(self):
+        self.runner.events.emit("tests_finished")
+        return self.tracker.overhead
+
+    def test_timed(self):
+        function = self.monitor.timed("reporters", lambda: time.sleep(0.01))
+
+        function()
+        function()
+
+        self.assertGreaterEqual(self.monitor.timings["reporters"], 0.02)
+
+    def test_dispatch(self):
+        self.runner.events.on("record_received", lambda r: time.sleep(0.02))
+        self.runner.events.emit("tests_started")
+
+        self.runner.events.emit(
+            "record_received", stats.Record.from_row((0, 1, 200, 0, 0, {})))
+
+        self.assertGreaterEqual(self.monitor.timings["dispatch"], 0.02)
+        self.assertLess(self.monitor.timings["dispatch"], 0.04)
+
+    def test_dispatch_to_observers(self):
+        engine = mock.MagicMock(
+            spec=engines.Engine, events=EventEmitter(), active=0, max_clients=1)
+        runner = runners.Runner(engine, lambda **kwargs: mock.MagicMock())
+        overhead = monitor.Monitor(runner, self.io_loop)
+        tracker = stats.Tracker(runner)
+        overhead.attach(tracker)
+        runner.events.emit("tests_started")
+
+        with mock.patch.object(stats.Record, "start", lambda r: time.sleep(0.02)):
+            runner._start_request()
+
+        self.assertGreaterEqual(overhead.timings["dispatch"], 0.02)
+        self.assertLess(overhead.timings["dispatch"], 0.04)
+        runner.events.emit("tests_finished")
+        self.assertIn("dispatch", tracker.overhead)
+
+    def test_cpu_time_without_resource(self):
+        with mock.patch.object(monitor, "resource", None):
+            self.assertGreaterEqual(monitor.cpu_time(), 0)
+
+    def test_lag(self):
+        self.runner.events.emit("tests_started")
+        self.io_loop.call_later(0.005, lambda: time.sleep(0.05))
+        self.io_loop.call_later(0.1, self.stop)
+        self.wait()
+
+        with mock.patch.object(monitor, "CPU_THRESHOLD", 1000):
+            overhead = self.finish()
+
+        self.assertGreaterEqual(overhead["lag"]["max"], 0.03)
+        # A single pause is not saturation.
+        self.assertFalse(overhead["saturated"])
+        self.assertIn("cpu", overhead)
+
+    def get_saturated(self, lags):
+        self.runner.events.emit("tests_started")
+        for lag in lags:
+            self.monitor.lag.record(lag)
+
+        with mock.patch.object(monitor, "CPU_THRESHOLD", 1000):
+            return self.finish()["saturated"]
+
+    def test_sustained_lag(self):
+        self.assertTrue(self.get_saturated([0.0] * 15 + [0.02] * 5))
+
+    def test_occasional_lag(self):
+        self.assertFalse(self.get_saturated([0.0] * 38 + [0.5] * 2))
+
+    def test_too_few_samples(self):
+        self.assertFalse(
+            self.get_saturated([0.02] * (monitor.MIN_LAG_SAMPLES - 1)))
+
+    def test_cpu(self):
+        self.runner.events.emit("tests_started")
+
+        with mock.patch.object(monitor, "CPU_THRESHOLD", 0):
+            self.assertTrue(self.finish()["saturated"])
+
+    def test_not_saturated(self):
+        self.runner.events.emit("tests_started")
+        self.io_loop.call_later(0.05, self.stop)
+        self.wait()
+
+        with mock.patch.object(monitor, "CPU_THRESHOLD", 1000):
+            overhead = self.finish()
+
+        self.assertFalse(overhead["saturated"])
+        self.assertGreater(overhead["lag"]["samples"], 0)
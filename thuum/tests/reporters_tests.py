@@ -1,9 +1,30 @@
-import StringIO
+import json
+import threading
 import unittest
 
 import mock
 
-from thuum import reporters
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from thuum import (
+    reporters,
+    runners,
+    stats,
+)
+
+
+def get_tracker():
+    tracker = mock.MagicMock(overhead=None)
+    tracker.counters = {"late": 1}
+    tracker.get_summary.return_value = stats.Summary.from_records([
+        mock.MagicMock(started=0, finished=1, code=200, received=0),
+        mock.MagicMock(started=0, finished=2, code=200, received=0),
+        mock.MagicMock(started=0, finished=3, code=500, received=0),
+    ])
+    return tracker
 
 
 class TerimalReporterTests(unittest.TestCase):
@@ -19,7 +40,7 @@ class TerimalReporterTests(unittest.TestCase):
     ])
 
     def setUp(self):
-        self.stream = StringIO.StringIO()
+        self.stream = StringIO()
 
     def test_progress_no_tty(self):
         runner = mock.MagicMock()
@@ -45,14 +66,41 @@ class TerimalReporterTests(unittest.TestCase):
 
         self.assertEqual(self.stream.getvalue(), "\r[10.0/20.0 foo] 50.0%")
 
+    def test_window_no_tty(self):
+        reporter = reporters.TerminalReporter(self.stream)
+
+        reporter.window({"count": 1})
+
+        self.assertEqual(self.stream.getvalue(), "")
+
+    def test_window_fake_tty(self):
+        self.stream.isatty = mock.MagicMock(return_value=True)
+        reporter = reporters.TerminalReporter(self.stream)
+
+        reporter.window({
+            "started": 2.0,
+            "duration": 1.0,
+            "count": 10,
+            "rps": 10.0,
+            "errors": 1,
+            "received": 100,
+            "p50": 0.1,
+            "p99": None,
+        })
+
+        self.assertRegexpMatches(
+            self.stream.getvalue(),
+            r"\[\s*2\.0s\]\s+10 requests\s+10\.00 RPS\s+"
+            r"p50\s+0\.1000s\s+p99\s+-\s+1 errors\s+100B\n$")
+
     def test_report_summarize(self):
         reporter = reporters.TerminalReporter(self.stream)
-        tracker = mock.MagicMock()
-        tracker.get_records.return_value = [
+        tracker = mock.MagicMock(overhead=None)
+        tracker.get_summary.return_value = stats.Summary.from_records([
             mock.MagicMock(started=0, finished=100, code=200, received=0),
             mock.MagicMock(started=0, finished=100, code=200, received=0),
             mock.MagicMock(started=0, finished=100, code=200, received=0),
-        ]
+        ])
 
         reporter.summarize(tracker)
 
@@ -60,43 +108,275 @@ class TerimalReporterTests(unittest.TestCase):
             self.stream.getvalue(),
             self.OUTPUT_LINES_PATTERN)
 
+    def test_report_summarize_percentiles(self):
+        reporter = reporters.TerminalReporter(self.stream, percentiles=(50, 99.9))
+
+        reporter.summarize(get_tracker())
+
+        self.assertRegexpMatches(
+            self.stream.getvalue(),
+            r"RPS\s*\d+\.\d+\np50\s*\d\.\d{4}s\np99\.9\s*3\.0000s\n")
+
+    def test_report_summarize_phases(self):
+        reporter = reporters.TerminalReporter(self.stream, percentiles=(50,))
+        tracker = get_tracker()
+        tracker.get_summary.return_value = stats.Summary.from_records([
+            mock.MagicMock(
+                started=0,
+                finished=3,
+                code=200,
+                received=0,
+                phases={"ttfb": 1, "transfer": 2}),
+        ])
+
+        reporter.summarize(tracker)
+
+        self.assertRegexpMatches(
+            self.stream.getvalue(),
+            r"Phase\s+avg\s+p50\n"
+            r"First byte\s+1\.0000s\s+1\.0000s\n"
+            r"Transfer\s+2\.0000s\s+2\.0000s\n")
+
+    def test_report_summarize_failures(self):
+        reporter = reporters.TerminalReporter(self.stream, percentiles=(50,))
+        tracker = get_tracker()
+        tracker.get_summary.return_value = stats.Summary.from_records([
+            stats.Record.from_row((0, 1, 200, 0, 0, {})),
+            stats.Record.from_row((0, 5, 599, 0, 0, {}, None, "timeout")),
+            stats.Record.from_row((0, 2, 599, 0, 0, {}, None, "refused")),
+        ])
+
+        reporter.summarize(tracker)
+
+        self.assertRegexpMatches(self.stream.getvalue(), r"Requests\s+1\n")
+        self.assertRegexpMatches(
+            self.stream.getvalue(),
+            r"Failure\s+Requests\s+Average\s+p50\n"
+            r"Timeout\s+1\s+5\.0000s\s+5\.0000s\n"
+            r"Refused\s+1\s+2\.0000s\s+2\.0000s\n")
+
+    def test_report_summarize_counters(self):
+        reporter = reporters.TerminalReporter(self.stream)
+        tracker = mock.MagicMock(overhead=None)
+        tracker.counters = {"late": 2, "dropped": 0}
+        tracker.get_summary.return_value = stats.Summary.from_records([
+            mock.MagicMock(started=0, finished=100, code=200, received=0),
+        ])
+
+        reporter.summarize(tracker)
+
+        self.assertIn("Late starts: 2\n", self.stream.getvalue())
+        self.assertNotIn("Dropped", self.stream.getvalue())
+
+    def test_report_summarize_overhead(self):
+        reporter = reporters.TerminalReporter(self.stream)
+        tracker = get_tracker()
+        tracker.overhead = {
+            "cpu": 97.0,
+            "lag": {"p50": 0.001, "p90": 0.0015, "p99": 0.002, "max": 0.003},
+            "dispatch": 1.5,
+            "reporters": 0.5,
+            "saturated": True,
+        }
+
+        reporter.summarize(tracker)
+
+        self.assertIn(
+            "Generator   CPU 97%, loop lag p90 0.0015s, p99 0.0020s "
+            "(max 0.0030s), dispatch 1.50s, reporters 0.50s\n",
+            self.stream.getvalue())
+        self.assertIn("generator was saturated", self.stream.getvalue())
+
+    def test_report_summarize_warmup(self):
+        reporter = reporters.TerminalReporter(self.stream)
+        tracker = get_tracker()
+        tracker.warmup_summary = stats.Summary.from_records([
+            mock.MagicMock(started=0, finished=5, code=200, received=0),
+        ])
+
+        reporter.summarize(tracker)
+
+        self.assertIn(
+            "Warm-up              1 requests excluded "
+            "(avg 5.0000s, slowest 5.0000s)\n",
+            self.stream.getvalue())
+
+    def test_report_summarize_labels(self):
+        reporter = reporters.TerminalReporter(self.stream, percentiles=(50,))
+        tracker = get_tracker()
+        tracker.labels = {
+            "/foo": tracker.get_summary(),
+            "/bar": stats.Summary(),
+        }
+
+        reporter.summarize(tracker)
+
+        self.assertRegexpMatches(
+            self.stream.getvalue(),
+            r"Route\s+Requests\s+RPS\s+Average\s+p50\s+Errors\n"
+            r"/foo\s+3\s+1\.00\s+2\.0000s\s+2\.\d{4}s\s+1\n$")
+
+    def test_report_summarize_stages(self):
+        reporter = reporters.TerminalReporter(self.stream, percentiles=(50,))
+        tracker = get_tracker()
+        tracker.stages = [
+            (runners.Stage(30, 10), tracker.get_summary()),
+            (runners.Stage(60, 0), stats.Summary()),
+        ]
+
+        reporter.summarize(tracker)
+
+        self.assertRegexpMatches(
+            self.stream.getvalue(),
+            r"Stage\s+Duration\s+Target\s+Requests\s+RPS\s+p50\n"
+            r"1\s+30\.0s\s+10\s+3\s+1\.00\s+2\.\d{4}s\n"
+            r"2\s+60\.0s\s+0\s+0\n$")
+
     def test_report_summarize_none_finished(self):
         reporter = reporters.TerminalReporter(self.stream)
-        tracker = mock.MagicMock()
-        tracker.get_records.return_value = [
+        tracker = mock.MagicMock(overhead=None)
+        tracker.get_summary.return_value = stats.Summary.from_records([
             mock.MagicMock(started=0, finished=None),
             mock.MagicMock(started=0, finished=None),
             mock.MagicMock(started=0, finished=None),
-        ]
+        ])
 
         reporter.summarize(tracker)
 
         self.assertEqual(self.stream.getvalue(), "\n**No completed requests**")
 
 
+class BackgroundWriterTests(unittest.TestCase):
+    def test_batches(self):
+        batches = []
+        writer = reporters.BackgroundWriter(batches.append, batch_size=2)
+
+        for item in range(5):
+            writer.add(item)
+        writer.join()
+
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+        self.assertEqual(writer.dropped, 0)
+
+    def test_fall_behind(self):
+        written = threading.Event()
+        release = threading.Event()
+        batches = []
+
+        def write(batch):
+            batches.append(batch)
+            written.set()
+            release.wait()
+
+        writer = reporters.BackgroundWriter(write, batch_size=1, max_batches=1)
+        writer.add(0)
+        written.wait()
+        for item in range(1, 4):
+            writer.add(item)
+        release.set()
+        writer.join()
+
+        self.assertEqual(batches, [[0], [1]])
+        self.assertEqual(writer.dropped, 2)
+
+
 class CSVReporterTests(unittest.TestCase):
     def setUp(self):
-        self.stream = StringIO.StringIO()
+        self.stream = StringIO()
 
     def test_report(self):
         reporter = reporters.CSVReporter(self.stream)
-        record = mock.Mock(started=0, finished=100, code=200, sent=0, received=0)
+        record = mock.Mock(
+            started=0, finished=100, code=200, sent=0, received=0, error=None,
+            invalid="body")
 
         reporter.record(record)
+        self.assertEqual(self.stream.getvalue(), "")
+        reporter.flush()
+
+        self.assertEqual(self.stream.getvalue().strip(), "0,100,200,0,0,,body")
+
+    def test_summarize(self):
+        reporter = reporters.CSVReporter(self.stream, percentiles=(50, 99))
+
+        reporter.summarize(get_tracker())
+
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(lines[0], "")
+        self.assertEqual(
+            lines[1],
+            "count,dur,avg,min,max,dev,rps,received,p50,p99")
+        self.assertTrue(lines[2].startswith("3,3,2.0,1,3,"))
+        self.assertTrue(lines[2].endswith(",3"))
+
+    def test_summarize_invalid(self):
+        reporter = reporters.CSVReporter(self.stream, percentiles=(50,))
+        tracker = get_tracker()
+        tracker.counters = {"invalid_status": 2, "bodies_checked": 3}
+
+        reporter.summarize(tracker)
 
-        self.assertEqual(self.stream.getvalue().strip(), "0,100,200,0,0")
+        lines = self.stream.getvalue().splitlines()
+        self.assertTrue(lines[1].endswith(",p50,invalid_status"))
+        self.assertTrue(lines[2].endswith(",2"))
 
 
 class JSONReporterTests(unittest.TestCase):
     def setUp(self):
-        self.stream = StringIO.StringIO()
+        self.stream = StringIO()
 
     def test_report(self):
         reporter = reporters.JSONReporter(self.stream)
-        record = mock.Mock(started=0, finished=100, code=200, sent=0, received=0)
+        record = mock.Mock(
+            started=0, finished=100, code=200, sent=0, received=0, error=None,
+            invalid=None)
 
         reporter.record(record)
+        reporter.flush()
 
         self.assertEqual(
             self.stream.getvalue().strip(),
-            """{"code": 200, "finished": 100, "received": 0, "sent": 0, "started": 0}""")
+            """{"code": 200, "error": null, "finished": 100, "invalid": null, """
+            """"received": 0, "sent": 0, "started": 0}""")
+
+    def test_summarize(self):
+        reporter = reporters.JSONReporter(self.stream, percentiles=(50, 99))
+        reporter.window({"started": 0, "count": 3})
+
+        reporter.summarize(get_tracker())
+
+        summary = json.loads(self.stream.getvalue())["summary"]
+        self.assertEqual(summary["stats"]["count"], 3)
+        self.assertEqual(sorted(summary["stats"]["percentiles"]), ["p50", "p99"])
+        self.assertEqual(summary["codes"], {"200": 2, "500": 1})
+        self.assertEqual(summary["failures"], {})
+        self.assertEqual(summary["counters"], {"late": 1})
+        self.assertEqual(summary["timeseries"], [{"started": 0, "count": 3}])
+        self.assertEqual(summary["stages"], [])
+        self.assertIsNone(summary["warmup"])
+        self.assertEqual(summary["labels"], [])
+        self.assertEqual(summary["histogram"]["count"], 3)
+
+    def test_summarize_unwritten(self):
+        reporter = reporters.JSONReporter(self.stream)
+        reporter.output.dropped = 10
+
+        with mock.patch("sys.stderr", new_callable=StringIO) as stderr:
+            reporter.summarize(get_tracker())
+
+        summary = json.loads(self.stream.getvalue())["summary"]
+        self.assertEqual(summary["counters"], {"late": 1, "unwritten": 10})
+        self.assertIn("10 records were not written", stderr.getvalue())
+
+    def test_summarize_stages(self):
+        reporter = reporters.JSONReporter(self.stream, percentiles=(50,))
+        tracker = get_tracker()
+        tracker.stages = [(runners.Stage(30, 10), tracker.get_summary())]
+
+        reporter.summarize(tracker)
+
+        stage, = json.loads(self.stream.getvalue())["summary"]["stages"]
+        self.assertEqual(stage["stage"], 1)
+        self.assertEqual(stage["duration"], 30)
+        self.assertEqual(stage["target"], 10)
+        self.assertEqual(stage["stats"]["count"], 3)
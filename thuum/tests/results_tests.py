@@ -0,0 +1,123 @@
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from thuum import (
+    histogram,
+    results,
+    stats,
+)
+
+
+def get_record(started, code=200, label=None, warmup=False):
+    record = stats.Record.from_row(
+        (started, started + 0.5, code, 0, 10, {"ttfb": 0.1}, label))
+    record.warmup = warmup
+    return record
+
+
+class ResultsFileTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "test.thr")
+
+    def write(self, records, counters=None, chunk_size=2):
+        writer = results.ResultsWriter(self.path, chunk_size=chunk_size)
+        for record in records:
+            writer.add(record)
+        writer.close(counters)
+
+    def test_round_trip(self):
+        records = [
+            get_record(0.0, label="foo"),
+            get_record(1.0, code=500),
+            get_record(2.0, warmup=True),
+        ]
+        self.write(records, {"late": 2})
+
+        results_file = results.ResultsFile(self.path)
+        stores = list(results_file.stores())
+
+        self.assertEqual([len(store) for store in stores], [2, 1])
+        self.assertEqual(
+            [record.to_row() for store in stores for record in store],
+            [record.to_row() for record in records])
+        self.assertTrue(stores[1][0].warmup)
+        self.assertEqual(results_file.counters, {"late": 2})
+
+    def test_append(self):
+        self.write([get_record(0.0)], {"late": 1})
+        self.write([get_record(1.0)], {"late": 2})
+
+        results_file = results.ResultsFile(self.path)
+        stores = list(results_file.stores())
+
+        self.assertEqual([len(store) for store in stores], [1, 1])
+        self.assertEqual(results_file.counters, {"late": 3})
+
+    def test_truncated_chunk(self):
+        self.write([get_record(0.0), get_record(1.0), get_record(2.0)])
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+
+        stores = list(results.ResultsFile(self.path).stores())
+
+        self.assertEqual([len(store) for store in stores], [2])
+
+    def test_append_after_truncated_chunk(self):
+        self.write([get_record(0.0), get_record(1.0), get_record(2.0)])
+        complete = os.path.getsize(self.path)
+        self.write([get_record(3.0)])
+        for cut in (1, os.path.getsize(self.path) - complete - 3):
+            with open(self.path, "r+b") as f:
+                f.truncate(os.path.getsize(self.path) - cut)
+
+            self.write([get_record(4.0)], {"late": 1})
+
+            results_file = results.ResultsFile(self.path)
+            stores = list(results_file.stores())
+            self.assertEqual([len(store) for store in stores], [2, 1, 1])
+            self.assertEqual(stores[-1][0].started, 4.0)
+            self.assertEqual(results_file.counters, {"late": 1})
+
+    def test_not_a_results_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"Requests 10\n")
+
+        with self.assertRaises(ValueError):
+            results.ResultsFile(self.path)
+        with self.assertRaises(ValueError):
+            results.ResultsWriter(self.path)
+
+    def test_load(self):
+        self.write(
+            [get_record(started, label="foo") for started in range(5)]
+            + [get_record(5.0, code=404, warmup=True)],
+            {"dropped": 1})
+        tracker = stats.Tracker(keep_records=False)
+
+        results.load([self.path, self.path], tracker)
+
+        self.assertEqual(tracker.summary.count, 10)
+        self.assertEqual(tracker.summary.codes, {200: 10})
+        self.assertEqual(tracker.summary.started, 0.0)
+        self.assertEqual(tracker.summary.finished, 4.5)
+        self.assertEqual(tracker.summary.phases["ttfb"].count, 10)
+        self.assertEqual(tracker.summary.received, 100)
+        self.assertEqual(tracker.warmup_summary.codes, {404: 2})
+        self.assertEqual(tracker.labels["foo"].count, 10)
+        self.assertEqual(tracker.counters, {"dropped": 2})
+
+    def test_load_without_numpy(self):
+        self.write([get_record(started) for started in range(3)])
+        tracker = stats.Tracker(keep_records=False)
+
+        with mock.patch.object(stats, "numpy", None):
+            with mock.patch.object(histogram, "numpy", None):
+                results.load([self.path], tracker)
+
+        self.assertEqual(tracker.summary.count, 3)
+        self.assertEqual(tracker.summary.histogram.mean, 0.5)
@@ -1,7 +1,12 @@
 import mock
 import unittest
 
-from thuum import runners
+from tornado import gen
+
+from thuum import (
+    runners,
+    sources,
+)
 from thuum.tests import utils
 
 class RunnerTests(unittest.TestCase):
@@ -34,12 +39,35 @@ class RunnerTests(unittest.TestCase):
 
     def test_finish_request(self):
         self.runner._start_request()
-        future = self.runner._pending[0]
+        future, = self.runner._pending
         future.set_result(None)
 
         self.assertEqual(self.events["ready"].call_count, 1)
         self.assertEqual(self.events["start"].call_count, 1)
         self.assertEqual(self.events["done"].call_count, 0)
+        self.assertEqual(len(self.runner._pending), 0)
+
+    def test_observer(self):
+        observer = mock.MagicMock()
+        self.runner.add_observer(observer)
+
+        self.runner._start_request()
+        future, = self.runner._pending
+        future.set_result(None)
+
+        self.assertEqual(observer.mock_calls, [
+            mock.call.request_ready(future, self.make_request.return_value),
+            mock.call.request_started(future),
+            mock.call.request_finished(future),
+        ])
+
+    def test_forward_connection_events(self):
+        opened = mock.MagicMock()
+        self.runner.events.on("connection_opened", opened)
+
+        self.runner.engine.events.emit("connection_opened")
+
+        opened.assert_called_once_with()
 
 
 class QuantityRunnerTests(utils.Base):
@@ -90,6 +118,32 @@ class QuantityRunnerTests(utils.Base):
         self.assertEqual(events["start"].call_count, 2)
         self.assertEqual(events["finish"].call_count, 2)
 
+    def test_request_pool(self):
+        self.http_client.max_clients = 2
+        make_request = mock.MagicMock(wraps=self.get_request)
+        pool = sources.RequestPool(make_request, 2)
+        events, runner = self.get_runner(
+            runners.QuantityRunner,
+            make_request=pool,
+            num_requests=5)
+
+        runner.run()
+
+        self.assertEqual(make_request.call_count, 2)
+        self.assertEqual(pool.size, 2)
+        self.assertEqual(events["finish"].call_count, 5)
+
+    def test_start(self):
+        events, runner = self.get_runner(runners.QuantityRunner, num_requests=3)
+        finished = mock.MagicMock()
+        runner.events.on("tests_finished", finished)
+
+        runner.start().add_done_callback(self.stop)
+        self.wait()
+
+        finished.assert_called_once_with()
+        self.assertEqual(events["finish"].call_count, 3)
+
 
 class DurationRunnerTests(utils.Base):
     def test_zero_duration(self):
@@ -104,3 +158,135 @@ class DurationRunnerTests(utils.Base):
 
         self.assertGreater(events["start"].call_count, 0)
         self.assertGreater(progress["current"], 0)
+
+    def test_stopped(self):
+        events, runner = self.get_runner(runners.DurationRunner, duration=0.01)
+
+        runner.start().add_done_callback(self.stop)
+        self.wait()
+        started = events["start"].call_count
+        finished = events["finish"].call_count
+        # Let the requests in flight at the end of the test finish.
+        self.io_loop.call_later(0.05, self.stop)
+        self.wait()
+
+        self.assertEqual(events["start"].call_count, started)
+        self.assertEqual(events["finish"].call_count, finished)
+
+
+class RateRunnerTests(utils.Base):
+    def get_rate_runner(self, **kwargs):
+        events, runner = self.get_runner(runners.RateRunner, **kwargs)
+        events["late"] = mock.MagicMock()
+        events["dropped"] = mock.MagicMock()
+        runner.events.on("request_late", events["late"])
+        runner.events.on("request_dropped", events["dropped"])
+        return events, runner
+
+    def test_num_requests(self):
+        events, runner = self.get_rate_runner(
+            rate=1000,
+            num_requests=5,
+            max_pending=5)
+
+        runner.run()
+
+        self.assertEqual(events["start"].call_count, 5)
+        self.assertEqual(events["finish"].call_count, 5)
+        self.assertEqual(runner.progress()["percentage"], 100.0)
+
+    def test_poisson_arrivals(self):
+        events, runner = self.get_rate_runner(
+            rate=1000,
+            num_requests=5,
+            max_pending=5,
+            poisson=True)
+
+        runner.run()
+
+        self.assertEqual(events["finish"].call_count, 5)
+
+    def test_duration(self):
+        events, runner = self.get_rate_runner(rate=1000, duration=0.05)
+
+        runner.run()
+        progress = runner.progress()
+
+        self.assertGreater(events["start"].call_count, 0)
+        self.assertGreaterEqual(progress["current"], 0.05)
+
+    def test_stops_loop_once(self):
+        _, runner = self.get_rate_runner(rate=1000, duration=0.01)
+
+        runner.run()
+        # A request in flight at the end of the test finishing later.
+        runner._on_request_finished(None)
+
+        # Raises a TimeoutError if the loop is stopped as soon as it starts.
+        self.io_loop.run_sync(lambda: gen.sleep(0.01))
+
+    def test_dropped_requests(self):
+        events, runner = self.get_rate_runner(
+            rate=1e6,
+            num_requests=10,
+            max_pending=1)
+
+        runner.run()
+
+        self.assertEqual(
+            events["start"].call_count + events["dropped"].call_count, 10)
+        self.assertGreater(events["dropped"].call_count, 0)
+
+    def test_late_requests(self):
+        events, runner = self.get_rate_runner(
+            rate=1000,
+            num_requests=3,
+            max_pending=3)
+        runner.late_threshold = -1
+
+        runner.run()
+
+        self.assertEqual(events["late"].call_count, 3)
+
+
+class StagedRunnerTests(utils.Base):
+    def get_staged_runner(self, stages, **kwargs):
+        events, runner = self.get_runner(
+            runners.StagedRunner,
+            stages=[runners.Stage(*stage) for stage in stages],
+            **kwargs)
+        runner.tick = 0.005
+        events["stage"] = mock.MagicMock()
+        runner.events.on("stage_started", events["stage"])
+        return events, runner
+
+    def test_target(self):
+        _, runner = self.get_staged_runner([(10, 10), (10, 10), (10, 0)])
+
+        self.assertEqual(runner.target(0), 0)
+        self.assertEqual(runner.target(5), 5)
+        self.assertEqual(runner.target(15), 10)
+        self.assertEqual(runner.target(25), 5)
+        self.assertEqual(runner.target(40), 0)
+
+    def test_concurrency_stages(self):
+        self.http_client.max_clients = 4
+        events, runner = self.get_staged_runner([(0.05, 4), (0.05, 4)])
+
+        runner.run()
+
+        self.assertEqual(events["stage"].call_count, 2)
+        self.assertEqual(events["stage"].call_args[0][0], 1)
+        self.assertGreater(events["start"].call_count, 0)
+
+    def test_rate_stages(self):
+        events, runner = self.get_staged_runner(
+            [(0.05, 1000), (0.05, 0)],
+            rate=True,
+            max_pending=10)
+
+        runner.run()
+
+        self.assertEqual(events["stage"].call_count, 2)
+        self.assertGreater(events["start"].call_count, 0)
+        self.assertGreaterEqual(runner.progress()["current"], 0.1)
@@ -0,0 +1,212 @@
+import os
+import tempfile
+import unittest
+
+import mock
+
+from thuum import sources
+
+
+def generate_body():
+    return "generated"
+
+
+def write_file(test, contents):
+    descriptor, path = tempfile.mkstemp()
+    test.addCleanup(os.remove, path)
+    os.write(descriptor, contents.encode("utf-8"))
+    os.close(descriptor)
+    return path
+
+
+class Function_read_body_Tests(unittest.TestCase):
+    def test_read_body(self):
+        path = write_file(self, "foo\x00bar")
+
+        self.assertEqual(sources.read_body(path), b"foo\x00bar")
+
+
+class Function_load_callable_Tests(unittest.TestCase):
+    def test_load_callable(self):
+        function = sources.load_callable(
+            "thuum.tests.sources_tests.generate_body")
+
+        self.assertIs(function, generate_body)
+
+    def test_not_qualified(self):
+        with self.assertRaises(ImportError):
+            sources.load_callable("generate_body")
+
+    def test_missing_attribute(self):
+        with self.assertRaises(ImportError):
+            sources.load_callable("thuum.tests.sources_tests.missing")
+
+    def test_not_callable(self):
+        with self.assertRaises(ImportError):
+            sources.load_callable("thuum.sources.GENERATED_FIELDS")
+
+
+class Function_request_factory_Tests(unittest.TestCase):
+    def test_fixed_request(self):
+        make_request = sources.request_factory(
+            "http://localhost/", "POST", [("foo", "bar")], "body")
+
+        request = make_request(request_timeout=5)
+
+        self.assertEqual(request.url, "http://localhost/")
+        self.assertEqual(request.method, "POST")
+        self.assertEqual(request.body, b"body")
+        self.assertEqual(request.request_timeout, 5)
+
+    def test_timeouts(self):
+        make_request = sources.request_factory(
+            "http://localhost/", connect_timeout=1, request_timeout=2)
+
+        request = make_request()
+
+        self.assertEqual(request.connect_timeout, 1)
+        self.assertEqual(request.request_timeout, 2)
+
+    def test_generated_body(self):
+        make_request = sources.request_factory(
+            "http://localhost/", "POST", generate=generate_body)
+
+        self.assertEqual(make_request().body, b"generated")
+
+    def test_generated_fields(self):
+        generate = mock.MagicMock(return_value={
+            "url": "http://localhost/foo",
+            "headers": {"foo": "bar"},
+        })
+        make_request = sources.request_factory(
+            "http://localhost/", generate=generate)
+
+        request = make_request()
+        make_request()
+
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(request.url, "http://localhost/foo")
+        self.assertEqual(request.method, "GET")
+        self.assertEqual(request.headers["foo"], "bar")
+
+    def test_generated_label(self):
+        generate = mock.MagicMock(return_value={
+            "method": "POST",
+            "label": "foo",
+        })
+        make_request = sources.request_factory(
+            "http://localhost/", generate=generate)
+
+        request = make_request()
+
+        self.assertEqual(request.label, "foo")
+        self.assertEqual(request.body, b"")
+
+
+class UrlListTests(unittest.TestCase):
+    def test_weighted_urls(self):
+        path = write_file(self, "\n".join([
+            "# comment",
+            "/foo 3",
+            "",
+            "http://example.com/bar?baz=1 1 bar",
+        ]))
+        urls = sources.UrlList(path, "http://localhost/")
+
+        with mock.patch.object(sources.random, "random", return_value=0.5):
+            first = urls()
+        with mock.patch.object(sources.random, "random", return_value=0.8):
+            second = urls()
+
+        self.assertEqual(first, {"url": "http://localhost/foo", "label": "/foo"})
+        self.assertEqual(
+            second,
+            {"url": "http://example.com/bar?baz=1", "label": "bar"})
+
+    def test_invalid_weight(self):
+        path = write_file(self, "/foo 0\n")
+
+        with self.assertRaises(ValueError):
+            sources.UrlList(path, "http://localhost/")
+
+    def test_no_urls(self):
+        path = write_file(self, "# nothing\n")
+
+        with self.assertRaises(ValueError):
+            sources.UrlList(path, "http://localhost/")
+
+
+class ReplayTests(unittest.TestCase):
+    def test_replay(self):
+        path = write_file(self, "\n".join([
+            '127.0.0.1 - - [10/Oct/2000:13:55:36 -0700] "GET /foo?bar=1 HTTP/1.0" 200 10',
+            'garbage',
+            '127.0.0.1 - - [10/Oct/2000:13:55:37 -0700] "POST /baz HTTP/1.1" 201 0 "-" "-"',
+        ]))
+        replay = sources.Replay(path, "http://localhost:8000/")
+
+        entries = [replay() for _ in range(3)]
+
+        self.assertEqual([entry["method"] for entry in entries], ["GET", "POST", "GET"])
+        self.assertEqual(entries[0]["url"], "http://localhost:8000/foo?bar=1")
+        self.assertEqual(entries[0]["label"], "/foo")
+
+    def test_route_label(self):
+        self.assertEqual(
+            sources.route_label("http://localhost/users/42/orders?page=2"),
+            "/users/{id}/orders")
+        self.assertEqual(
+            sources.route_label(
+                "http://localhost/files/123e4567-e89b-12d3-a456-426614174000/"
+                "sha/9f86d081884c7d659a2feaa0c55ad015"),
+            "/files/{id}/sha/{id}")
+        self.assertEqual(sources.route_label("http://localhost/v2/"), "/v2/")
+        self.assertEqual(sources.route_label("http://localhost"), "/")
+
+    def test_nothing_to_replay(self):
+        path = write_file(self, "garbage\n")
+
+        with self.assertRaises(ValueError):
+            sources.Replay(path, "http://localhost:8000/")
+
+
+class RequestPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.make_request = mock.MagicMock(side_effect=lambda: mock.Mock())
+        self.pool = sources.RequestPool(self.make_request, 2)
+
+    def test_requests_made_up_front(self):
+        self.assertEqual(self.make_request.call_count, 2)
+
+        request = self.pool(streaming_callback="foo")
+
+        self.assertEqual(self.make_request.call_count, 2)
+        self.assertEqual(request.streaming_callback, "foo")
+
+    def test_reuse_released(self):
+        first = self.pool()
+        self.pool.release(first)
+        second = self.pool()
+        self.pool.release(second)
+
+        self.assertIsNot(second, first)
+        self.assertIs(self.pool(), first)
+        self.assertEqual(self.pool.size, 2)
+
+    def test_every_request_used(self):
+        pool = sources.RequestPool(self.make_request, 100)
+        sent = set()
+
+        for _ in range(1000):
+            request = pool()
+            sent.add(id(request))
+            pool.release(request)
+
+        self.assertEqual(len(sent), 100)
+        self.assertEqual(pool.size, 100)
+
+    def test_grow_when_exhausted(self):
+        requests = [self.pool() for _ in range(3)]
+
+        self.assertEqual(len(set(map(id, requests))), 3)
+        self.assertEqual(self.pool.size, 3)
@@ -1,8 +1,14 @@
+import errno
+import json
 import mock
-import StringIO
+import socket
 import unittest
 
-from thuum import stats
+from thuum import (
+    histogram,
+    stats,
+    validation,
+)
 
 
 class RecordTests(unittest.TestCase):
@@ -11,13 +17,28 @@ class RecordTests(unittest.TestCase):
 
     def test_complete_record(self):
         future = mock.MagicMock()
-        future.result.return_value = mock.MagicMock(code=200)
+        future.result.return_value = mock.MagicMock(code=200, time_info={})
 
         self.record.start()
         self.record.complete(future)
 
         self.assertEqual(future.result.call_count, 1)
         self.assertEqual(self.record.code, 200)
+        self.assertIsNone(self.record.error)
+
+    def test_failed_record(self):
+        future = mock.MagicMock()
+        future.result.return_value = mock.MagicMock(
+            code=599,
+            error=socket.error(errno.ECONNREFUSED, "Connection refused"),
+            time_info={})
+
+        self.record.start()
+        self.record.complete(future)
+
+        self.assertEqual(self.record.code, 599)
+        self.assertEqual(self.record.error, "refused")
+        self.assertIsNotNone(self.record.finished)
 
     def test_receive_data(self):
         self.record.on_received("foo")
@@ -25,6 +46,273 @@ class RecordTests(unittest.TestCase):
 
         self.assertEqual(self.record.received, 9)
 
+    def test_row_round_trip(self):
+        self.record.started = 1.0
+        self.record.finished = 2.0
+        self.record.code = 200
+        self.record.received = 10
+
+        record = stats.Record.from_row(self.record.to_row())
+
+        self.assertEqual(
+            record.to_row(), (1.0, 2.0, 200, 0, 10, {}, None, None, None))
+
+    def test_first_byte_phases(self):
+        future = mock.MagicMock()
+        future.result.return_value = mock.MagicMock(code=200, time_info={})
+
+        self.record.start()
+        self.record.on_received("foo")
+        self.record.on_received("bar")
+        self.record.complete(future)
+
+        self.assertEqual(sorted(self.record.phases), ["transfer", "ttfb"])
+        self.assertAlmostEqual(
+            self.record.phases["ttfb"] + self.record.phases["transfer"],
+            self.record.finished - self.record.started)
+
+    def test_curl_phases(self):
+        future = mock.MagicMock()
+        future.result.return_value = mock.MagicMock(code=200, time_info={
+            "queue": 0.5,
+            "namelookup": 1.0,
+            "connect": 3.0,
+            "appconnect": 6.0,
+            "starttransfer": 7.0,
+        })
+
+        self.record.start()
+        self.record.complete(future)
+
+        self.assertEqual(
+            self.record.phases,
+            {"queue": 0.5, "dns": 1.0, "connect": 2.0, "tls": 3.0})
+
+    def test_curl_phases_without_tls(self):
+        future = mock.MagicMock()
+        future.result.return_value = mock.MagicMock(code=200, time_info={
+            "namelookup": 1.0,
+            "connect": 3.0,
+            "appconnect": 0.0,
+        })
+
+        self.record.start()
+        self.record.complete(future)
+
+        self.assertNotIn("tls", self.record.phases)
+
+
+class RecordStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.store = stats.RecordStore()
+
+    def get_record(self, started, finished, code=200, error=None, **phases):
+        record = stats.Record()
+        record.started = started
+        record.finished = finished
+        record.code = code
+        record.error = error
+        record.received = 10
+        record.phases = phases
+        return record
+
+    def test_too_many_labels(self):
+        self.store.MAX_LABEL_INDEX = 2
+        for label in ("foo", "bar"):
+            record = self.get_record(1.0, 2.0)
+            record.label = label
+            self.store.append(record)
+        record.label = "baz"
+
+        with self.assertRaises(ValueError):
+            self.store.append(record)
+
+    def test_append_and_read(self):
+        record = self.get_record(1.0, 2.5, ttfb=0.5)
+
+        index = self.store.append(record)
+
+        self.assertEqual(index, 0)
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual(self.store[0].to_row(), record.to_row())
+        self.assertEqual(list(self.store.column("finished")), [2.5])
+
+    def test_pending_record(self):
+        record = stats.Record()
+
+        index = self.store.append(record)
+        pending = self.store[index]
+
+        self.assertIsNone(pending.started)
+        self.assertIsNone(pending.finished)
+        self.assertIsNone(pending.code)
+        self.assertEqual(pending.phases, {})
+
+    def test_update(self):
+        record = stats.Record()
+        index = self.store.append(record)
+        record.started = 1.0
+        record.finished = 2.0
+        record.code = 404
+
+        self.store.update(index, record)
+
+        self.assertEqual([r.code for r in self.store], [404])
+
+    @unittest.skipUnless(stats.numpy, "requires NumPy")
+    def test_get_time_stats(self):
+        self.store.append(self.get_record(0, 100, ttfb=1))
+        self.store.append(self.get_record(1, 80, ttfb=2))
+        self.store.append(self.get_record(2, 120, code=404))
+        self.store.append(self.get_record(3, 200))
+        self.store.append(stats.Record())
+
+        results = stats.get_time_stats(self.store, percentiles=(50, 100))
+        with mock.patch.object(stats, "numpy", None):
+            expected = stats.get_time_stats(self.store, percentiles=(50, 100))
+
+        for key in ("count", "dur", "avg", "min", "max", "rps", "received"):
+            self.assertEqual(results[key], expected[key])
+        self.assertAlmostEqual(results["dev"], expected["dev"])
+        self.assertEqual(results["percentiles"]["p50"], 100)
+        self.assertEqual(results["percentiles"]["p100"], 197)
+        self.assertEqual(list(results["phases"]), ["ttfb"])
+        self.assertEqual(results["phases"]["ttfb"]["avg"], 1.5)
+
+    def test_get_time_stats_excludes_warmup(self):
+        warmup = self.get_record(0, 10, ttfb=5)
+        warmup.warmup = True
+        self.store.append(warmup)
+        self.store.append(self.get_record(1, 2, ttfb=1))
+
+        results = stats.get_time_stats(self.store)
+        with mock.patch.object(stats, "numpy", None):
+            expected = stats.get_time_stats(self.store)
+
+        self.assertTrue(self.store[0].warmup)
+        for time_stats in (results, expected):
+            self.assertEqual(time_stats["count"], 1)
+            self.assertEqual(time_stats["max"], 1)
+            self.assertEqual(time_stats["phases"]["ttfb"]["max"], 1)
+
+    def test_get_time_stats_none_completed(self):
+        self.store.append(stats.Record())
+
+        self.assertIsNone(stats.get_time_stats(self.store))
+
+    def test_get_time_stats_excludes_failures(self):
+        self.store.append(self.get_record(0, 30, code=599, error="timeout"))
+        self.store.append(self.get_record(1, 2))
+
+        results = stats.get_time_stats(self.store)
+        with mock.patch.object(stats, "numpy", None):
+            expected = stats.get_time_stats(self.store)
+
+        self.assertEqual(self.store[0].error, "timeout")
+        self.assertIsNone(self.store[1].error)
+        for time_stats in (results, expected):
+            self.assertEqual(time_stats["count"], 1)
+            self.assertEqual(time_stats["max"], 1)
+
+    @unittest.skipUnless(stats.numpy, "requires NumPy")
+    def test_get_time_stats_backends_agree(self):
+        self.store.append(self.get_record(0, 1))
+        self.store.append(self.get_record(2, 12, code=599, error="timeout"))
+        self.store.append(self.get_record(3, 5, code=404))
+        self.store.append(self.get_record(4, 6))
+        self.store.append(stats.Record())
+
+        results = stats.get_time_stats(self.store)
+        finished = stats._column(self.store, "finished")
+        summary = stats.Summary()
+        summary.add_columns(self.store, ~stats.numpy.isnan(finished))
+        with mock.patch.object(stats, "numpy", None):
+            expected = [
+                stats.get_time_stats(self.store),
+                stats.get_time_stats(summary),
+            ]
+
+        self.assertEqual(results["dur"], 6)
+        self.assertEqual(results["rps"], 0.5)
+        self.assertEqual(results["received"], 40)
+        for time_stats in expected:
+            for key in ("count", "dur", "avg", "min", "max", "rps", "received"):
+                self.assertEqual(time_stats[key], results[key])
+
+
+class WindowsTests(unittest.TestCase):
+    def setUp(self):
+        self.closed = []
+        self.windows = stats.Windows(self.closed.append, interval=1.0)
+        self.windows.origin = 100.0
+
+    def add(self, started, finished, code=200):
+        self.windows.add(mock.MagicMock(
+            started=started,
+            finished=finished,
+            code=code,
+            received=10))
+
+    def test_advance(self):
+        self.add(100.0, 100.5)
+        self.add(100.2, 100.7, code=500)
+        self.add(101.0, 101.5)
+
+        self.windows.advance(101.9)
+
+        self.assertEqual(len(self.closed), 1)
+        window = self.closed[0]
+        self.assertEqual(window["started"], 0)
+        self.assertEqual(window["count"], 2)
+        self.assertEqual(window["rps"], 2)
+        self.assertEqual(window["errors"], 1)
+        self.assertEqual(window["received"], 20)
+        self.assertAlmostEqual(window["p50"], 0.5, delta=0.01)
+
+    def test_empty_windows(self):
+        self.add(100.0, 100.5)
+
+        self.windows.advance(103.0)
+
+        self.assertEqual([w["count"] for w in self.closed], [1, 0, 0])
+        self.assertIsNone(self.closed[1]["p99"])
+
+    def test_late_record(self):
+        self.windows.advance(101.5)
+        self.add(100.1, 100.9)
+
+        self.windows.finish(101.5)
+
+        self.assertEqual([w["count"] for w in self.closed], [0, 1])
+        self.assertEqual(self.closed[1]["duration"], 0.5)
+
+    def test_lag(self):
+        self.windows.lag = 0.5
+        self.add(100.0, 100.5)
+
+        self.windows.advance(101.2)
+        self.assertEqual(self.closed, [])
+
+        self.windows.advance(101.5)
+        self.assertEqual(len(self.closed), 1)
+
+
+    def test_merge(self):
+        latencies = histogram.Histogram()
+        latencies.record(0.5)
+        self.windows.advance(101.5)
+
+        self.windows.merge(0, {
+            "count": 1,
+            "errors": 0,
+            "received": 10,
+            "latencies": latencies,
+        })
+        self.add(101.0, 101.5)
+        self.windows.finish(101.9)
+
+        self.assertEqual([w["count"] for w in self.closed], [0, 2])
+
 
 class TrackerTests(unittest.TestCase):
     def setUp(self):
@@ -45,6 +333,7 @@ class TrackerTests(unittest.TestCase):
 
     def test_finish_request(self):
         future = mock.MagicMock()
+        future.result.return_value = mock.MagicMock(code=200, time_info={})
         request = mock.MagicMock()
 
         self.tracker.request_ready(future, request)
@@ -53,19 +342,267 @@ class TrackerTests(unittest.TestCase):
 
         self.assertEqual(self.tracker._pending, {})
 
+    def test_records_not_kept(self):
+        tracker = stats.Tracker(keep_records=False)
+        future = mock.MagicMock()
+        future.result.return_value = mock.MagicMock(code=200, time_info={})
+
+        tracker.request_ready(future, mock.MagicMock())
+        tracker.request_started(future)
+        tracker.request_finished(future)
+
+        self.assertEqual(len(tracker.get_records()), 0)
+        self.assertEqual(tracker.get_summary().count, 1)
+        self.assertEqual(tracker.get_summary().codes, {200: 1})
+
+    def test_add_record(self):
+        listener = mock.MagicMock()
+        record = stats.Record()
+        self.tracker.events.on("request_finished", listener)
+
+        self.tracker.add_record(record)
+
+        listener.assert_called_once_with(record)
+        records = self.tracker.get_records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].to_row(), record.to_row())
+
+    def test_count_late_and_dropped(self):
+        self.tracker.request_late()
+        self.tracker.request_dropped()
+        self.tracker.request_dropped()
+        self.tracker.add_counters({"late": 2})
+
+        self.assertEqual(self.tracker.counters, {"late": 3, "dropped": 2})
+
+    def test_count_connections(self):
+        self.tracker.connection_opened()
+        self.tracker.connection_reused()
+        self.tracker.connection_reused()
+        self.tracker.connection_failed()
+
+        self.assertEqual(self.tracker.counters, {
+            "connections_opened": 1,
+            "connections_reused": 2,
+            "connections_failed": 1,
+        })
+
+    def test_stages(self):
+        with mock.patch.object(stats.time, "time", return_value=100.0):
+            self.tracker.stage_started(0, "first")
+        with mock.patch.object(stats.time, "time", return_value=110.0):
+            self.tracker.stage_started(1, "second")
+
+        for started in (99.9, 105.0, 110.0, 115.0, 120.0):
+            self.tracker.add_record(stats.Record.from_row(
+                (started, started + 1, 200, 0, 0, {})))
+
+        self.assertEqual(
+            [(stage, summary.count) for stage, summary in self.tracker.stages],
+            [("first", 2), ("second", 3)])
+        self.assertEqual(self.tracker.summary.count, 5)
+
+    def test_labels(self):
+        for label in ("foo", "bar", "foo", None):
+            record = stats.Record.from_row((0, 1, 200, 0, 0, {}, label))
+            self.tracker.add_record(record)
+
+        self.assertEqual(
+            dict((label, s.count) for label, s in self.tracker.labels.items()),
+            {"foo": 2, "bar": 1})
+        self.assertEqual(
+            [record.label for record in self.tracker.get_records()],
+            ["foo", "bar", "foo", None])
+
+    def test_validation(self):
+        tracker = stats.Tracker(validator=validation.Validator(
+            statuses=frozenset([200]), contains="ok"))
+        records = []
+        tracker.events.on("request_finished", records.append)
+
+        for code, body in [(200, b"ok"), (200, b"error"), (500, b"ok"), (599, b"")]:
+            future = mock.MagicMock()
+            future.result.return_value = mock.MagicMock(
+                code=code, time_info={}, error=None)
+            request = mock.MagicMock()
+            tracker.request_ready(future, request)
+            tracker.request_started(future)
+            request.streaming_callback(body)
+            tracker.request_finished(future)
+
+        self.assertEqual(
+            [record.invalid for record in records],
+            [None, "body", "status", None])
+        self.assertEqual(records[0].received, 2)
+        self.assertEqual(tracker.counters, {
+            "bodies_checked": 3, "invalid_body": 1, "invalid_status": 1})
+        self.assertEqual(tracker._bodies, {})
+
+    def test_add_store_max_labels(self):
+        store = stats.RecordStore()
+        for label in ("foo", "bar", "baz", "foo"):
+            store.append(stats.Record.from_row((0, 1, 200, 0, 0, {}, label)))
+
+        for backend in set([stats.numpy, None]):
+            tracker = stats.Tracker()
+            tracker.max_labels = 1
+            with mock.patch.object(stats, "numpy", backend):
+                tracker.add_store(store)
+
+            self.assertEqual(
+                dict((label, s.count) for label, s in tracker.labels.items()),
+                {"foo": 2, stats.OTHER_LABEL: 2})
+
+    def test_request_label(self):
+        future = mock.MagicMock()
+        request = mock.MagicMock(label="foo")
+
+        self.tracker.request_ready(future, request)
+
+        record, _ = self.tracker._pending[future]
+        self.assertEqual(record.label, "foo")
+
+    def test_max_labels(self):
+        self.tracker.max_labels = 2
+        for label in ("foo", "bar", "baz", "foo", "qux"):
+            self.tracker.add_record(
+                stats.Record.from_row((0, 1, 200, 0, 0, {}, label)))
+
+        self.assertEqual(
+            dict((label, s.count) for label, s in self.tracker.labels.items()),
+            {"foo": 2, "bar": 1, stats.OTHER_LABEL: 2})
+        self.assertEqual(
+            [record.label for record in self.tracker.get_records()],
+            ["foo", "bar", stats.OTHER_LABEL, "foo", stats.OTHER_LABEL])
+
+    def test_warmup_requests(self):
+        tracker = stats.Tracker(warmup_requests=2)
+
+        for started in range(3):
+            tracker.add_record(stats.Record.from_row(
+                (started, started + 1, 200, 0, 0, {})))
+
+        self.assertEqual(
+            [record.warmup for record in tracker.get_records()],
+            [True, True, False])
+        self.assertEqual(tracker.warmup_summary.count, 2)
+        self.assertEqual(tracker.summary.count, 1)
+
+    def test_warmup_duration(self):
+        tracker = stats.Tracker(warmup=5)
+        with mock.patch.object(stats.time, "time", return_value=100.0):
+            tracker.tests_started()
+
+        for started in (100.0, 104.9, 105.0):
+            tracker.add_record(stats.Record.from_row(
+                (started, started + 1, 200, 0, 0, {})))
+
+        self.assertEqual(tracker.warmup_summary.count, 2)
+        self.assertEqual(tracker.summary.count, 1)
+        self.assertEqual(tracker.summary.started, 105.0)
+
+    def test_window_finished(self):
+        listener = mock.MagicMock()
+        self.tracker.events.on("window_finished", listener)
+        record = stats.Record.from_row((100.0, 100.5, 200, 0, 0, {}))
+
+        with mock.patch.object(stats.time, "time", return_value=100.0):
+            self.tracker.tests_started()
+        self.tracker.add_record(record)
+        with mock.patch.object(stats.time, "time", return_value=101.5):
+            self.tracker.update_windows()
+
+        self.assertEqual(listener.call_count, 1)
+        self.assertEqual(listener.call_args[0][0]["count"], 1)
+
     def test_attach_tracker(self):
         runner = mock.MagicMock()
 
         tracker = stats.Tracker(runner)
 
+        runner.add_observer.assert_called_once_with(tracker)
         calls = [args for args, _ in runner.events.on.call_args_list]
         self.assertIn(("tests_started", tracker.tests_started), calls)
         self.assertIn(("tests_finished", tracker.tests_finished), calls)
+        self.assertNotIn(("request_ready", tracker.request_ready), calls)
+        self.assertIn(("record_received", tracker.add_record), calls)
+
+    def test_attach_tracker_without_observers(self):
+        runner = mock.MagicMock(spec=["events"])
+
+        tracker = stats.Tracker(runner)
+
+        calls = [args for args, _ in runner.events.on.call_args_list]
         self.assertIn(("request_ready", tracker.request_ready), calls)
         self.assertIn(("request_started", tracker.request_started), calls)
         self.assertIn(("request_finished", tracker.request_finished), calls)
 
 
+class DigestTests(unittest.TestCase):
+    def setUp(self):
+        self.tracker = stats.Tracker(warmup_requests=1)
+        with mock.patch.object(stats.time, "time", return_value=100.0):
+            self.tracker.tests_started()
+            self.tracker.stage_started(0, "first")
+        self.digest = stats.Digest(self.tracker)
+
+    def add(self, started, label=None):
+        self.tracker.add_record(stats.Record.from_row(
+            (started, started + 0.5, 200, 0, 10, {"ttfb": 0.1}, label)))
+
+    def test_take(self):
+        for started in (100.0, 100.2, 101.0):
+            self.add(started, label="foo")
+
+        state = json.loads(json.dumps(self.digest.take()))
+
+        self.assertEqual(state["count"], 3)
+        self.assertEqual(state["summary"]["histogram"]["count"], 2)
+        self.assertAlmostEqual(state["summary"]["started"], 0.2)
+        self.assertEqual(state["warmup"]["histogram"]["count"], 1)
+        self.assertEqual([label for label, _ in state["labels"]], ["foo"])
+        self.assertEqual([index for index, _ in state["stages"]], [0])
+        self.assertEqual(
+            [(index, window["count"]) for index, window in state["windows"]],
+            [(0, 2), (1, 1)])
+        self.assertEqual(self.digest.take()["count"], 0)
+
+    def test_add_digest_max_labels(self):
+        for started, label in [(100.0, "foo"), (100.2, "bar"), (101.0, "baz")]:
+            self.add(started, label=label)
+        tracker = stats.Tracker()
+        tracker.max_labels = 1
+
+        tracker.add_digest(json.loads(json.dumps(self.digest.take())))
+
+        self.assertEqual(len(tracker.labels), 2)
+        self.assertEqual(tracker.labels[stats.OTHER_LABEL].count, 1)
+
+    def test_add_digest(self):
+        for started in (100.0, 100.2, 101.0):
+            self.add(started, label="foo")
+        state = json.loads(json.dumps(self.digest.take()))
+        tracker = stats.Tracker()
+        with mock.patch.object(stats.time, "time", return_value=500.0):
+            tracker.tests_started()
+            tracker.stage_started(0, "first")
+        closed = []
+        tracker.events.on("window_finished", closed.append)
+
+        tracker.add_digest(state)
+        tracker.add_digest(state)
+        tracker.windows.finish(501.9)
+
+        self.assertEqual(tracker.summary.count, 4)
+        self.assertAlmostEqual(tracker.summary.started, 500.2)
+        self.assertAlmostEqual(tracker.summary.finished, 501.5)
+        self.assertEqual(tracker.warmup_summary.count, 2)
+        self.assertEqual(tracker.labels["foo"].count, 4)
+        self.assertEqual(tracker.stages[0][1].count, 4)
+        self.assertIn("ttfb", tracker.summary.phases)
+        self.assertEqual([w["count"] for w in closed], [4, 2])
+
+
 class Function_get_time_stats_Tests(unittest.TestCase):
     def setUp(self):
         self.records = [
@@ -88,6 +625,36 @@ class Function_get_time_stats_Tests(unittest.TestCase):
         self.assertEqual(results["rps"], 0.02)
         self.assertEqual(results["received"], 640)
 
+    def test_get_time_stats_percentiles(self):
+        records = self.records
+
+        results = stats.get_time_stats(records, percentiles=(50, 99.9))
+
+        self.assertEqual(list(results["percentiles"]), ["p50", "p99.9"])
+        self.assertAlmostEqual(results["percentiles"]["p50"], 100, delta=1)
+        self.assertEqual(results["percentiles"]["p99.9"], 197)
+
+    def test_get_time_stats_phases(self):
+        for record in self.records:
+            record.phases = {"ttfb": 10, "transfer": 20}
+        self.records[0].phases["dns"] = 1
+
+        results = stats.get_time_stats(self.records)
+
+        self.assertEqual(list(results["phases"]), ["dns", "ttfb", "transfer"])
+        self.assertEqual(results["phases"]["dns"]["avg"], 1)
+        self.assertEqual(results["phases"]["ttfb"]["max"], 10)
+        self.assertEqual(results["phases"]["transfer"]["percentiles"]["p50"], 20)
+
+    def test_get_time_stats_from_summary(self):
+        summary = stats.Summary.from_records(self.records[:2])
+        summary.merge(stats.Summary.from_records(self.records[2:]))
+
+        results = stats.get_time_stats(summary)
+
+        self.assertEqual(results, stats.get_time_stats(self.records))
+        self.assertEqual(summary.codes, {200: 3, 404: 1})
+
     def test_get_time_stats_for_no_results(self):
         records = []
 
@@ -108,3 +675,48 @@ class Function_get_time_stats_Tests(unittest.TestCase):
         results = stats.get_time_stats(records)
 
         self.assertIsNone(results)
+
+
+class Function_get_failure_stats_Tests(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            stats.Record.from_row((0, 1, 200, 0, 0, {})),
+            stats.Record.from_row((0, 5, 599, 0, 0, {}, None, "timeout")),
+            stats.Record.from_row((0, 7, 599, 0, 0, {}, None, "timeout")),
+            stats.Record.from_row((0, 0.5, 599, 0, 0, {}, None, "refused")),
+            # Records from before errors were classified.
+            stats.Record.from_row((0, 2, 599, 0, 0, {})),
+        ]
+
+    def check(self, summary):
+        failures = stats.get_failure_stats(summary, percentiles=(50, 100))
+
+        self.assertEqual(list(failures), ["timeout", "refused", "other"])
+        self.assertEqual(failures["timeout"]["count"], 2)
+        self.assertEqual(failures["timeout"]["avg"], 6)
+        self.assertEqual(failures["timeout"]["percentiles"]["p100"], 7)
+        self.assertEqual(failures["refused"]["max"], 0.5)
+        self.assertEqual(summary.count, 1)
+        self.assertEqual(summary.failed, 4)
+        self.assertEqual(summary.codes, {200: 1, 599: 4})
+
+    def test_summary(self):
+        self.check(stats.Summary.from_records(self.records))
+
+    def test_merge_and_round_trip(self):
+        summary = stats.Summary.from_records(self.records[:2])
+        summary.merge(stats.Summary.from_records(self.records[2:]))
+
+        self.check(stats.Summary.from_dict(
+            json.loads(json.dumps(summary.to_dict()))))
+
+    @unittest.skipUnless(stats.numpy, "requires NumPy")
+    def test_columns(self):
+        store = stats.RecordStore()
+        for record in self.records:
+            store.append(record)
+        summary = stats.Summary()
+
+        summary.add_columns(store, stats.numpy.ones(len(store), dtype=bool))
+
+        self.check(summary)
@@ -0,0 +1,116 @@
+import hashlib
+import unittest
+
+import mock
+from tornado import httputil
+
+from thuum import validation
+
+
+def get_response(code=200, **headers):
+    return mock.MagicMock(code=code, headers=httputil.HTTPHeaders(headers))
+
+
+def feed(validator, *chunks):
+    body = validator.start()
+    for chunk in chunks:
+        body.feed(chunk)
+    return body
+
+
+class Function_parse_statuses_Tests(unittest.TestCase):
+    def test_parse_statuses(self):
+        statuses = validation.parse_statuses("200, 3xx")
+
+        self.assertIn(200, statuses)
+        self.assertIn(304, statuses)
+        self.assertNotIn(201, statuses)
+        self.assertEqual(len(statuses), 101)
+
+    def test_invalid(self):
+        for value in ("20", "6xx", "ok", ""):
+            with self.assertRaises(ValueError):
+                validation.parse_statuses(value)
+
+
+class ValidatorTests(unittest.TestCase):
+    def test_status(self):
+        validator = validation.Validator(statuses=frozenset([200]))
+
+        self.assertIsNone(validator.check(get_response(200)))
+        self.assertEqual(validator.check(get_response(500)), "status")
+
+    def test_header(self):
+        validator = validation.Validator(headers=[
+            ("Content-Type", "json"), ("X-Request-Id", "")])
+
+        self.assertIsNone(validator.check(get_response(**{
+            "Content-Type": "application/json", "X-Request-Id": "1"})))
+        self.assertEqual(
+            validator.check(get_response(**{"content-type": "text/html"})),
+            "header")
+        self.assertEqual(
+            validator.check(get_response(**{"Content-Type": "application/json"})),
+            "header")
+
+    def test_first_failed_check(self):
+        validator = validation.Validator(
+            statuses=frozenset([200]), contains="ok")
+
+        self.assertEqual(
+            validator.check(get_response(500), feed(validator, b"error")),
+            "status")
+
+    def test_no_body_check(self):
+        validator = validation.Validator(statuses=frozenset([200]))
+
+        self.assertIsNone(validator.start())
+
+    def test_contains(self):
+        validator = validation.Validator(contains="needle")
+        response = get_response()
+
+        self.assertIsNone(
+            validator.check(response, feed(validator, b"hay", b"ne", b"edle")))
+        self.assertEqual(
+            validator.check(response, feed(validator, b"need", b"hay", b"le")),
+            "body")
+
+    def test_pattern(self):
+        validator = validation.Validator(pattern=r'"status": "(ok|up)"')
+        response = get_response()
+
+        self.assertIsNone(validator.check(
+            response, feed(validator, b'{"status', b'": "up"}')))
+        self.assertEqual(
+            validator.check(response, feed(validator, b'{"status": "down"}')),
+            "body")
+
+    def test_pattern_window(self):
+        validator = validation.Validator(pattern=r"<html>.*</html>")
+        filler = b" " * (validation.REGEX_WINDOW // 2)
+
+        self.assertIsNone(validator.check(
+            get_response(), feed(validator, b"<html>", filler, b"</html>")))
+        # Matches longer than the window are missed.
+        self.assertEqual(
+            validator.check(get_response(), feed(
+                validator, b"<html>", filler, filler, b"</html>")),
+            "body")
+
+    def test_sha256(self):
+        digest = hashlib.sha256(b"hello world").hexdigest()
+        validator = validation.Validator(sha256=digest.upper())
+        response = get_response()
+
+        self.assertIsNone(
+            validator.check(response, feed(validator, b"hello ", b"world")))
+        self.assertEqual(
+            validator.check(response, feed(validator, b"hello")), "body")
+
+    def test_sample(self):
+        validator = validation.Validator(contains="ok", sample=0.25)
+
+        with mock.patch("random.random", side_effect=[0.1, 0.5]):
+            self.assertIsNotNone(validator.start())
+            self.assertIsNone(validator.start())
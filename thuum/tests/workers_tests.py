@@ -0,0 +1,73 @@
+import mock
+import unittest
+
+from tornado import httpclient
+
+from thuum import (
+    runners,
+    stats,
+    workers,
+)
+from thuum.tests import utils
+
+
+class Function_split_Tests(unittest.TestCase):
+    def test_even_split(self):
+        self.assertEqual(workers.split(10, 2), [5, 5])
+
+    def test_uneven_split(self):
+        self.assertEqual(workers.split(10, 3), [4, 3, 3])
+
+
+class WorkerPoolTests(utils.Base):
+    def make_runner(self, concurrency, num_requests):
+        client = httpclient.AsyncHTTPClient(force_instance=True)
+        client.max_clients = concurrency
+        return runners.QuantityRunner(client, self.get_request, num_requests)
+
+    @unittest.skipUnless(
+        hasattr(workers.multiprocessing, "get_context"), "requires Python 3")
+    def test_forked(self):
+        pool = workers.WorkerPool(self.make_runner, 2, 2, num_requests=2)
+
+        self.assertEqual(pool._context.get_start_method(), "fork")
+
+    def test_cannot_fork(self):
+        with mock.patch.object(workers, "can_fork", return_value=False):
+            with self.assertRaises(ValueError):
+                workers.WorkerPool(self.make_runner, 2, 2, num_requests=2)
+
+    def test_workers_limited_by_requests(self):
+        pool = workers.WorkerPool(self.make_runner, 4, 10, num_requests=2)
+
+        self.assertEqual(pool.workers, 2)
+
+    def test_run(self):
+        pool = workers.WorkerPool(self.make_runner, 2, 2, num_requests=5)
+        tracker = stats.Tracker(pool)
+        finished = mock.MagicMock()
+        tracker.events.on("request_finished", finished)
+
+        pool.run()
+
+        self.assertEqual(finished.call_count, 5)
+        self.assertEqual(len(tracker.get_records()), 5)
+        self.assertEqual(pool.progress()["percentage"], 100.0)
+        for record in tracker.get_records():
+            self.assertEqual(record.code, 200)
+
+    def test_stages(self):
+        stages = [runners.Stage(0.05, 2), runners.Stage(0.05, 2)]
+
+        def make_runner(concurrency, num_requests):
+            client = httpclient.AsyncHTTPClient(force_instance=True)
+            runner = runners.StagedRunner(client, self.get_request, stages)
+            runner.tick = 0.005
+            return runner
+
+        pool = workers.WorkerPool(make_runner, 2, 2, duration=0.1, stages=stages)
+        tracker = stats.Tracker(pool)
+
+        pool.run()
+
+        self.assertEqual([stage for stage, _ in tracker.stages], stages)
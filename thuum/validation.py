@@ -0,0 +1,144 @@
+"""
+Validation of the responses of a load test.
+
+A response with an unexpected status, a missing or mismatching header, or a
+body lacking expected content usually means the target is failing (e.g. a 200
+error page), however quickly it answered. `Validator` checks each response
+against the expectations of a test as its body streams in, keeping only a
+bounded amount of state per request rather than the body itself:
+
+* a substring is looked for in each chunk together with the end of the last;
+* a regular expression is searched for within a sliding window of the last
+  `REGEX_WINDOW` bytes, so a match longer than that may be missed;
+* a SHA-256 digest of the body is updated with each chunk.
+
+Status and headers are checked on every response, and bodies (which costs more)
+on a random `sample` of them. A response failing a check is classed by the
+first of `CHECKS` it failed.
+
+"""
+
+import hashlib
+import random
+import re
+
+CHECKS = (
+    "status",
+    "header",
+    "body",
+)
+
+REGEX_WINDOW = 4096
+
+
+def parse_statuses(value):
+    """
+    Parse a comma-separated list of status codes or classes of them (e.g.
+    "200,3xx") into a set of codes, raising `ValueError` if it is invalid.
+
+    """
+    statuses = set()
+    for status in value.split(","):
+        status = status.strip().lower()
+        if re.match(r"^[1-5]xx$", status):
+            first = int(status[0]) * 100
+            statuses.update(range(first, first + 100))
+        elif re.match(r"^[1-5]\d\d$", status):
+            statuses.add(int(status))
+        else:
+            raise ValueError(
+                "Invalid status %r; expected e.g. 200 or 2xx." % status)
+    return frozenset(statuses)
+
+
+class BodyCheck(object):
+    """
+    The state of the checks of one response's body, which is given a chunk at
+    a time to `feed()`.
+
+    """
+    def __init__(self, validator):
+        self.validator = validator
+        self.found = validator.contains is None
+        self.matched = validator.pattern is None
+        self._tail = b""
+        self._window = b""
+        self._hash = hashlib.sha256() if validator.sha256 else None
+
+    def feed(self, chunk):
+        validator = self.validator
+        if not self.found:
+            data = self._tail + chunk
+            self.found = validator.contains in data
+            # Enough to find the substring across this chunk and the next.
+            keep = len(validator.contains) - 1
+            self._tail = data[-keep:] if keep else b""
+        if not self.matched:
+            data = self._window + chunk
+            self.matched = validator.pattern.search(data) is not None
+            self._window = data[-REGEX_WINDOW:]
+        if self._hash is not None:
+            self._hash.update(chunk)
+
+    def passed(self):
+        return (
+            self.found
+            and self.matched
+            and (self._hash is None
+                 or self._hash.hexdigest() == self.validator.sha256))
+
+
+class Validator(object):
+    """
+    Checks responses against expected `statuses` (a set of codes), `headers`
+    (`(name, value)` pairs, each requiring the header to contain the value)
+    and a body containing `contains`, matching the regular expression
+    `pattern` or having the SHA-256 hex digest `sha256`. Body checks are made
+    on the fraction `sample` of responses.
+
+    For each request, `start()` gives the `BodyCheck` to feed its body to (or
+    `None` if its body is not to be checked), and `check()` the outcome.
+
+    """
+    def __init__(self, statuses=None, headers=(), contains=None, pattern=None,
+                 sha256=None, sample=1.0):
+        assert 0 < sample <= 1
+        self.statuses = statuses
+        self.headers = list(headers)
+        self.contains = _to_bytes(contains)
+        self.pattern = None
+        if pattern is not None:
+            self.pattern = re.compile(_to_bytes(pattern))
+        self.sha256 = sha256.lower() if sha256 else None
+        self.sample = sample
+        self._checks_body = (
+            contains is not None or pattern is not None or sha256 is not None)
+
+    def start(self):
+        if not self._checks_body:
+            return None
+        if self.sample < 1 and random.random() >= self.sample:
+            return None
+        return BodyCheck(self)
+
+    def check(self, response, body=None):
+        """
+        The first of `CHECKS` a response failed, or `None` if it passed them
+        all; `body` is the `BodyCheck` its body was fed to, if any.
+
+        """
+        if self.statuses is not None and response.code not in self.statuses:
+            return "status"
+        for name, value in self.headers:
+            actual = response.headers.get(name)
+            if actual is None or value not in actual:
+                return "header"
+        if body is not None and not body.passed():
+            return "body"
+        return None
+
+
+def _to_bytes(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    return value.encode("utf-8")
@@ -0,0 +1,231 @@
+"""
+Distribution of a load test across several processes.
+
+Each worker process runs its own runner on its own `IOLoop` with a share of
+the requested concurrency (and number of requests) and streams the rows of its
+completed records back to the parent, which re-emits them as
+`thuum.stats.Record` objects so a single tracker can summarize the whole run.
+
+Worker processes are forked, so that they can be given the functions making
+their runner and requests (often closures) without pickling them; workers are
+not available where processes cannot be forked (e.g. on Windows).
+
+"""
+
+import multiprocessing
+import sys
+import time
+
+from pyee import EventEmitter
+from tornado import ioloop
+
+from thuum import (
+    loops,
+    stats,
+)
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 250
+
+
+def split(total, parts):
+    """
+    Divide `total` into `parts` integer shares differing by at most one.
+
+    """
+    share, remainder = divmod(total, parts)
+    return [share + (1 if i < remainder else 0) for i in range(parts)]
+
+
+def can_fork():
+    """
+    Whether worker processes can be forked on this platform.
+
+    """
+    if hasattr(multiprocessing, "get_all_start_methods"):
+        return "fork" in multiprocessing.get_all_start_methods()
+    # Python 2 forks its processes everywhere but on Windows.
+    return sys.platform != "win32"
+
+
+def _fork_context():
+    if not can_fork():
+        raise ValueError(
+            "Worker processes must be forked, which this platform does not "
+            "support.")
+    if hasattr(multiprocessing, "get_context"):
+        return multiprocessing.get_context("fork")
+    return multiprocessing
+
+
+def _run_worker(make_runner, concurrency, num_requests, connection,
+                loop="tornado", validator=None):
+    """
+    Run a load test in a worker process, sending `("records", rows)` batches
+    over `connection` and finally `("finished", counters)` when the test is
+    complete. The start of each stage of a staged test is sent immediately as
+    `("stage_started", (index, stage))`.
+
+    """
+    io_loop = loops.new_loop(loop)
+    io_loop.make_current()
+
+    batch = []
+    counters = {}
+
+    def on_request_finished(record):
+        batch.append(record.to_row())
+        if len(batch) >= BATCH_SIZE:
+            flush()
+
+    def flush():
+        if batch:
+            connection.send(("records", batch[:]))
+            del batch[:]
+
+    try:
+        runner = make_runner(concurrency, num_requests)
+        tracker = stats.Tracker(
+            runner, keep_records=False, validator=validator)
+        tracker.events.on("request_finished", on_request_finished)
+        runner.events.on(
+            "stage_started",
+            lambda index, stage: connection.send(
+                ("stage_started", (index, stage))))
+        ioloop.PeriodicCallback(flush, FLUSH_INTERVAL, io_loop).start()
+        runner.run()
+        flush()
+        counters = dict(tracker.counters)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.send(("finished", counters))
+        connection.close()
+
+
+class WorkerPool(object):
+    """
+    Runs a load test in several processes, presenting the same `events` and
+    `progress()` interface as a runner.
+
+    `make_runner` is called in each worker process with that worker's share of
+    the concurrency and number of requests (`None` for duration based tests)
+    and must return a runner bound to the current `IOLoop`, which is of the
+    kind named by `loop` (see `thuum.loops`). Workers are forked whatever the
+    default start method of `multiprocessing`, so `make_runner` need not be
+    picklable; `ValueError` is raised if they cannot be (see `can_fork()`).
+
+    "stage_started" is emitted when the first worker starts each stage of a
+    staged test, with the corresponding stage of `stages` (the whole test's,
+    rather than the worker's share) if given.
+
+    Workers validate their responses with `validator` (see
+    `thuum.validation`), if given, and send the counts of invalid responses
+    with their other counters.
+
+    """
+    def __init__(self, make_runner, workers, concurrency, num_requests=None,
+                 duration=None, stages=None, loop="tornado", validator=None):
+        assert workers > 0
+        assert (num_requests is None) != (duration is None)
+
+        workers = min(workers, concurrency)
+        if num_requests is not None:
+            workers = min(workers, num_requests)
+
+        self.make_runner = make_runner
+        self.loop = loop
+        self._context = _fork_context()
+        self.validator = validator
+        self.io_loop = ioloop.IOLoop.current()
+        self.events = EventEmitter()
+        self._concurrency = split(concurrency, workers)
+        self._requests = (
+            split(num_requests, workers)
+            if num_requests is not None
+            else [None] * workers)
+        self._total = num_requests
+        self._duration = duration
+        self._stages = stages
+        self._stage = -1
+        self._completed = 0
+        self._started = None
+        self._processes = []
+        self._running = set()
+
+    @property
+    def workers(self):
+        return len(self._concurrency)
+
+    def _on_readable(self, connection, fd, _):
+        try:
+            kind, payload = connection.recv()
+        except EOFError:
+            kind, payload = "finished", {}
+
+        if kind == "finished":
+            self.events.emit("counters_received", payload)
+            self.io_loop.remove_handler(fd)
+            connection.close()
+            self._running.discard(connection)
+            if not self._running:
+                self.io_loop.stop()
+            return
+
+        if kind == "stage_started":
+            index, stage = payload
+            if index > self._stage:
+                self._stage = index
+                if self._stages is not None:
+                    stage = self._stages[index]
+                self.events.emit("stage_started", index, stage)
+            return
+
+        self._completed += len(payload)
+        for row in payload:
+            self.events.emit("record_received", stats.Record.from_row(row))
+
+    def run(self):
+        self.events.emit("tests_started")
+        self._started = time.time()
+
+        for concurrency, num_requests in zip(self._concurrency, self._requests):
+            reader, writer = self._context.Pipe(duplex=False)
+            process = self._context.Process(
+                target=_run_worker,
+                args=(self.make_runner, concurrency, num_requests, writer,
+                      self.loop, self.validator))
+            process.daemon = True
+            process.start()
+            writer.close()
+
+            self._processes.append(process)
+            self._running.add(reader)
+            self.io_loop.add_handler(
+                reader.fileno(),
+                lambda fd, events, reader=reader: self._on_readable(reader, fd, events),
+                ioloop.IOLoop.READ)
+
+        self.io_loop.start()
+
+        for process in self._processes:
+            process.join()
+
+        self.events.emit("tests_finished")
+
+    def progress(self):
+        if self._duration is not None:
+            current = time.time() - self._started
+            return {
+                "unit": "seconds",
+                "total": self._duration,
+                "current": current,
+                "percentage": min(100.0, current / float(self._duration) * 100),
+            }
+
+        return {
+            "unit": "requests",
+            "total": self._total,
+            "current": self._completed,
+            "percentage": min(100.0, self._completed / float(self._total) * 100),
+        }